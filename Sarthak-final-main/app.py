@@ -1,78 +1,90 @@
-from flask import Flask, render_template, redirect, url_for, send_file, make_response, request, flash, session, jsonify
-from models import db, Employee, ShiftType, ShiftRota, Attendance, ExceptionReport
+from flask import Flask, Blueprint, Response, current_app, render_template, redirect, url_for, make_response, request, flash, session, jsonify, g, send_file, abort
+from models import (db, Employee, ShiftType, ShiftRota, Attendance, ExceptionReport, DiscrepancyRule, AttendanceRollup,
+                    PendingRollup, CoverageMinimum, Holiday, EmployeeLeave, ChangeLog, MonthClose, MonthArtifact)
+from month_matrix import MonthMatrix, month_bounds
+from exception_rules import (compiled_rules, ensure_default_rules, evaluate_cells, sweep_absences,
+                             RULE_KINDS, RULES_VERSION_KEY)
+from cache import FragmentCache, current_version, current_versions, bump_version
+from reference_cache import reference_cache, REFERENCE_VERSION_KEY
+from assets import init_assets
+from instrumentation import init_instrumentation, query_budget
+from profiling import profile_requested, save_profile, profile_call, list_profiles, profile_path
+from work_hours import fill_hours, backfill_hours, hours_by_employee, format_minutes
+from coverage import coverage, coverage_grid, months_spanned, COVERAGE_VERSION_KEY, MAX_MONTHS as COVERAGE_MAX_MONTHS
+from calendars import month_calendar, CALENDAR_VERSION_KEY
+from rota_feeds import rota_feed
+from month_bundle import build_bundle, zip_bytes, DEFAULT_WORKERS as DEFAULT_BUNDLE_WORKERS
+from month_close import (closed_months, check_open, exclude_closed, close_month, reopen_month, month_artifact,
+                         month_artifacts, list_closes, month_label, MonthClosed, CLOSED_MONTHS_VERSION_KEY)
+from employee_search import search_employees, DEFAULT_LIMIT as EMPLOYEE_SEARCH_LIMIT
+from employee_import import read_rows, import_employees
+from change_feed import (ensure_change_triggers, changes_since, head_cursor, prune_changes, CursorExpired,
+                         DEFAULT_LIMIT as CHANGES_LIMIT, MAX_LIMIT as CHANGES_MAX_LIMIT)
+from exception_search import (ensure_search_index, rebuild_search_index, refresh_search_index, apply_search,
+                              search_condition, search_available)
+from rollups import (mark_dates, mark_month, refresh_rollups, rebuild_rollups, query_rollup, data_range,
+                     pending_dates, GRAINS, DIMENSIONS)
+import cProfile
+from exports import send_excel, send_pdf, send_export, excel_bytes, pdf_bytes, XLSX_MIMETYPE, PDF_MIMETYPE
+from markupsafe import Markup
 from datetime import date, timedelta, time, datetime
-import pandas as pd
 import io
+from types import SimpleNamespace
 from jinja2 import Template
-from xhtml2pdf import pisa
 import csv
+import json
 import os
+import click
 
-def calculate_duration(time_in, time_out):
-    """
-    Calculate duration between two time objects.
-    Returns duration in HH:MM format.
-    """
-    if not time_in or not time_out:
-        return 'N/A'
-    
-    # Convert time objects to datetime objects for the same date
-    today = date.today()
-    datetime_in = datetime.combine(today, time_in)
-    datetime_out = datetime.combine(today, time_out)
-    
-    # If time_out is earlier than time_in, assume it's the next day
-    if datetime_out < datetime_in:
-        datetime_out = datetime.combine(today + timedelta(days=1), time_out)
-    
-    # Calculate duration
-    duration = datetime_out - datetime_in
-    
-    # Convert to hours and minutes
-    total_minutes = int(duration.total_seconds() / 60)
-    hours = total_minutes // 60
-    minutes = total_minutes % 60
-    
-    return f"{hours:02d}:{minutes:02d}"
-
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'replace-this-with-a-strong-random-secret-key')
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///attendance.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=8)  # Session expires after 8 hours
+bp = Blueprint('main', __name__, cli_group=None)
 
-db.init_app(app)
+def create_app(config=None):
+    """Application factory; ``config`` overrides the defaults below."""
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'replace-this-with-a-strong-random-secret-key')
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///attendance.db')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=8)  # Session expires after 8 hours
+    if config:
+        app.config.update(config)
+    
+    db.init_app(app)
+    init_assets(app)
+    init_instrumentation(app)
+    app.register_blueprint(bp)
+    
+    # Make these functions available in templates
+    app.jinja_env.globals.update(is_admin_logged_in=is_admin_logged_in)
+    app.jinja_env.globals.update(get_session_info=get_session_info)
+    app.jinja_env.globals.update(format_minutes=format_minutes)
+    return app
 
+# Default shift types: (code, description, start, end, grace minutes)
 SHIFT_CODES = [
-    ('M', 'Morning'),
-    ('E', 'Evening'),
-    ('N', 'Night'),
-    ('G', 'General'),
-    ('Off', 'Off'),
-    ('Leave', 'Leave')
+    ('M', 'Morning', time(7, 0), time(15, 0), 15),
+    ('E', 'Evening', time(15, 0), time(23, 0), 15),
+    ('N', 'Night', time(23, 0), time(7, 0), 15),
+    ('G', 'General', time(9, 0), time(18, 0), 15),
+    ('Off', 'Off', None, None, None),
+    ('Leave', 'Leave', None, None, None)
 ]
 
-SHIFT_START = {
-    'M': time(7, 0),
-    'E': time(15, 0),
-    'N': time(23, 0),
-    'G': time(9, 0)
-}
+ROTA_VERSION_KEY = 'rota'
 
-LATE_THRESHOLD = timedelta(minutes=15)
+JSON_MIMETYPE = 'application/json'
 
 ADMIN_PASSWORD = 'admin123'  # Change this in production!
 
-@app.route('/admin/login', methods=['GET', 'POST'])
+@bp.route('/admin/login', methods=['GET', 'POST'])
 def admin_login():
     # If already logged in, check for redirect parameter
     if session.get('admin'):
         redirect_to = request.args.get('redirect', 'admin_employees')
         if redirect_to == 'generate_rota':
-            return redirect(url_for('generate_rota'))
+            return redirect(url_for('.generate_rota'))
         else:
             flash('Already logged in as admin.', 'info')
-            return redirect(url_for('admin_employees'))
+            return redirect(url_for('.admin_employees'))
     
     if request.method == 'POST':
         password = request.form.get('password')
@@ -85,21 +97,31 @@ def admin_login():
             # Check if there's a redirect parameter for rota generation
             redirect_to = request.args.get('redirect', 'admin_employees')
             if redirect_to == 'generate_rota':
-                return redirect(url_for('generate_rota'))
+                return redirect(url_for('.generate_rota'))
             else:
-                return redirect(url_for('admin_employees'))
+                return redirect(url_for('.admin_employees'))
         else:
             flash('Incorrect password. Please try again.', 'danger')
     return render_template('admin_login.html')
 
-@app.route('/admin/logout')
+@bp.route('/admin/logout')
 def admin_logout():
     if session.get('admin'):
         session.clear()  # Clear all session data
         flash('Successfully logged out.', 'success')
     else:
         flash('You were not logged in.', 'info')
-    return redirect(url_for('admin_login'))
+    return redirect(url_for('.admin_login'))
+
+def admin_session_expired():
+    """True when the admin logged in more than 8 hours ago"""
+    login_time = session.get('login_time')
+    if login_time:
+        try:
+            return datetime.now() - datetime.fromisoformat(login_time) > timedelta(hours=8)
+        except ValueError:
+            pass  # If login_time is invalid, continue
+    return False
 
 def admin_required(f):
     from functools import wraps
@@ -107,19 +129,13 @@ def admin_required(f):
     def decorated_function(*args, **kwargs):
         if not session.get('admin'):
             flash('Admin login required.', 'danger')
-            return redirect(url_for('admin_login'))
+            return redirect(url_for('.admin_login'))
         
         # Check session timeout (optional additional security)
-        login_time = session.get('login_time')
-        if login_time:
-            try:
-                login_datetime = datetime.fromisoformat(login_time)
-                if datetime.now() - login_datetime > timedelta(hours=8):
-                    session.clear()
-                    flash('Session expired. Please login again.', 'warning')
-                    return redirect(url_for('admin_login'))
-            except ValueError:
-                pass  # If login_time is invalid, continue
+        if admin_session_expired():
+            session.clear()
+            flash('Session expired. Please login again.', 'warning')
+            return redirect(url_for('.admin_login'))
         
         return f(*args, **kwargs)
     return decorated_function
@@ -145,17 +161,15 @@ def get_session_info():
         return {'logged_in': True, 'login_time': 'Unknown', 'session_duration': 'Unknown'}
     return {'logged_in': False}
 
-# Make these functions available in templates
-app.jinja_env.globals.update(is_admin_logged_in=is_admin_logged_in)
-app.jinja_env.globals.update(get_session_info=get_session_info)
-
-@app.route('/admin/employees')
+@bp.route('/admin/employees')
+@query_budget(4)
 @admin_required
 def admin_employees():
-    employees = Employee.query.all()
+    employees = reference_cache.employees()
     return render_template('admin_employees.html', employees=employees)
 
-@app.route('/admin/employee/add', methods=['GET', 'POST'])
+@bp.route('/admin/employee/add', methods=['GET', 'POST'])
+@query_budget(4)
 @admin_required
 def admin_employee_add():
     if request.method == 'POST':
@@ -169,14 +183,43 @@ def admin_employee_add():
         if emp_id and name:
             emp = Employee(emp_id=emp_id, name=name, designation=designation, location=location, department=department, grade=grade, status=status)
             db.session.add(emp)
+            reference_cache.invalidate()
             db.session.commit()
             flash('Employee added.', 'success')
-            return redirect(url_for('admin_employees'))
+            return redirect(url_for('.admin_employees'))
         else:
             flash('EmpID and Name are required.', 'danger')
     return render_template('admin_employee_form.html', action='Add', employee=None)
 
-@app.route('/admin/employee/edit/<int:emp_id>', methods=['GET', 'POST'])
+@bp.route('/admin/employees/import', methods=['GET', 'POST'])
+@query_budget(6)
+@admin_required
+def admin_employee_import():
+    report = None
+    if request.method == 'POST':
+        file = request.files.get('file')
+        if not file or not file.filename.lower().endswith(('.csv', '.xlsx')):
+            flash('Please upload a CSV or XLSX file.', 'danger')
+        else:
+            try:
+                report = import_employees(read_rows(file.stream, file.filename),
+                                          deactivate_missing=bool(request.form.get('deactivate_missing')),
+                                          dry_run=bool(request.form.get('dry_run')))
+            except (ValueError, UnicodeDecodeError, csv.Error) as e:
+                flash(f'Could not read {file.filename}: {e}', 'danger')
+            else:
+                if report['applied']:
+                    db.session.commit()
+                    flash(f"Imported {file.filename}: {report['inserted']} added, {report['updated']} updated.", 'success')
+                elif report['error_count']:
+                    db.session.rollback()
+                    flash(f"Nothing was imported: {report['error_count']} rows have errors.", 'danger')
+                else:
+                    flash('Dry run: nothing was saved.' if request.form.get('dry_run') else 'No changes to import.', 'info')
+    return render_template('admin_employee_import.html', report=report)
+
+@bp.route('/admin/employee/edit/<int:emp_id>', methods=['GET', 'POST'])
+@query_budget(5)
 @admin_required
 def admin_employee_edit(emp_id):
     emp = Employee.query.get_or_404(emp_id)
@@ -188,154 +231,310 @@ def admin_employee_edit(emp_id):
         emp.department = request.form.get('department')
         emp.grade = request.form.get('grade')
         emp.status = request.form.get('status')
+        reference_cache.invalidate()
         db.session.commit()
         flash('Employee updated.', 'success')
-        return redirect(url_for('admin_employees'))
+        return redirect(url_for('.admin_employees'))
     return render_template('admin_employee_form.html', action='Edit', employee=emp)
 
-@app.route('/admin/employee/delete/<int:emp_id>', methods=['POST'])
+@bp.route('/admin/employee/delete/<int:emp_id>', methods=['POST'])
+@query_budget(8)
 @admin_required
 def admin_employee_delete(emp_id):
     emp = Employee.query.get_or_404(emp_id)
+    if EmployeeLeave.query.filter_by(employee_id=emp.id).delete():
+        bump_version(CALENDAR_VERSION_KEY)
     db.session.delete(emp)
+    reference_cache.invalidate()
     db.session.commit()
     flash('Employee deleted.', 'success')
-    return redirect(url_for('admin_employees'))
+    return redirect(url_for('.admin_employees'))
+
+@bp.before_app_request
+def start_request_profile():
+    # Admins can profile any single request with ?profile=1 or an X-Profile: 1 header;
+    # the same login and expiry checks as admin_required apply
+    if session.get('admin') and not admin_session_expired() and profile_requested():
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+@bp.after_app_request
+def finish_request_profile(response):
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        name = save_profile(profiler, f'{request.method} {request.full_path.rstrip("?")}')
+        response.headers['X-Profile-Id'] = name
+        response.headers['X-Profile-Url'] = url_for('.admin_profile', name=name)
+    return response
+
+@bp.route('/api/employees/search')
+@query_budget(3)
+def employee_search_api():
+    """Typeahead matches on name and emp_id (?q=, ?limit=, ?active=1 for active employees only)."""
+    employees = search_employees(request.args.get('q', ''), request.args.get('limit', EMPLOYEE_SEARCH_LIMIT, type=int),
+                                 active_only=request.args.get('active') == '1')
+    return jsonify({'employees': [{
+        'id': emp.id,
+        'emp_id': emp.emp_id,
+        'name': emp.name,
+        'department': emp.department,
+        'status': emp.status
+    } for emp in employees]})
+
+@bp.route('/admin/profiles')
+@query_budget(0)
+@admin_required
+def admin_profiles():
+    return render_template('admin_profiles.html', profiles=list_profiles(), selected=None, report=None)
+
+@bp.route('/admin/profiles/<name>')
+@query_budget(0)
+@admin_required
+def admin_profile(name):
+    path = profile_path(name, '.txt')
+    if path is None:
+        abort(404)
+    with open(path) as fh:
+        report = fh.read()
+    return render_template('admin_profiles.html', profiles=list_profiles(), selected=name, report=report)
+
+@bp.route('/admin/profiles/<name>/download')
+@query_budget(0)
+@admin_required
+def admin_profile_download(name):
+    path = profile_path(name, '.prof')
+    if path is None:
+        abort(404)
+    return send_file(path, download_name=f'{name}.prof', as_attachment=True)
+
+def upgrade_schema():
+    """Add columns and indexes that create_all() skips on tables that already exist."""
+    inspector = db.inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(db.engine.dialect)
+                db.session.execute(db.text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+        db.session.commit()
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
 
 def init_db():
-    with app.app_context():
-        db.create_all()
-        
-        # Add shift types if not present
-        if ShiftType.query.count() == 0:
-            for code, desc in SHIFT_CODES:
-                db.session.add(ShiftType(code=code, description=desc))
-            db.session.commit()
+    db.create_all()
+    upgrade_schema()
+    ensure_search_index()
+    ensure_change_triggers()
+    
+    # Add shift types if not present, and fill in missing shift definitions
+    shift_types = {shift.code: shift for shift in ShiftType.query.all()}
+    for code, desc, start, end, grace in SHIFT_CODES:
+        shift = shift_types.get(code)
+        if shift is None:
+            db.session.add(ShiftType(code=code, description=desc, start_time=start, end_time=end, grace_minutes=grace))
+        elif shift.start_time is None and start is not None:
+            shift.start_time, shift.end_time, shift.grace_minutes = start, end, grace
+    if db.session.new or db.session.dirty:
+        reference_cache.invalidate()
+    ensure_default_rules()
+    db.session.commit()
 
+@query_budget(15)
 def generate_monthly_rota(year, month):
-    with app.app_context():
-        employees = Employee.query.filter_by(status='active').all()
-        shift_types = ShiftType.query.filter(ShiftType.code.in_(['M','E','N','G','Off'])).all()
-        
-        # Get date range for the month
-        first_day = date(year, month, 1)
-        if month == 12:
-            next_month = date(year+1, 1, 1)
-        else:
-            next_month = date(year, month+1, 1)
-        last_day = next_month - timedelta(days=1)
-        
-        # Remove existing rota for the month
-        ShiftRota.query.filter(
-            ShiftRota.date >= first_day,
-            ShiftRota.date <= last_day
-        ).delete()
-        db.session.commit()
-        
-        # Generate rota for each day - create a basic pattern that admin can modify
-        days = (next_month - first_day).days
-        for emp in employees:
-            for d in range(days):
-                day = first_day + timedelta(days=d)
-                # Create a simple pattern: General shift for weekdays, Off for weekends
-                if day.weekday() < 5:  # Monday to Friday
-                    shift = ShiftType.query.filter_by(code='G').first()
-                else:  # Saturday and Sunday
-                    shift = ShiftType.query.filter_by(code='Off').first()
-                
-                if shift:
-                    db.session.add(ShiftRota(employee_id=emp.id, date=day, shift_type_id=shift.id))
-        db.session.commit()
+    check_open([date(year, month, 1)])
+    employees = reference_cache.employees(active_only=True)
+    general_shift = reference_cache.shift_type_by_code('G')
+    off_shift = reference_cache.shift_type_by_code('Off')
+    leave_shift = reference_cache.shift_type_by_code('Leave')
+    calendar = month_calendar(year, month)
+    
+    # Get date range for the month
+    first_day = date(year, month, 1)
+    if month == 12:
+        next_month = date(year+1, 1, 1)
+    else:
+        next_month = date(year, month+1, 1)
+    last_day = next_month - timedelta(days=1)
+    
+    # Remove existing rota for the month
+    ShiftRota.query.filter(
+        ShiftRota.date >= first_day,
+        ShiftRota.date <= last_day
+    ).delete()
+    bump_version(ROTA_VERSION_KEY)
+    db.session.commit()
+    
+    # Generate rota for each day - create a basic pattern that admin can modify
+    days = (next_month - first_day).days
+    rows = []
+    for emp in employees:
+        holidays = calendar.holiday_bits(emp.location)
+        leave = calendar.leave.get(emp.id, 0)
+        for d in range(days):
+            day = first_day + timedelta(days=d)
+            # Create a simple pattern: General shift for weekdays, Off for weekends and holidays,
+            # Leave on approved leave
+            if leave >> d & 1:
+                shift = leave_shift
+            elif day.weekday() < 5 and not holidays >> d & 1:  # Monday to Friday
+                shift = general_shift
+            else:  # Saturday, Sunday or a holiday
+                shift = off_shift
+            
+            if shift:
+                rows.append({'employee_id': emp.id, 'date': day, 'shift_type_id': shift.id})
+    if rows:
+        db.session.execute(db.insert(ShiftRota), rows)
+    # Overtime is measured against the rostered shift, which may just have changed
+    backfill_hours(first_day, last_day)
+    mark_month(year, month)
+    db.session.commit()
 
+@query_budget(13)
 def process_attendance_and_exceptions(year, month):
-    with app.app_context():
-        # Get date range for the month
-        first_day = date(year, month, 1)
-        if month == 12:
-            next_month = date(year+1, 1, 1)
-        else:
-            next_month = date(year, month+1, 1)
-        last_day = next_month - timedelta(days=1)
-        
-        ExceptionReport.query.filter(
-            ExceptionReport.date >= first_day,
-            ExceptionReport.date <= last_day
-        ).delete()
-        db.session.commit()
-        
-        rotas = ShiftRota.query.filter(
-            ShiftRota.date >= first_day,
-            ShiftRota.date <= last_day
-        ).all()
-        
-        for rota in rotas:
-            emp = Employee.query.get(rota.employee_id)
-            shift = ShiftType.query.get(rota.shift_type_id)
-            att = Attendance.query.filter_by(employee_id=emp.id, date=rota.date).first()
-            # Absenteeism
-            if not att:
-                if shift.code not in ['Off', 'Leave']:
-                    db.session.add(ExceptionReport(
-                        employee_id=emp.id, 
-                        date=rota.date, 
-                        issue='Absent without info (Leave not marked)',
-                        status='pending'
-                    ))
-                continue
-            # Shift mismatch
-            if att.status == 'P' and shift.code not in ['Off', 'Leave']:
-                if att.status == 'P' and att.time_in and shift.code in SHIFT_START:
-                    # Late arrival
-                    if (datetime.combine(rota.date, att.time_in) - datetime.combine(rota.date, SHIFT_START[shift.code])) > LATE_THRESHOLD:
-                        db.session.add(ExceptionReport(
-                            employee_id=emp.id, 
-                            date=rota.date, 
-                            issue='Late Arrival',
-                            status='pending'
-                        ))
-                if att.status == 'P' and att.time_in and shift.code not in SHIFT_START:
-                    db.session.add(ExceptionReport(
-                        employee_id=emp.id, 
-                        date=rota.date, 
-                        issue='Shift mismatch',
-                        status='pending'
-                    ))
-        db.session.commit()
+    check_open([date(year, month, 1)])
+    matrix = MonthMatrix.load(year, month)
+    
+    ExceptionReport.query.filter(
+        ExceptionReport.date >= matrix.first_day,
+        ExceptionReport.date <= matrix.last_day
+    ).delete()
+    
+    # Every rule runs over the whole month at once, sharing one set of derived arrays
+    engine = compiled_rules()
+    excused = month_calendar(year, month).excused_mask(matrix.employees)
+    reports = []
+    for issue, mask in engine.evaluate(engine.month_frame(matrix, excused=excused)):
+        for emp, day in matrix.cells(mask):
+            reports.append({'employee_id': emp.id, 'date': day, 'issue': issue, 'status': 'pending'})
+    reports.sort(key=lambda r: (r['employee_id'], r['date']))
+    if reports:
+        db.session.execute(db.insert(ExceptionReport), reports)
+    db.session.commit()
 
-@app.route('/generate_rota')
+@bp.route('/generate_rota')
+@query_budget(15)
 def generate_rota():
     today = date.today()
-    generate_monthly_rota(today.year, today.month)
-    return redirect(url_for('view_rota'))
+    try:
+        generate_monthly_rota(today.year, today.month)
+    except MonthClosed as e:
+        flash(str(e), 'danger')
+    return redirect(url_for('.view_rota'))
 
-@app.route('/rota')
-def view_rota():
+def requested_month():
+    """(year, month) from the ?year=&month= query args, defaulting to the current month."""
     today = date.today()
-    
-    # Get date range for current month
-    start_date = date(today.year, today.month, 1)
-    if today.month == 12:
-        end_date = date(today.year + 1, 1, 1) - timedelta(days=1)
+    year = request.args.get('year', type=int)
+    month = request.args.get('month', type=int)
+    if not year or not month or not 1 <= month <= 12 or not 1 <= year <= 9999:
+        return today.year, today.month
+    return year, month
+
+def adjacent_months(year, month):
+    """((year, month) before, (year, month) after) for month navigation links."""
+    previous_month = (year - 1, 12) if month == 1 else (year, month - 1)
+    next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return previous_month, next_month
+
+# Rendered rota grids keyed by month and the rota/reference version stamps
+rota_fragments = FragmentCache(max_entries=24)
+
+def render_rota_rows(days, rows):
+    """Rota statistics and the rendered employees x days grid for (employee, shift codes) rows."""
+    stats = {
+        'total_shifts': sum(code is not None for emp, codes in rows for code in codes),
+        'employees': len(rows),
+        'days': sum(any(codes[col] is not None for emp, codes in rows) for col in range(len(days))),
+        'shift_types': len({code for emp, codes in rows for code in codes if code is not None})
+    }
+    grid = render_template('rota_grid.html', days=days, rows=rows, today=date.today())
+    return stats, Markup(grid)
+
+def render_rota_grid(year, month):
+    """Rota statistics and the rendered employees x days grid for a month."""
+    matrix = MonthMatrix.load(year, month, include_attendance=False)
+    return render_rota_rows(matrix.days, matrix.shift_code_grid())
+
+def render_rota_snapshot(artifact):
+    """render_rota_grid() from a closed month's stored rota matrix."""
+    rota = json.loads(artifact.content)
+    rows = [(SimpleNamespace(**emp), emp['shifts']) for emp in rota['employees']]
+    return render_rota_rows([date.fromisoformat(day) for day in rota['days']], rows)
+
+@bp.route('/rota')
+@query_budget(6)
+def view_rota():
+    year, month = requested_month()
+    first_day, last_day = month_bounds(year, month)
+    previous_month, next_month = adjacent_months(year, month)
+    
+    snapshot = closed_months().get((year, month))
+    if snapshot is not None:
+        # Closed months are locked, so their grid only changes when they are closed again
+        key = (year, month, 'closed', snapshot)
+        stats, grid = rota_fragments.get_or_create(
+            key, lambda: render_rota_snapshot(month_artifact(year, month, 'rota')))
+    elif last_day < date.today():
+        # Past months rarely change, so keep their rendered grid around
+        key = (year, month, current_version(ROTA_VERSION_KEY), reference_cache.version())
+        stats, grid = rota_fragments.get_or_create(key, lambda: render_rota_grid(year, month))
     else:
-        end_date = date(today.year, today.month + 1, 1) - timedelta(days=1)
+        stats, grid = render_rota_grid(year, month)
     
-    rotas = db.session.query(ShiftRota, Employee, ShiftType).join(
-        Employee, ShiftRota.employee_id==Employee.id
-    ).join(
-        ShiftType, ShiftRota.shift_type_id==ShiftType.id
-    ).filter(
-        ShiftRota.date >= start_date,
-        ShiftRota.date <= end_date
-    ).order_by(ShiftRota.date, Employee.name).all()
-    
-    return render_template('rota.html', rotas=rotas)
+    return render_template('rota.html', stats=stats, grid=grid, month_start=first_day,
+                           previous_month=previous_month, next_month=next_month,
+                           closed=snapshot is not None)
+
+@bp.route('/rota/<emp_id>.ics')
+@query_budget(4)
+def rota_feed_ics(emp_id):
+    """One employee's shifts as an iCalendar feed; calendar apps poll it, so unchanged feeds answer 304."""
+    rota_version, _ = current_versions([ROTA_VERSION_KEY, REFERENCE_VERSION_KEY])
+    emp = reference_cache.employee_by_emp_id(emp_id)
+    if emp is None:
+        abort(404)
+    etag, body = rota_feed(emp, date.today(), rota_version)
+    response = make_response(body)
+    response.mimetype = 'text/calendar'
+    response.headers['Cache-Control'] = 'no-cache'
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+def rota_matrix(year, month):
+    """The month's rota as /api/rota/matrix returns it."""
+    matrix = MonthMatrix.load(year, month, include_attendance=False)
+    return {
+        'year': year,
+        'month': month,
+        'days': [day.isoformat() for day in matrix.days],
+        'employees': [{
+            'id': emp.id,
+            'emp_id': emp.emp_id,
+            'name': emp.name,
+            'department': emp.department,
+            'shifts': codes
+        } for emp, codes in matrix.shift_code_grid()]
+    }
+
+@bp.route('/api/rota/matrix')
+@query_budget(5)
+def rota_matrix_api():
+    year, month = requested_month()
+    stored = month_artifact(year, month, 'rota')
+    if stored is not None:
+        return Response(stored.content, mimetype=stored.mimetype)
+    return jsonify(rota_matrix(year, month))
 
-@app.route('/')
+@bp.route('/')
+@query_budget(3)
 def index():
-    employees = Employee.query.all()
+    employees = reference_cache.employees()
     return render_template('index.html', employees=employees)
 
-@app.route('/process_exceptions')
+@bp.route('/process_exceptions')
+@query_budget(8)
 def process_exceptions():
     # Check if admin is logged in, but don't require it
     is_admin = session.get('admin', False)
@@ -349,66 +548,174 @@ def process_exceptions():
         else:
             flash('Discrepancies processed successfully for current month. (Note: Admin login recommended for full access)', 'warning')
         
-        return redirect(url_for('view_exceptions'))
+        return redirect(url_for('.view_exceptions'))
     except Exception as e:
         flash(f'Error processing discrepancies: {str(e)}', 'danger')
-        return redirect(url_for('view_exceptions'))
+        return redirect(url_for('.view_exceptions'))
 
-@app.route('/exceptions')
-def view_exceptions():
-    # Get filter parameters
-    status_filter = request.args.get('status', 'all')
-    employee_filter = request.args.get('employee', 'all')
-    issue_filter = request.args.get('issue', 'all')
-    
+EXCEPTION_STATUSES = ['pending', 'processed', 'resolved']
+# Rows returned by /api/exceptions unless ?limit= asks for fewer (up to the maximum)
+EXCEPTION_API_LIMIT = 100
+EXCEPTION_API_MAX_LIMIT = 1000
+# Rows per page of the Discrepancies table
+EXCEPTION_PAGE_SIZE = 50
+
+def exception_filters(args=None):
+    """
+    Status, employee, issue, search text (q) and date range from the query
+    args, or from ``args`` such as a bulk action form (default: this month).
+    """
+    args = request.args if args is None else args
     today = date.today()
-    
-    # Get date range for current month
-    start_date = date(today.year, today.month, 1)
-    if today.month == 12:
-        end_date = date(today.year + 1, 1, 1) - timedelta(days=1)
-    else:
-        end_date = date(today.year, today.month + 1, 1) - timedelta(days=1)
-    
-    # Build query with filters
+    first_day, last_day = month_bounds(today.year, today.month)
+    try:
+        first_day = date.fromisoformat(args.get('from', ''))
+        last_day = date.fromisoformat(args.get('to', ''))
+    except ValueError:
+        pass
+    return {
+        'status': args.get('status', 'all'),
+        'employee': str(args.get('employee', 'all')),
+        'issue': args.get('issue', 'all'),
+        'q': (args.get('q') or '').strip(),
+        'from': first_day,
+        'to': max(first_day, last_day),
+    }
+
+def exception_filter_args(filters):
+    """exception_filters() as strings, for links, forms and JSON."""
+    return {**filters, 'from': filters['from'].isoformat(), 'to': filters['to'].isoformat()}
+
+def exception_conditions(filters):
+    """WHERE conditions on ExceptionReport for the status, employee and date filters."""
+    conditions = [ExceptionReport.date >= filters['from'], ExceptionReport.date <= filters['to']]
+    if filters['status'] != 'all':
+        conditions.append(ExceptionReport.status == filters['status'])
+    if filters['employee'].isdigit():
+        conditions.append(ExceptionReport.employee_id == int(filters['employee']))
+    return conditions
+
+def exception_search_args(filters):
+    """
+    (text, issue, first day, last day, employee id) for the exception_search
+    helpers, after folding queued changes into the full-text index.
+    """
+    issue = None if filters['issue'] == 'all' else filters['issue']
+    if (filters['q'] or issue) and refresh_search_index():
+        db.session.commit()
+    employee_id = int(filters['employee']) if filters['employee'].isdigit() else None
+    return filters['q'], issue, filters['from'], filters['to'], employee_id
+
+def exception_query(filters, search_args=None):
+    """(ExceptionReport, Employee) rows matching exception_filters(), best search match first when searching."""
     query = db.session.query(ExceptionReport, Employee).join(
         Employee, ExceptionReport.employee_id==Employee.id
-    ).filter(
-        ExceptionReport.date >= start_date,
-        ExceptionReport.date <= end_date
-    )
-    
-    # Apply filters
-    if status_filter != 'all':
-        query = query.filter(ExceptionReport.status == status_filter)
-    
-    if employee_filter != 'all':
-        query = query.filter(Employee.id == int(employee_filter))
-    
-    if issue_filter != 'all':
-        query = query.filter(ExceptionReport.issue.contains(issue_filter))
-    
-    exceptions = query.order_by(ExceptionReport.date.desc(), Employee.name).all()
-    
-    # Get filter options
-    employees = Employee.query.order_by(Employee.name).all()
-    statuses = ['pending', 'processed', 'resolved']
-    issues = ['Late Arrival', 'Absent', 'Shift mismatch']
+    ).filter(*exception_conditions(filters))
+    # Search text and the issue filter go through the full-text index
+    query = apply_search(query, *(search_args or exception_search_args(filters)))
+    return query.order_by(ExceptionReport.date.desc(), Employee.name)
+
+def exception_status_counts(filters, search_args):
+    """{status: count} of the discrepancies matching exception_filters(), in one GROUP BY."""
+    query = db.session.query(ExceptionReport.status, db.func.count(ExceptionReport.id)).join(
+        Employee, ExceptionReport.employee_id==Employee.id
+    ).filter(*exception_conditions(filters))
+    condition = search_condition(*search_args)
+    if condition is not None:
+        query = query.filter(condition)
+    return dict(query.group_by(ExceptionReport.status).all())
+
+@bp.route('/exceptions')
+@query_budget(11)
+def view_exceptions():
+    filters = exception_filters()
+    search_args = exception_search_args(filters)
+    status_counts = exception_status_counts(filters, search_args)
+    total = sum(status_counts.values())
+    pages = max(1, -(-total // EXCEPTION_PAGE_SIZE))
+    page = min(max(request.args.get('page', 1, type=int), 1), pages)
+    exceptions = (exception_query(filters, search_args)
+                  .limit(EXCEPTION_PAGE_SIZE).offset((page - 1) * EXCEPTION_PAGE_SIZE).all())
+    
+    # Get filter options; employees are picked through the typeahead
+    selected_employee = reference_cache.employee(int(filters['employee'])) if filters['employee'].isdigit() else None
+    issues = [rule.issue for rule in compiled_rules().rules]
     
     return render_template('exceptions.html', 
                          exceptions=exceptions, 
-                         employees=employees,
-                         statuses=statuses,
+                         status_counts=status_counts,
+                         total=total,
+                         page=page,
+                         pages=pages,
+                         page_size=EXCEPTION_PAGE_SIZE,
+                         selected_employee=selected_employee,
+                         statuses=EXCEPTION_STATUSES,
                          issues=issues,
-                         current_filters={'status': status_filter, 'employee': employee_filter, 'issue': issue_filter})
+                         current_filters=exception_filter_args(filters))
+
+@bp.route('/api/exceptions')
+@query_budget(10)
+def exceptions_api():
+    filters = exception_filters()
+    limit = min(max(request.args.get('limit', EXCEPTION_API_LIMIT, type=int), 1), EXCEPTION_API_MAX_LIMIT)
+    rows = exception_query(filters).limit(limit).all()
+    return jsonify({
+        **exception_filter_args(filters),
+        'limit': limit,
+        'exceptions': [{
+            'id': exception.id,
+            'date': exception.date.isoformat(),
+            'employee_id': emp.id,
+            'emp_id': emp.emp_id,
+            'employee': emp.name,
+            'issue': exception.issue,
+            'status': exception.status,
+            'notes': exception.notes
+        } for exception, emp in rows]
+    })
 
-@app.route('/exception/<int:exception_id>/update', methods=['POST'])
+@bp.route('/api/changes')
+@query_budget(8)
+def changes_api():
+    """
+    Attendance, rota and discrepancy changes after ?since= (a cursor from an
+    earlier call, 0 for everything kept), as NDJSON: one change per line,
+    then a line with the next cursor. ?limit= caps the changes per call.
+    A pruned cursor gets 410 with the head cursor to resume from after a
+    full export.
+    """
+    since = max(request.args.get('since', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', CHANGES_LIMIT, type=int), 1), CHANGES_MAX_LIMIT)
+    try:
+        entries, cursor, more = changes_since(since, limit)
+    except CursorExpired as e:
+        return jsonify({'error': str(e), 'head': head_cursor()}), 410
+    lines = [json.dumps(entry) for entry in entries]
+    lines.append(json.dumps({'cursor': cursor, 'more': more}))
+    response = make_response('\n'.join(lines) + '\n')
+    response.mimetype = 'application/x-ndjson'
+    response.headers['X-Next-Cursor'] = str(cursor)
+    return response
+
+@bp.route('/api/changes/head')
+@query_budget(1)
+def changes_head_api():
+    """The newest change's cursor: take it before a full export, then poll ?since= from it."""
+    return jsonify({'cursor': head_cursor()})
+
+@bp.route('/exception/<int:exception_id>/update', methods=['POST'])
+@query_budget(4)
 @admin_required
 def update_exception(exception_id):
     exception = ExceptionReport.query.get_or_404(exception_id)
     action = request.form.get('action')
     notes = request.form.get('notes', '').strip()
     
+    try:
+        check_open([exception.date])
+    except MonthClosed as e:
+        flash(str(e), 'danger')
+        action, notes = None, ''  # back to the list without changing anything
     if action == 'process':
         exception.status = 'processed'
         flash(f'Discrepancy marked as processed.', 'success')
@@ -423,134 +730,157 @@ def update_exception(exception_id):
         exception.notes = notes
     
     db.session.commit()
-    return redirect(url_for('view_exceptions'))
+    # Back to the list page (filters and page number) the form was opened from
+    next_url = request.form.get('next', '')
+    if not next_url.startswith('/') or next_url[1:2] in ('/', '\\'):
+        next_url = url_for('.view_exceptions')
+    return redirect(next_url)
 
-@app.route('/exception/<int:exception_id>/details')
+# Bulk actions and the status each one sets
+EXCEPTION_ACTIONS = {'process': 'processed', 'resolve': 'resolved', 'reopen': 'pending'}
+# Longer selections should use scope=filter instead of listing ids
+BULK_MAX_IDS = 10000
+
+@bp.route('/exceptions/bulk_update', methods=['POST'])
+@query_budget(6)
 @admin_required
-def exception_details(exception_id):
-    exception = db.session.query(ExceptionReport, Employee).join(
+def bulk_update_exceptions():
+    """
+    Process, resolve or reopen (and optionally annotate) the listed
+    discrepancy ids, or with scope=filter every discrepancy matching the
+    status/employee/issue/search/date filters, in one UPDATE. Takes the
+    Discrepancies page form or JSON ({"action", "notes", "ids"} or
+    {"action", "notes", "scope": "filter", <filters>}) and answers JSON
+    requests with the number of rows updated.
+    """
+    data = request.get_json(silent=True) if request.is_json else None
+    if data is None:
+        ids = [int(i) for i in request.form.getlist('ids') if i.isdigit()]
+    else:
+        ids = data.get('ids') or [] if isinstance(data, dict) else None
+        # bool is an int subclass, but true/false are not ids
+        if not isinstance(ids, list) or not all(type(i) is int for i in ids):
+            return jsonify({'error': 'Send a JSON object whose ids are a list of integers.'}), 400
+    form = request.form if data is None else data
+    status = EXCEPTION_ACTIONS.get(form.get('action'))
+    notes = (form.get('notes') or '').strip()
+    filters = exception_filters(form)
+
+    error = None
+    if status is None:
+        error = 'Choose an action.'
+    elif form.get('scope') == 'filter':
+        conditions = exception_conditions(filters)
+        condition = search_condition(*exception_search_args(filters))
+        if condition is not None:
+            conditions.append(condition)
+    elif not ids:
+        error = 'Select at least one discrepancy.'
+    elif len(ids) > BULK_MAX_IDS:
+        error = f'Select at most {BULK_MAX_IDS} discrepancies, or apply the action to all matching ones.'
+    else:
+        conditions = [ExceptionReport.id.in_(ids)]
+    if error:
+        if data is not None:
+            return jsonify({'error': error}), 400
+        flash(error, 'danger')
+        return redirect(url_for('.view_exceptions', **exception_filter_args(filters)))
+
+    # Discrepancies in closed months stay as they were when the month was closed
+    conditions.extend(exclude_closed(ExceptionReport.date))
+    values = {'status': status}
+    if notes:
+        values['notes'] = notes
+    else:
+        # Only count rows that actually change
+        conditions.append(ExceptionReport.status != status)
+    updated = db.session.execute(
+        db.update(ExceptionReport).where(*conditions).values(**values)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+
+    if data is not None:
+        return jsonify({'updated': updated, 'status': status})
+    flash(f'{updated} discrepancies marked as {status}.', 'success')
+    return redirect(url_for('.view_exceptions', **exception_filter_args(filters)))
+
+def exception_row(exception_id):
+    """(ExceptionReport, Employee) for one discrepancy, or 404."""
+    return db.session.query(ExceptionReport, Employee).join(
         Employee, ExceptionReport.employee_id==Employee.id
     ).filter(ExceptionReport.id == exception_id).first_or_404()
-    
-    return render_template('exception_details.html', exception=exception)
 
+@bp.route('/exception/<int:exception_id>/details')
+@query_budget(4)
+@admin_required
+def exception_details(exception_id):
+    return render_template('exception_details.html', exception=exception_row(exception_id))
 
+@bp.route('/exception/<int:exception_id>/form')
+@query_budget(4)
+@admin_required
+def exception_form(exception_id):
+    """Update form for one discrepancy, fetched into the Discrepancies page modal when it opens."""
+    return render_template('exception_form.html', exception=exception_row(exception_id),
+                           next=request.args.get('next', ''))
 
-@app.route('/export_exceptions_excel')
-def export_exceptions_excel():
-    today = date.today()
-    
-    # Get date range for current month
-    start_date = date(today.year, today.month, 1)
-    if today.month == 12:
-        end_date = date(today.year + 1, 1, 1) - timedelta(days=1)
-    else:
-        end_date = date(today.year, today.month + 1, 1) - timedelta(days=1)
-    
-    exceptions = db.session.query(ExceptionReport, Employee).join(
+def month_exceptions(year, month):
+    """(ExceptionReport, Employee) rows of a month, by date and name."""
+    start_date, end_date = month_bounds(year, month)
+    return db.session.query(ExceptionReport, Employee).join(
         Employee, ExceptionReport.employee_id==Employee.id
     ).filter(
         ExceptionReport.date >= start_date,
         ExceptionReport.date <= end_date
     ).order_by(ExceptionReport.date, Employee.name).all()
-    
-    data = [{
+
+def exceptions_sheet(exceptions):
+    return [{
         'Date': exception.date.strftime('%Y-%m-%d'),
         'Employee': emp.name,
         'Issue': exception.issue,
         'Status': exception.status.title(),
         'Notes': exception.notes or 'N/A'
     } for exception, emp in exceptions]
-    
-    df = pd.DataFrame(data)
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Discrepancies')
-    output.seek(0)
-    return send_file(output, download_name='discrepancy_report.xlsx', as_attachment=True)
-
-@app.route('/export_exceptions_pdf')
+
+def exceptions_excel(year, month):
+    data = exceptions_sheet(month_exceptions(year, month))
+    return f'discrepancy_report_{year}_{month:02d}.xlsx', XLSX_MIMETYPE, excel_bytes({'Discrepancies': data})
+
+def exceptions_html(year, month, exceptions):
+    return render_template('exceptions_pdf.html', exceptions=exceptions, month_start=date(year, month, 1))
+
+def exceptions_pdf(year, month):
+    html = exceptions_html(year, month, month_exceptions(year, month))
+    return f'discrepancy_report_{year}_{month:02d}.pdf', PDF_MIMETYPE, pdf_bytes(html)
+
+@bp.route('/export_exceptions_excel')
+@query_budget(5)
+def export_exceptions_excel():
+    return send_month_export('exceptions_excel')
+
+@bp.route('/export_exceptions_pdf')
+@query_budget(5)
 def export_exceptions_pdf():
-    today = date.today()
-    
-    # Get date range for current month
-    start_date = date(today.year, today.month, 1)
-    if today.month == 12:
-        end_date = date(today.year + 1, 1, 1) - timedelta(days=1)
-    else:
-        end_date = date(today.year, today.month + 1, 1) - timedelta(days=1)
-    
-    exceptions = db.session.query(ExceptionReport, Employee).join(
-        Employee, ExceptionReport.employee_id==Employee.id
-    ).filter(
-        ExceptionReport.date >= start_date,
-        ExceptionReport.date <= end_date
-    ).order_by(ExceptionReport.date, Employee.name).all()
-    
-    html = render_template('exceptions_pdf.html', exceptions=exceptions)
-    result = io.BytesIO()
-    pisa.CreatePDF(io.StringIO(html), dest=result)
-    result.seek(0)
-    return send_file(result, download_name='discrepancy_report.pdf', as_attachment=True)
+    return send_month_export('exceptions_pdf')
 
-@app.route('/export_reports_excel')
-def export_reports_excel():
-    today = date.today()
-    employees = Employee.query.all()
-    summary_data = []
+def summary_sheet(summary_data):
+    """MonthMatrix.summary() rows as the Monthly Summary sheet, with attendance percentages."""
+    labels = {
+        'name': 'Employee',
+        'P': 'Present',
+        'Off': 'Off',
+        'Leave': 'Leave',
+        'A': 'Absent',
+        'L': 'Late',
+        'E': 'Early Leave',
+        'OD': 'On Duty'
+    }
+    rows = []
     
-    for emp in employees:
-        # Get attendance records for current month
-        start_date = date(today.year, today.month, 1)
-        if today.month == 12:
-            end_date = date(today.year + 1, 1, 1) - timedelta(days=1)
-        else:
-            end_date = date(today.year, today.month + 1, 1) - timedelta(days=1)
-        
-        records = Attendance.query.filter(
-            Attendance.employee_id == emp.id,
-            Attendance.date >= start_date,
-            Attendance.date <= end_date
-        ).all()
-        
-        # Initialize summary with proper status mapping
-        summary = {
-            'Employee': emp.name, 
-            'Present': 0, 
-            'Off': 0, 
-            'Leave': 0, 
-            'Absent': 0, 
-            'Late': 0, 
-            'Early Leave': 0, 
-            'On Duty': 0
-        }
-        
-        # Map status codes to summary keys
-        status_mapping = {
-            'P': 'Present',
-            'A': 'Absent', 
-            'L': 'Late',
-            'E': 'Early Leave',
-            'OD': 'On Duty'
-        }
-        
-        for att in records:
-            if att.status in status_mapping:
-                summary[status_mapping[att.status]] += 1
-        
-        # Count offs and leaves from rota
-        rotas = ShiftRota.query.filter(
-            ShiftRota.employee_id == emp.id,
-            ShiftRota.date >= start_date,
-            ShiftRota.date <= end_date
-        ).all()
-        
-        for rota in rotas:
-            shift = ShiftType.query.get(rota.shift_type_id)
-            if shift and shift.code == 'Off':
-                summary['Off'] += 1
-            if shift and shift.code == 'Leave':
-                summary['Leave'] += 1
+    for summary in summary_data:
+        summary = {labels[key]: value for key, value in summary.items()}
         
         # Calculate attendance percentage
         total_days = sum([summary['Present'], summary['Off'], summary['Leave'], summary['Absent'], summary['Late'], summary['Early Leave'], summary['On Duty']])
@@ -559,75 +889,17 @@ def export_reports_excel():
         else:
             attendance_percentage = 0
         summary['Attendance %'] = attendance_percentage
-        summary_data.append(summary)
-    
-    df = pd.DataFrame(summary_data)
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Monthly Summary')
-    output.seek(0)
-    return send_file(output, download_name='monthly_attendance_report.xlsx', as_attachment=True)
-
-@app.route('/export_reports_pdf')
-def export_reports_pdf():
+        rows.append(summary)
+    return rows
+
+def reports_excel(year, month):
+    return (f'monthly_attendance_report_{year}_{month:02d}.xlsx', XLSX_MIMETYPE,
+            excel_bytes({'Monthly Summary': summary_sheet(MonthMatrix.load(year, month).summary())}))
+
+def reports_html(year, month, summary_data):
     today = date.today()
-    employees = Employee.query.all()
-    summary_data = []
-    
-    for emp in employees:
-        # Get attendance records for current month
-        start_date = date(today.year, today.month, 1)
-        if today.month == 12:
-            end_date = date(today.year + 1, 1, 1) - timedelta(days=1)
-        else:
-            end_date = date(today.year, today.month + 1, 1) - timedelta(days=1)
-        
-        records = Attendance.query.filter(
-            Attendance.employee_id == emp.id,
-            Attendance.date >= start_date,
-            Attendance.date <= end_date
-        ).all()
-        
-        # Initialize summary with proper status mapping
-        summary = {
-            'name': emp.name, 
-            'P': 0, 
-            'Off': 0, 
-            'Leave': 0, 
-            'A': 0, 
-            'L': 0, 
-            'E': 0, 
-            'OD': 0
-        }
-        
-        # Map status codes to summary keys
-        status_mapping = {
-            'P': 'P',
-            'A': 'A', 
-            'L': 'L',
-            'E': 'E',
-            'OD': 'OD'
-        }
-        
-        for att in records:
-            if att.status in status_mapping:
-                summary[status_mapping[att.status]] += 1
-        
-        # Count offs and leaves from rota
-        rotas = ShiftRota.query.filter(
-            ShiftRota.employee_id == emp.id,
-            ShiftRota.date >= start_date,
-            ShiftRota.date <= end_date
-        ).all()
-        
-        for rota in rotas:
-            shift = ShiftType.query.get(rota.shift_type_id)
-            if shift and shift.code == 'Off':
-                summary['Off'] += 1
-            if shift and shift.code == 'Leave':
-                summary['Leave'] += 1
-        
-        summary_data.append(summary)
+    month_start = date(year, month, 1)
+    summary_data = [dict(summary) for summary in summary_data]
     
     # Calculate attendance percentage for each employee
     for summary in summary_data:
@@ -732,8 +1004,8 @@ def export_reports_pdf():
             <div class="report-title">Monthly Attendance Summary Report</div>
             <div class="report-meta">
                 Generated on: {today.strftime('%d %B %Y')} | 
-                Period: {today.strftime('%B %Y')} | 
-                Total Employees: {len(employees)}
+                Period: {month_start.strftime('%B %Y')} | 
+                Total Employees: {len(summary_data)}
             </div>
         </div>
         
@@ -782,35 +1054,70 @@ def export_reports_pdf():
     </html>
     """
     
-    result = io.BytesIO()
-    pisa.CreatePDF(io.StringIO(html_content), dest=result)
-    result.seek(0)
-    return send_file(result, download_name='monthly_attendance_report.pdf', as_attachment=True)
+    return html_content
 
-@app.route('/export_attendance_excel')
-def export_attendance_excel():
-    attendance = db.session.query(Attendance, Employee).join(Employee, Attendance.employee_id==Employee.id).order_by(Attendance.date.desc()).all()
-    data = [{
+def reports_pdf(year, month):
+    html = reports_html(year, month, MonthMatrix.load(year, month).summary())
+    return f'monthly_attendance_report_{year}_{month:02d}.pdf', PDF_MIMETYPE, pdf_bytes(html)
+
+@bp.route('/export_reports_excel')
+@query_budget(5)
+def export_reports_excel():
+    return send_month_export('reports_excel')
+
+@bp.route('/export_reports_pdf')
+@query_budget(5)
+def export_reports_pdf():
+    return send_month_export('reports_pdf')
+
+def hours_sheet(hours):
+    return [{
+        'Employee': row.name,
+        'Employee ID': row.emp_id,
+        'Department': row.department,
+        'Days Worked': row.days,
+        'Worked Hours': round(row.worked_minutes / 60, 2),
+        'Overtime Hours': round(row.overtime_minutes / 60, 2)
+    } for row in hours]
+
+def hours_excel(year, month):
+    data = hours_sheet(hours_by_employee(*month_bounds(year, month)))
+    return f'hours_overtime_{year}_{month:02d}.xlsx', XLSX_MIMETYPE, excel_bytes({'Hours & Overtime': data})
+
+@bp.route('/export_hours_excel')
+@query_budget(5)
+def export_hours_excel():
+    return send_month_export('hours_excel')
+
+def attendance_rows(year=None, month=None):
+    """(Attendance, Employee) rows, latest first: one month's, or every one when no month is given."""
+    query = db.session.query(Attendance, Employee).join(Employee, Attendance.employee_id==Employee.id)
+    if year is not None:
+        first_day, last_day = month_bounds(year, month)
+        query = query.filter(Attendance.date >= first_day, Attendance.date <= last_day)
+    return query.order_by(Attendance.date.desc()).all()
+
+def month_suffix(year, month):
+    return '' if year is None else f'_{year}_{month:02d}'
+
+def attendance_sheet(attendance):
+    return [{
         'Date': att.date.strftime('%Y-%m-%d'),
         'Employee': emp.name,
         'Employee ID': emp.emp_id,
         'Status': att.status,
         'Time In': att.time_in.strftime('%H:%M') if att.time_in else 'N/A',
         'Time Out': att.time_out.strftime('%H:%M') if att.time_out else 'N/A',
-        'Duration': calculate_duration(att.time_in, att.time_out) if att.time_in and att.time_out else 'N/A'
+        'Duration': format_minutes(att.worked_minutes),
+        'Overtime': format_minutes(att.overtime_minutes)
     } for att, emp in attendance]
-    
-    df = pd.DataFrame(data)
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Attendance Data')
-    output.seek(0)
-    return send_file(output, download_name='attendance_data.xlsx', as_attachment=True)
-
-@app.route('/export_attendance_pdf')
-def export_attendance_pdf():
-    attendance = db.session.query(Attendance, Employee).join(Employee, Attendance.employee_id==Employee.id).order_by(Attendance.date.desc()).all()
-    
+
+def attendance_excel(year=None, month=None):
+    data = attendance_sheet(attendance_rows(year, month))
+    return (f'attendance_data{month_suffix(year, month)}.xlsx', XLSX_MIMETYPE,
+            excel_bytes({'Attendance Data': data}))
+
+def attendance_html(attendance, year=None, month=None):
     # Create simple professional PDF template
     html_content = """
     <html>
@@ -900,7 +1207,8 @@ def export_attendance_pdf():
         <div class="header-section">
             <div class="report-title">Attendance Report</div>
             <div class="report-meta">
-                Generated on: """ + date.today().strftime('%d %B %Y') + """ | 
+                Generated on: """ + date.today().strftime('%d %B %Y') + """ | """ + (
+                    '' if year is None else f"Period: {date(year, month, 1).strftime('%B %Y')} | ") + """
                 Total Records: """ + str(len(attendance)) + """
             </div>
         </div>
@@ -915,32 +1223,13 @@ def export_attendance_pdf():
                     <th>Time In</th>
                     <th>Time Out</th>
                     <th>Duration</th>
+                    <th>Overtime</th>
                 </tr>
             </thead>
             <tbody>
     """
     
     for att, emp in attendance:
-        # Calculate duration properly
-        if att.time_in and att.time_out:
-            # Convert times to datetime objects for calculation
-            today = datetime.now().date()
-            time_in_dt = datetime.combine(today, att.time_in)
-            time_out_dt = datetime.combine(today, att.time_out)
-            
-            # Handle case where time_out is on the next day
-            if time_out_dt < time_in_dt:
-                time_out_dt += timedelta(days=1)
-            
-            duration_td = time_out_dt - time_in_dt
-            # Format duration as HH:MM
-            total_seconds = int(duration_td.total_seconds())
-            hours = total_seconds // 3600
-            minutes = (total_seconds % 3600) // 60
-            duration = f"{hours:02d}:{minutes:02d}"
-        else:
-            duration = 'N/A'
-            
         html_content += f"""
                 <tr>
                     <td>{att.date.strftime('%Y-%m-%d')}</td>
@@ -949,7 +1238,8 @@ def export_attendance_pdf():
                     <td>{att.status}</td>
                     <td>{att.time_in.strftime('%H:%M') if att.time_in else 'N/A'}</td>
                     <td>{att.time_out.strftime('%H:%M') if att.time_out else 'N/A'}</td>
-                    <td>{duration}</td>
+                    <td>{format_minutes(att.worked_minutes)}</td>
+                    <td>{format_minutes(att.overtime_minutes)}</td>
                 </tr>
         """
     
@@ -966,14 +1256,32 @@ def export_attendance_pdf():
     </html>
     """
     
-    result = io.BytesIO()
-    pisa.CreatePDF(io.StringIO(html_content), dest=result)
-    result.seek(0)
-    return send_file(result, download_name='attendance_report.pdf', as_attachment=True)
+    return html_content
+
+def attendance_pdf(year=None, month=None):
+    html = attendance_html(attendance_rows(year, month), year, month)
+    return f'attendance_report{month_suffix(year, month)}.pdf', PDF_MIMETYPE, pdf_bytes(html)
+
+@bp.route('/export_attendance_excel')
+@query_budget(5)
+def export_attendance_excel():
+    """Every attendance record, or with ?year=&month= only that month's."""
+    if 'month' in request.args:
+        return send_month_export('attendance_excel')
+    return send_export(*attendance_excel())
+
+@bp.route('/export_attendance_pdf')
+@query_budget(5)
+def export_attendance_pdf():
+    """Every attendance record, or with ?year=&month= only that month's."""
+    if 'month' in request.args:
+        return send_month_export('attendance_pdf')
+    return send_export(*attendance_pdf())
 
-@app.route('/export_employees_excel')
+@bp.route('/export_employees_excel')
+@query_budget(5)
 def export_employees_excel():
-    employees = Employee.query.all()
+    employees = reference_cache.employees()
     data = [{
         'Employee ID': emp.emp_id,
         'Name': emp.name,
@@ -984,16 +1292,12 @@ def export_employees_excel():
         'Status': emp.status or 'N/A'
     } for emp in employees]
     
-    df = pd.DataFrame(data)
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Employee Data')
-    output.seek(0)
-    return send_file(output, download_name='employee_data.xlsx', as_attachment=True)
-
-@app.route('/export_employees_pdf')
+    return send_excel(data, 'Employee Data', 'employee_data.xlsx')
+
+@bp.route('/export_employees_pdf')
+@query_budget(5)
 def export_employees_pdf():
-    employees = Employee.query.all()
+    employees = reference_cache.employees()
     
     # Create simple professional PDF template
     html_content = f"""
@@ -1126,67 +1430,49 @@ def export_employees_pdf():
     </html>
     """
     
-    result = io.BytesIO()
-    pisa.CreatePDF(io.StringIO(html_content), dest=result)
-    result.seek(0)
-    return send_file(result, download_name='employee_directory.pdf', as_attachment=True)
+    return send_pdf(html_content, 'employee_directory.pdf')
 
-@app.route('/export_rota_excel')
-def export_rota_excel():
-    today = date.today()
-    
-    # Get date range for current month
-    start_date = date(today.year, today.month, 1)
-    if today.month == 12:
-        end_date = date(today.year + 1, 1, 1) - timedelta(days=1)
-    else:
-        end_date = date(today.year, today.month + 1, 1) - timedelta(days=1)
-    
-    rotas = db.session.query(ShiftRota, Employee, ShiftType).join(
-        Employee, ShiftRota.employee_id==Employee.id
-    ).join(
-        ShiftType, ShiftRota.shift_type_id==ShiftType.id
-    ).filter(
-        ShiftRota.date >= start_date,
-        ShiftRota.date <= end_date
-    ).order_by(ShiftRota.date, Employee.name).all()
-    
-    data = [{
-        'Date': rota.date.strftime('%Y-%m-%d'),
-        'Employee': emp.name,
-        'Employee ID': emp.emp_id,
-        'Shift': shift.description,
-        'Shift Code': shift.code,
-        'Start Time': SHIFT_START.get(shift.code, 'N/A').strftime('%H:%M') if isinstance(SHIFT_START.get(shift.code, 'N/A'), time) else 'N/A',
-        'Department': emp.department or 'N/A'
-    } for rota, emp, shift in rotas]
-    
-    df = pd.DataFrame(data)
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Shift Rota')
-    output.seek(0)
-    return send_file(output, download_name='shift_rota.xlsx', as_attachment=True)
-
-@app.route('/export_rota_pdf')
-def export_rota_pdf():
+def rota_sheets(days, rows):
+    """Shift Rota (one row per shift) and Rota Matrix (one row per employee) sheets from a shift code grid."""
+    data = []
+    for col, day in enumerate(days):
+        for emp, codes in rows:
+            code = codes[col]
+            if code is None:
+                continue
+            shift = reference_cache.shift_type_by_code(code)
+            data.append({
+                'Date': day.strftime('%Y-%m-%d'),
+                'Employee': emp.name,
+                'Employee ID': emp.emp_id,
+                'Shift': shift.description if shift else code,
+                'Shift Code': code,
+                'Start Time': shift.start_time.strftime('%H:%M') if shift and shift.start_time else 'N/A',
+                'Department': emp.department or 'N/A'
+            })
+    
+    # Pivoted layout: one row per employee, one column per day
+    pivot = []
+    for emp, codes in rows:
+        entry = {'Employee': emp.name, 'Employee ID': emp.emp_id, 'Department': emp.department or 'N/A'}
+        for day, code in zip(days, codes):
+            entry[day.strftime('%d %a')] = code or ''
+        pivot.append(entry)
+    
+    return {'Shift Rota': data, 'Rota Matrix': pivot}
+
+def rota_excel(year, month):
+    matrix = MonthMatrix.load(year, month, include_attendance=False)
+    sheets = rota_sheets(matrix.days, matrix.shift_code_grid())
+    return f'shift_rota_{year}_{month:02d}.xlsx', XLSX_MIMETYPE, excel_bytes(sheets)
+
+def rota_html(year, month, days, rows):
     today = date.today()
-    
-    # Get date range for current month
-    start_date = date(today.year, today.month, 1)
-    if today.month == 12:
-        end_date = date(today.year + 1, 1, 1) - timedelta(days=1)
-    else:
-        end_date = date(today.year, today.month + 1, 1) - timedelta(days=1)
-    
-    rotas = db.session.query(ShiftRota, Employee, ShiftType).join(
-        Employee, ShiftRota.employee_id==Employee.id
-    ).join(
-        ShiftType, ShiftRota.shift_type_id==ShiftType.id
-    ).filter(
-        ShiftRota.date >= start_date,
-        ShiftRota.date <= end_date
-    ).order_by(ShiftRota.date, Employee.name).all()
+    start_date = date(year, month, 1)
+    # (day, employee, shift type) by date and name
+    rotas = [(day, emp, reference_cache.shift_type_by_code(codes[col]))
+             for col, day in enumerate(days) for emp, codes in rows if codes[col] is not None]
+    rotas = [(day, emp, shift) for day, emp, shift in rotas if shift is not None]
     
     # Create simple professional PDF template
     html_content = f"""
@@ -1277,7 +1563,7 @@ def export_rota_pdf():
         <div class="header-section">
             <div class="report-title">Shift Rota Report</div>
             <div class="report-meta">
-                Period: {today.strftime('%B %Y')} | 
+                Period: {start_date.strftime('%B %Y')} | 
                 Total Entries: {len(rotas)}
             </div>
         </div>
@@ -1297,14 +1583,12 @@ def export_rota_pdf():
     """
     
     if rotas:
-        for rota, emp, shift in rotas:
-            start_time = SHIFT_START.get(shift.code, 'N/A')
-            if start_time != 'N/A':
-                start_time = start_time.strftime('%H:%M')
+        for day, emp, shift in rotas:
+            start_time = shift.start_time.strftime('%H:%M') if shift.start_time else 'N/A'
             
             html_content += f"""
                     <tr>
-                        <td>{rota.date.strftime('%Y-%m-%d')}</td>
+                        <td>{day.strftime('%Y-%m-%d')}</td>
                         <td class="employee-name">{emp.name}</td>
                         <td>{emp.emp_id}</td>
                         <td>{shift.description}</td>
@@ -1316,7 +1600,7 @@ def export_rota_pdf():
         html_content += """
                     <tr>
                         <td colspan="6" style="text-align: center; padding: 20px; color: #666;">
-                            No rota data available for the current month.
+                            No rota data available for this month.
                         </td>
                     </tr>
         """
@@ -1334,193 +1618,493 @@ def export_rota_pdf():
     </html>
     """
     
-    result = io.BytesIO()
-    pisa.CreatePDF(io.StringIO(html_content), dest=result)
-    result.seek(0)
-    return send_file(result, download_name='shift_rota.pdf', as_attachment=True)
+    return html_content
+
+def rota_pdf(year, month):
+    matrix = MonthMatrix.load(year, month, include_attendance=False)
+    html = rota_html(year, month, matrix.days, matrix.shift_code_grid())
+    return f'shift_rota_{year}_{month:02d}.pdf', PDF_MIMETYPE, pdf_bytes(html)
+
+@bp.route('/export_rota_excel')
+@query_budget(5)
+def export_rota_excel():
+    return send_month_export('rota_excel')
+
+@bp.route('/export_rota_pdf')
+@query_budget(5)
+def export_rota_pdf():
+    return send_month_export('rota_pdf')
 
-@app.route('/employee')
+@bp.route('/employee')
+@query_budget(4)
 def employee_page():
-    employees = Employee.query.all()
+    employees = reference_cache.employees()
     return render_template('employee.html', employees=employees)
 
-@app.route('/attendance')
+@bp.route('/attendance')
+@query_budget(4)
 def attendance_page():
     attendance = db.session.query(Attendance, Employee).join(Employee, Attendance.employee_id==Employee.id).order_by(Attendance.date.desc()).all()
     return render_template('attendance.html', attendance=attendance)
 
-@app.route('/reports')
+@bp.route('/reports')
+@query_budget(6)
 def reports_page():
-    today = date.today()
-    
-    # Get date range for current month
-    start_date = date(today.year, today.month, 1)
-    if today.month == 12:
-        end_date = date(today.year + 1, 1, 1) - timedelta(days=1)
+    year, month = requested_month()
+    start_date, end_date = month_bounds(year, month)
+    previous_month, next_month = adjacent_months(year, month)
+    
+    stored = month_artifacts(year, month, ['summary', 'exceptions'])
+    if stored:
+        # Closed month: the summary and discrepancies as they were when it was closed
+        summary = json.loads(stored['summary'].content)
+        summary_data, hours = summary['summary'], summary['hours']
+        exceptions = [(SimpleNamespace(date=date.fromisoformat(row['date']), issue=row['issue'],
+                                       status=row['status'], notes=row['notes']),
+                       SimpleNamespace(id=row['employee_id'], emp_id=row['emp_id'], name=row['employee']))
+                      for row in json.loads(stored['exceptions'].content)]
+        exceptions.reverse()  # stored by date, shown latest first
     else:
-        end_date = date(today.year, today.month + 1, 1) - timedelta(days=1)
-    
-    exceptions = db.session.query(ExceptionReport, Employee).join(
-        Employee, ExceptionReport.employee_id==Employee.id
-    ).filter(
-        ExceptionReport.date >= start_date,
-        ExceptionReport.date <= end_date
-    ).order_by(ExceptionReport.date.desc()).all()
-    
-    # Monthly summary
-    employees = Employee.query.all()
-    summary_data = []
-    for emp in employees:
-        records = Attendance.query.filter(
-            Attendance.employee_id == emp.id,
-            Attendance.date >= start_date,
-            Attendance.date <= end_date
-        ).all()
-        
-        summary = {'name': emp.name, 'P': 0, 'Off': 0, 'Leave': 0, 'A': 0, 'L': 0, 'E': 0, 'OD': 0}
-        
-        # Map status codes to summary keys
-        status_mapping = {
-            'P': 'P',
-            'A': 'A', 
-            'L': 'L',
-            'E': 'E',
-            'OD': 'OD'
-        }
+        exceptions = db.session.query(ExceptionReport, Employee).join(
+            Employee, ExceptionReport.employee_id==Employee.id
+        ).filter(
+            ExceptionReport.date >= start_date,
+            ExceptionReport.date <= end_date
+        ).order_by(ExceptionReport.date.desc()).all()
         
-        for att in records:
-            if att.status in status_mapping:
-                summary[status_mapping[att.status]] += 1
-        
-        # Count offs and leaves from rota
-        rotas = ShiftRota.query.filter(
-            ShiftRota.employee_id == emp.id,
-            ShiftRota.date >= start_date,
-            ShiftRota.date <= end_date
-        ).all()
-        
-        for rota in rotas:
-            shift = ShiftType.query.get(rota.shift_type_id)
-            if shift and shift.code == 'Off':
-                summary['Off'] += 1
-            if shift and shift.code == 'Leave':
-                summary['Leave'] += 1
-        
-        summary_data.append(summary)
+        # Monthly summary
+        summary_data = MonthMatrix.load(year, month).summary()
+        hours = hours_by_employee(start_date, end_date)
     
-    return render_template('reports.html', exceptions=exceptions, summary_data=summary_data)
+    return render_template('reports.html', exceptions=exceptions, summary_data=summary_data, hours=hours,
+                           month_start=start_date, previous_month=previous_month, next_month=next_month,
+                           closed=bool(stored), month_ended=end_date < date.today())
+
+def summary_json(year, month):
+    first_day, last_day = month_bounds(year, month)
+    hours = [{'employee_id': row.id, 'emp_id': row.emp_id, 'name': row.name, 'department': row.department,
+              'days': row.days, 'worked_minutes': row.worked_minutes, 'overtime_minutes': row.overtime_minutes}
+             for row in hours_by_employee(first_day, last_day)]
+    summary = {'summary': MonthMatrix.load(year, month).summary(), 'hours': hours}
+    return 'summary.json', JSON_MIMETYPE, json.dumps(summary).encode()
+
+def exceptions_json(year, month):
+    rows = [{
+        'id': exception.id,
+        'date': exception.date.isoformat(),
+        'employee_id': emp.id,
+        'emp_id': emp.emp_id,
+        'employee': emp.name,
+        'issue': exception.issue,
+        'status': exception.status,
+        'notes': exception.notes
+    } for exception, emp in month_exceptions(year, month)]
+    return 'exceptions.json', JSON_MIMETYPE, json.dumps(rows).encode()
+
+def rota_json(year, month):
+    return 'rota.json', JSON_MIMETYPE, json.dumps(rota_matrix(year, month)).encode()
+
+# Everything stored when a month is closed: name -> builder of (file name, mimetype, bytes) for (year, month)
+MONTH_ARTIFACTS = {
+    'summary': summary_json,
+    'exceptions': exceptions_json,
+    'rota': rota_json,
+    'reports_excel': reports_excel,
+    'reports_pdf': reports_pdf,
+    'exceptions_excel': exceptions_excel,
+    'exceptions_pdf': exceptions_pdf,
+    'hours_excel': hours_excel,
+    'rota_excel': rota_excel,
+    'rota_pdf': rota_pdf,
+    'attendance_excel': attendance_excel,
+    'attendance_pdf': attendance_pdf,
+}
+
+def send_month_export(name):
+    """Send a month export for ?year=&month=: the stored copy for a closed month, built now otherwise."""
+    year, month = requested_month()
+    stored = month_artifact(year, month, name)
+    if stored is not None:
+        return send_export(stored.filename, stored.mimetype, stored.content)
+    return send_export(*MONTH_ARTIFACTS[name](year, month))
+
+def form_month():
+    """(year, month) posted by the close and reopen buttons."""
+    year = request.form.get('year', type=int)
+    month = request.form.get('month', type=int)
+    if not year or not month or not 1 <= month <= 12 or not 1 <= year <= 9999:
+        abort(400)
+    return year, month
+
+@bp.route('/admin/month/close', methods=['POST'])
+@query_budget(24)
+@admin_required
+def admin_month_close():
+    """Lock a month and store its reports and exports."""
+    year, month = form_month()
+    try:
+        version = close_month(year, month, MONTH_ARTIFACTS)
+        db.session.commit()
+        flash(f'{month_label(year, month)} closed; its reports and exports are stored as version {version}.', 'success')
+    except (MonthClosed, ValueError) as e:
+        flash(str(e), 'danger')
+    return redirect(url_for('.reports_page', year=year, month=month))
+
+@bp.route('/admin/month/reopen', methods=['POST'])
+@query_budget(4)
+@admin_required
+def admin_month_reopen():
+    year, month = form_month()
+    try:
+        reopen_month(year, month)
+        db.session.commit()
+        flash(f'{month_label(year, month)} reopened for changes.', 'warning')
+    except MonthClosed as e:
+        flash(str(e), 'danger')
+    return redirect(url_for('.reports_page', year=year, month=month))
 
-@app.route('/attendance_upload', methods=['GET', 'POST'])
+def month_bundle_documents(year, month):
+    """
+    Everything in the month-end bundle from one load of the month's data:
+    (workbook sheets, {PDF file name: html}).
+    """
+    first_day, last_day = month_bounds(year, month)
+    matrix = MonthMatrix.load(year, month)
+    summary_data, rota = matrix.summary(), matrix.shift_code_grid()
+    exceptions = month_exceptions(year, month)
+    attendance = attendance_rows(year, month)
+    suffix = month_suffix(year, month)
+    sheets = {
+        'Monthly Summary': summary_sheet(summary_data),
+        'Hours & Overtime': hours_sheet(hours_by_employee(first_day, last_day)),
+        'Discrepancies': exceptions_sheet(exceptions),
+        **rota_sheets(matrix.days, rota),
+        'Attendance Data': attendance_sheet(attendance),
+    }
+    pdfs = {
+        f'monthly_attendance_report{suffix}.pdf': reports_html(year, month, summary_data),
+        f'discrepancy_report{suffix}.pdf': exceptions_html(year, month, exceptions),
+        f'shift_rota{suffix}.pdf': rota_html(year, month, matrix.days, rota),
+        f'attendance_report{suffix}.pdf': attendance_html(attendance, year, month),
+    }
+    return sheets, pdfs
+
+@bp.route('/export_month_bundle')
+@query_budget(8)
+@admin_required
+def export_month_bundle():
+    """
+    The month-end bundle for ?year=&month= as one download: the workbook,
+    the PDFs and timings.json with the seconds spent on each artifact.
+    """
+    year, month = requested_month()
+    workers = current_app.config.get('BUNDLE_WORKERS', DEFAULT_BUNDLE_WORKERS)
+    bundle = build_bundle(lambda: month_bundle_documents(year, month), workers)
+    name = f'month_end{month_suffix(year, month)}'
+    files = {f'{name}.xlsx': bundle['workbook'], **bundle['pdfs'], 'timings.json': json.dumps({
+        key: bundle[key] for key in ('workers', 'timings', 'render_seconds', 'total_seconds')}, indent=2).encode()}
+    return send_export(f'{name}.zip', 'application/zip', zip_bytes(files))
+
+# Pages that offer the rollup refresh button and are returned to afterwards
+ROLLUP_PAGES = ('rollup_report', 'coverage_page')
+
+ROLLUP_LABELS = {'department': 'Department', 'location': 'Location', 'grade': 'Grade', 'shift_code': 'Shift'}
+ROLLUP_PAGE_ROWS = 500
+# Ranges starting earlier are cut to the last ROLLUP_MAX_YEARS calendar years
+ROLLUP_MAX_YEARS = 20
+
+def rollup_params():
+    """Grain, date range, group-by dimensions and drill-down filters from the query string."""
+    today = date.today()
+    grain = request.args.get('grain', 'month')
+    if grain not in GRAINS:
+        grain = 'month'
+    try:
+        first_day = date.fromisoformat(request.args.get('from', ''))
+    except ValueError:
+        first_day = date(today.year - 1, 1, 1)
+    try:
+        last_day = date.fromisoformat(request.args.get('to', ''))
+    except ValueError:
+        last_day = today
+    first_day = max(first_day, date(max(1, last_day.year - ROLLUP_MAX_YEARS + 1), 1, 1))
+    by = [name for name in request.args.get('by', 'department').split(',') if name in DIMENSIONS]
+    filters = {name: request.args[name] for name in DIMENSIONS if name in request.args}
+    return grain, first_day, last_day, by, filters
+
+def rollup_rows():
+    """Rollup rows for the request's parameters."""
+    grain, first_day, last_day, by, filters = rollup_params()
+    return query_rollup(grain, first_day, last_day, by, filters)
+
+@bp.route('/reports/rollup')
+@query_budget(4)
+def rollup_report():
+    grain, first_day, last_day, by, filters = rollup_params()
+    rows = rollup_rows()
+    args = {'grain': grain, 'from': first_day.isoformat(), 'to': last_day.isoformat(), **filters}
+    # Clicking a value filters on it and groups by the next dimension not filtered yet
+    remaining = [name for name in DIMENSIONS if name not in filters and name not in by]
+    shown = rows[:ROLLUP_PAGE_ROWS]
+    for row in shown:
+        if remaining:
+            row['drill_url'] = url_for('.rollup_report', **args, **{name: row[name] for name in by}, by=remaining[0])
+    return render_template('rollup.html', rows=rows, shown=shown, grain=grain, first_day=first_day,
+                           last_day=last_day, by=by, filters=filters, grains=GRAINS, dimensions=DIMENSIONS,
+                           labels=ROLLUP_LABELS, pending=pending_dates(),
+                           clear_url=url_for('.rollup_report', grain=grain, **{'from': args['from'], 'to': args['to']}),
+                           export_url=url_for('.export_rollup_excel', **args, by=','.join(by)))
+
+@bp.route('/rollups/refresh', methods=['POST'])
+@query_budget(16)
+@admin_required
+def refresh_rollups_page():
+    """
+    Fold the dates queued by writes into the rollups now instead of waiting
+    for `flask refresh-rollups`, then go back to the page the form was on.
+    """
+    rebuilt = refresh_rollups()
+    db.session.commit()
+    flash(f'Rollups refreshed for {rebuilt} changed dates.', 'success')
+    page = request.form.get('page')
+    args = {name: value for name, value in request.form.items() if name != 'page'}
+    return redirect(url_for(f'.{page if page in ROLLUP_PAGES else ROLLUP_PAGES[0]}', **args))
+
+@bp.route('/api/rollup')
+@query_budget(3)
+def rollup_api():
+    grain, first_day, last_day, by, filters = rollup_params()
+    rows = rollup_rows()
+    for row in rows:
+        row['period'] = row['period'].isoformat()
+    return jsonify({'grain': grain, 'from': first_day.isoformat(), 'to': last_day.isoformat(),
+                    'by': by, 'filters': filters, 'rows': rows})
+
+@bp.route('/export_rollup_excel')
+@query_budget(3)
+def export_rollup_excel():
+    grain, first_day, last_day, by, filters = rollup_params()
+    data = [{
+        'Period': row['period'].isoformat(),
+        **{ROLLUP_LABELS[name]: row[name] for name in by},
+        'Employee Days': row['employee_days'],
+        'Rostered': row['rostered'],
+        'Attended': row['attended'],
+        'Attendance %': row['attendance_pct'],
+        'Present': row['present'],
+        'Late': row['late'],
+        'Early Leave': row['early'],
+        'On Duty': row['on_duty'],
+        'Absent': row['absent'],
+        'Unmarked': row['unmarked'],
+        'Off': row['off'],
+        'Leave': row['leave'],
+        'Worked Hours': row['worked_hours'],
+        'Overtime Hours': row['overtime_hours']
+    } for row in rollup_rows()]
+    
+    return send_excel(data, f'{grain.capitalize()} Rollup', f'rollup_{grain}_{first_day}_{last_day}.xlsx')
+
+def coverage_params():
+    """
+    Date range and department filter for the coverage API and export
+    (default: this month); ranges over COVERAGE_MAX_MONTHS months are a 400.
+    """
+    first_day, last_day = month_bounds(*requested_month())
+    try:
+        first_day = date.fromisoformat(request.args.get('from', ''))
+        last_day = date.fromisoformat(request.args.get('to', ''))
+    except ValueError:
+        pass
+    last_day = max(first_day, last_day)
+    if months_spanned(first_day, last_day) > COVERAGE_MAX_MONTHS:
+        abort(400, f'Coverage covers at most {COVERAGE_MAX_MONTHS} months at a time.')
+    return first_day, last_day, request.args.get('department') or None
+
+@bp.route('/coverage')
+@query_budget(6)
+def coverage_page():
+    year, month = requested_month()
+    first_day, last_day = month_bounds(year, month)
+    previous_month, next_month = adjacent_months(year, month)
+    department = request.args.get('department') or None
+    cells = coverage(first_day, last_day, department)
+    days = [first_day + timedelta(days=d) for d in range(last_day.day)]
+    stats = {
+        'planned': sum(cell.planned for cell in cells),
+        'actual': sum(cell.actual for cell in cells),
+        'short': sum(1 for cell in cells if cell.short),
+    }
+    stats['coverage'] = round(stats['actual'] / stats['planned'] * 100, 1) if stats['planned'] else None
+    departments = sorted({emp.department or '' for emp in reference_cache.employees()})
+    return render_template('coverage.html', grid=coverage_grid(cells, days), days=days, stats=stats,
+                           month_start=first_day, previous_month=previous_month, next_month=next_month,
+                           department=department, departments=departments, today=date.today(),
+                           pending=pending_dates())
+
+@bp.route('/api/coverage')
+@query_budget(6)
+def coverage_api():
+    first_day, last_day, department = coverage_params()
+    cells = coverage(first_day, last_day, department)
+    return jsonify({
+        'from': first_day.isoformat(),
+        'to': last_day.isoformat(),
+        'department': department,
+        'cells': [{**cell._asdict(), 'date': cell.date.isoformat()} for cell in cells]
+    })
+
+@bp.route('/export_coverage_excel')
+@query_budget(6)
+def export_coverage_excel():
+    first_day, last_day, department = coverage_params()
+    data = [{
+        'Date': cell.date.strftime('%Y-%m-%d'),
+        'Department': cell.department,
+        'Shift': cell.shift_code,
+        'Rostered': cell.planned,
+        'Turned Up': cell.actual,
+        'Minimum': cell.minimum,
+        'Coverage %': round(cell.actual / cell.planned * 100, 1) if cell.planned else None,
+        'Under Minimum': 'Yes' if cell.short else ''
+    } for cell in coverage(first_day, last_day, department)]
+    
+    return send_excel(data, 'Coverage', f'coverage_{first_day}_{last_day}.xlsx')
+
+@bp.route('/attendance_upload', methods=['GET', 'POST'])
+@query_budget(11)
 def attendance_upload():
     if request.method == 'POST':
         file = request.files.get('file')
         if file and file.filename.endswith('.csv'):
             stream = io.StringIO(file.stream.read().decode('UTF8'), newline=None)
             reader = csv.DictReader(stream)
-            count = 0
+            rows = []
             for row in reader:
-                emp = Employee.query.filter_by(emp_id=row.get('EmpID')).first()
+                emp = reference_cache.employee_by_emp_id(row.get('EmpID'))
                 if emp:
-                    att = Attendance(
-                        employee_id=emp.id,
-                        date=datetime.strptime(row.get('Date'), '%Y-%m-%d').date(),
-                        status=row.get('Status'),
-                        time_in=datetime.strptime(row.get('TimeIn'), '%H:%M').time() if row.get('TimeIn') else None,
-                        time_out=datetime.strptime(row.get('TimeOut'), '%H:%M').time() if row.get('TimeOut') else None
-                    )
-                    db.session.add(att)
-                    count += 1
+                    rows.append({
+                        'employee_id': emp.id,
+                        'date': datetime.strptime(row.get('Date'), '%Y-%m-%d').date(),
+                        'status': row.get('Status'),
+                        'time_in': datetime.strptime(row.get('TimeIn'), '%H:%M').time() if row.get('TimeIn') else None,
+                        'time_out': datetime.strptime(row.get('TimeOut'), '%H:%M').time() if row.get('TimeOut') else None
+                    })
+            try:
+                check_open(row['date'] for row in rows)
+            except MonthClosed as e:
+                flash(f'Nothing was uploaded: {e}', 'danger')
+                return render_template('attendance_upload.html')
+            # One executemany instead of an INSERT per row
+            if rows:
+                db.session.execute(db.insert(Attendance), fill_hours(rows))
+                evaluate_cells((row['employee_id'], row['date']) for row in rows)
+                mark_dates(row['date'] for row in rows)
             db.session.commit()
-            flash(f'Successfully uploaded {count} attendance records.', 'success')
-            return redirect(url_for('attendance_page'))
+            flash(f'Successfully uploaded {len(rows)} attendance records.', 'success')
+            return redirect(url_for('.attendance_page'))
         else:
             flash('Please upload a valid CSV file.', 'danger')
     return render_template('attendance_upload.html')
 
-@app.route('/attendance_entry', methods=['GET', 'POST'])
+@bp.route('/attendance_entry', methods=['GET', 'POST'])
+@query_budget(13)
 def attendance_entry():
-    employees = Employee.query.filter_by(status='active').all()
     if request.method == 'POST':
         emp_id = request.form.get('employee_id')
         date_str = request.form.get('date')
         status = request.form.get('status')
         time_in = request.form.get('time_in')
         time_out = request.form.get('time_out')
-        emp = Employee.query.get(emp_id)
+        emp = reference_cache.employee(int(emp_id)) if emp_id and emp_id.isdigit() else None
         if emp and date_str and status:
-            att = Attendance(
-                employee_id=emp.id,
-                date=datetime.strptime(date_str, '%Y-%m-%d').date(),
-                status=status,
-                time_in=datetime.strptime(time_in, '%H:%M').time() if time_in else None,
-                time_out=datetime.strptime(time_out, '%H:%M').time() if time_out else None
-            )
+            record = {
+                'employee_id': emp.id,
+                'date': datetime.strptime(date_str, '%Y-%m-%d').date(),
+                'status': status,
+                'time_in': datetime.strptime(time_in, '%H:%M').time() if time_in else None,
+                'time_out': datetime.strptime(time_out, '%H:%M').time() if time_out else None
+            }
+            try:
+                check_open([record['date']])
+            except MonthClosed as e:
+                flash(str(e), 'danger')
+                return render_template('attendance_entry.html')
+            att = Attendance(**fill_hours([record])[0])
             db.session.add(att)
+            # Flag late arrival / shift mismatch straight away, in the same transaction
+            evaluate_cells([(att.employee_id, att.date)])
+            mark_dates([att.date])
             db.session.commit()
             flash('Attendance record added.', 'success')
-            return redirect(url_for('attendance_page'))
+            return redirect(url_for('.attendance_page'))
         else:
             flash('Please fill all required fields.', 'danger')
-    return render_template('attendance_entry.html', employees=employees)
+    return render_template('attendance_entry.html')
 
-@app.route('/init-db')
+@bp.route('/init-db')
 def initialize_database():
     init_db()
     flash('Database initialized with sample data.', 'success')
-    return redirect(url_for('index'))
-
+    return redirect(url_for('.index'))
 
-
-@app.route('/clear-sample-data')
+@bp.route('/clear-sample-data')
 def clear_sample_data():
     """Clear all sample data from the database"""
     try:
-        with app.app_context():
-            # Clear all data from all tables
-            ExceptionReport.query.delete()
-            ShiftRota.query.delete()
-            Attendance.query.delete()
-            Employee.query.delete()
-            ShiftType.query.delete()
-            
-            # Commit the changes
-            db.session.commit()
-            
-            flash('All sample data has been cleared from the database.', 'success')
-            return redirect(url_for('index'))
+        # Clear all data from all tables, rows referencing employees first
+        ExceptionReport.query.delete()
+        AttendanceRollup.query.delete()
+        PendingRollup.query.delete()
+        ShiftRota.query.delete()
+        Attendance.query.delete()
+        EmployeeLeave.query.delete()
+        Employee.query.delete()
+        ShiftType.query.delete()
+        Holiday.query.delete()
+        CoverageMinimum.query.delete()
+        MonthArtifact.query.delete()
+        MonthClose.query.delete()
+        # After the data tables, whose triggers log every deleted row
+        ChangeLog.query.delete()
+        if search_available():
+            rebuild_search_index()
+        reference_cache.invalidate()
+        for key in (ROTA_VERSION_KEY, CALENDAR_VERSION_KEY, COVERAGE_VERSION_KEY, CLOSED_MONTHS_VERSION_KEY):
+            bump_version(key)
+        
+        # Commit the changes
+        db.session.commit()
+        
+        flash('All sample data has been cleared from the database.', 'success')
+        return redirect(url_for('.index'))
     except Exception as e:
         flash(f'Error clearing sample data: {str(e)}', 'danger')
-        return redirect(url_for('index'))
-
-@app.route('/debug-data')
-def debug_data():
-    employees = Employee.query.all()
-    attendance = Attendance.query.all()
-    rotas = ShiftRota.query.all()
-    exceptions = ExceptionReport.query.all()
-    
-    debug_info = {
-        'employees_count': len(employees),
-        'attendance_count': len(attendance),
-        'rotas_count': len(rotas),
-        'exceptions_count': len(exceptions),
-        'employees': [{'id': e.id, 'name': e.name, 'emp_id': e.emp_id} for e in employees[:3]],
-        'attendance': [{'date': str(a.date), 'status': a.status, 'employee_id': a.employee_id} for a in attendance[:3]]
-    }
-    
-    return f"""
-    <h1>Debug Information</h1>
-    <p>Employees: {debug_info['employees_count']}</p>
-    <p>Attendance Records: {debug_info['attendance_count']}</p>
-    <p>Rota Records: {debug_info['rotas_count']}</p>
-    <p>Exception Records: {debug_info['exceptions_count']}</p>
-    <h2>Sample Employees:</h2>
-    <pre>{debug_info['employees']}</pre>
-    <h2>Sample Attendance:</h2>
-    <pre>{debug_info['attendance']}</pre>
-    """
+        return redirect(url_for('.index'))
+
+@bp.route('/health')
+@bp.route('/debug-data')
+@query_budget(4)
+def health():
+    """Cheap health check and diagnostics: row counts and cache versions, no table scans into Python."""
+    started = datetime.now()
+    try:
+        counts = db.session.execute(db.select(
+            db.select(db.func.count()).select_from(Employee).scalar_subquery().label('employees'),
+            db.select(db.func.count()).select_from(Attendance).scalar_subquery().label('attendance'),
+            db.select(db.func.count()).select_from(ShiftRota).scalar_subquery().label('rota'),
+            db.select(db.func.count()).select_from(ExceptionReport).scalar_subquery().label('exceptions')
+        )).one()._asdict()
+    except Exception as e:
+        return jsonify({'status': 'error', 'database': str(e)}), 503
+    return jsonify({
+        'status': 'ok',
+        'database_ms': round((datetime.now() - started).total_seconds() * 1000, 1),
+        'counts': counts,
+        'cache_versions': {name: current_version(name) for name in (REFERENCE_VERSION_KEY, ROTA_VERSION_KEY)}
+    })
 
-@app.route('/test-connection')
+@bp.route('/test-connection')
 def test_connection():
     """Simple test route to check if requests are working"""
     return jsonify({
@@ -1533,7 +2117,7 @@ def test_connection():
         }
     })
 
-@app.route('/debug-session')
+@bp.route('/debug-session')
 def debug_session():
     """Debug route to check session state"""
     session_info = {
@@ -1562,6 +2146,409 @@ def debug_session():
     <p><a href="/admin/login">Admin Login</a></p>
     """
 
-if __name__ == '__main__':
+@bp.cli.command('init-db')
+def init_db_command():
+    """Create the tables and default shift types."""
     init_db()
+
+@bp.cli.command('seed-synthetic')
+@click.option('--employees', default=500, show_default=True)
+@click.option('--departments', default=8, show_default=True)
+@click.option('--months', default=1, show_default=True, help='Months of rota and attendance, ending with the current one.')
+@click.option('--late-rate', default=0.08, show_default=True)
+@click.option('--absent-rate', default=0.03, show_default=True)
+@click.option('--leave-rate', default=0.02, show_default=True)
+@click.option('--punch-jitter', default=6, show_default=True, help='Std. deviation of punch times in minutes.')
+@click.option('--seed', default=42, show_default=True)
+@click.option('--reset', is_flag=True, help='Drop all existing data first.')
+def seed_synthetic_command(**options):
+    """Fill the database with reproducible synthetic employees, rota and attendance."""
+    from synthetic_data import generate
+    counts = generate(**options)
+    click.echo(', '.join(f'{count} {table}' for table, count in counts.items()))
+
+@bp.cli.command('profile-job')
+@click.argument('job', type=click.Choice(['process-exceptions', 'generate-rota']))
+@click.option('--year', type=int, default=lambda: date.today().year)
+@click.option('--month', type=int, default=lambda: date.today().month)
+def profile_job_command(job, year, month):
+    """
+    Run a batch job for one month under the profiler and save the report.
+    Note that generate-rota replaces that month's rota.
+    """
+    fn = process_attendance_and_exceptions if job == 'process-exceptions' else generate_monthly_rota
+    _, name = profile_call(f'{job} {year}-{month:02d}', fn, year, month)
+    click.echo(f'Saved profile {name} (view it at /admin/profiles/{name})')
+
+@bp.cli.command('sweep-absences')
+@click.option('--lookback-days', default=7, show_default=True)
+def sweep_absences_command(lookback_days):
+    """Flag rostered shifts that started a while ago with no punch (run it from cron every few minutes)."""
+    flagged = sweep_absences(lookback_days=lookback_days)
+    db.session.commit()
+    click.echo(f'{flagged} absences flagged')
+
+def echo_closed_skipped(first_day=None, last_day=None):
+    """Name the closed months between two dates (or all of them) that a recompute left alone."""
+    skipped = [month_label(year, month) for year, month in sorted(closed_months())
+               if (first_day is None or month_bounds(year, month)[1] >= first_day)
+               and (last_day is None or date(year, month, 1) <= last_day)]
+    if skipped:
+        click.echo(f'Closed months left as stored: {", ".join(skipped)}; reopen them to recompute.')
+
+@bp.cli.command('backfill-hours')
+@click.option('--year', type=int, help='Only this year (with --month, only that month).')
+@click.option('--month', type=int)
+def backfill_hours_command(year, month):
+    """Compute stored worked minutes and overtime for existing attendance records."""
+    first_day = last_day = None
+    if year and month:
+        first_day, last_day = month_bounds(year, month)
+    elif year:
+        first_day, last_day = date(year, 1, 1), date(year, 12, 31)
+    updated = backfill_hours(first_day, last_day)
+    db.session.commit()
+    click.echo(f'{updated} attendance records updated')
+    echo_closed_skipped(first_day, last_day)
+
+@bp.cli.command('refresh-rollups')
+def refresh_rollups_command():
+    """Fold attendance and rota changes into the rollups (run it from cron every few minutes)."""
+    rebuilt = refresh_rollups()
+    db.session.commit()
+    click.echo(f'{rebuilt} dates rebuilt')
+
+@bp.cli.command('rebuild-rollups')
+@click.option('--since', type=click.DateTime(['%Y-%m-%d']), help='First date (default: earliest rota or attendance).')
+@click.option('--until', type=click.DateTime(['%Y-%m-%d']), help='Last date (default: latest rota or attendance).')
+def rebuild_rollups_command(since, until):
+    """Rebuild all rollups in a date range from the rota and attendance tables."""
+    first_day, last_day = data_range()
+    first_day = since.date() if since else first_day
+    last_day = until.date() if until else last_day
+    if first_day is None or last_day is None:
+        click.echo('Nothing to roll up')
+        return
+    rebuild_rollups(first_day, last_day)
+    db.session.commit()
+    click.echo(f'Rollups rebuilt for {first_day} to {last_day}')
+
+@bp.cli.command('refresh-search-index')
+def refresh_search_index_command():
+    """Fold queued discrepancy changes into the full-text index (searches also do this first)."""
+    folded = refresh_search_index()
+    db.session.commit()
+    click.echo(f'{folded} queued changes indexed')
+
+@bp.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Repopulate the discrepancy full-text index (it is kept in sync by triggers; use after restoring a backup)."""
+    ensure_search_index()
+    rebuild_search_index()
+    db.session.commit()
+    click.echo(f'{ExceptionReport.query.count()} discrepancies indexed')
+
+@bp.cli.command('import-employees')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--dry-run', is_flag=True, help='Report the changes without saving them.')
+@click.option('--deactivate-missing', is_flag=True, help='Mark employees not in the file inactive.')
+def import_employees_command(path, dry_run, deactivate_missing):
+    """Add and update employees from a CSV or XLSX file keyed on EmpID."""
+    with open(path, 'rb') as stream:
+        try:
+            report = import_employees(read_rows(stream, path), deactivate_missing, dry_run)
+        except (ValueError, UnicodeDecodeError, csv.Error) as e:
+            raise click.ClickException(f'Could not read {path}: {e}')
+    for line, message in report['errors']:
+        click.echo(f'line {line}: {message}', err=True)
+    if report['error_count']:
+        raise click.ClickException(f"{report['error_count']} rows have errors; nothing was imported")
+    db.session.commit()
+    click.echo(f"{report['rows']} rows: {report['inserted']} added, {report['updated']} updated "
+               f"({report['activated']} activated, {report['deactivated']} deactivated), "
+               f"{report['unchanged']} unchanged" + (' (dry run, nothing saved)' if dry_run else ''))
+
+@bp.cli.command('prune-changes')
+@click.option('--days', default=30, show_default=True, help='Keep changes from this many days.')
+def prune_changes_command(days):
+    """Delete old change feed entries; consumers further behind must resync from a full export."""
+    pruned = prune_changes(days)
+    db.session.commit()
+    click.echo(f'{pruned} change entries pruned')
+
+@bp.cli.command('close-month')
+@click.argument('year', type=int)
+@click.argument('month', type=int)
+def close_month_command(year, month):
+    """Lock a month that has ended and store its reports and exports."""
+    try:
+        version = close_month(year, month, MONTH_ARTIFACTS)
+    except (MonthClosed, ValueError) as e:
+        raise click.ClickException(str(e))
+    db.session.commit()
+    click.echo(f'{month_label(year, month)} closed: {len(MONTH_ARTIFACTS)} artifacts stored as version {version}')
+
+@bp.cli.command('month-bundle')
+@click.argument('year', type=int)
+@click.argument('month', type=int)
+@click.option('--output', type=click.Path(file_okay=False), default='.', show_default=True,
+              help='Directory for the workbook and the PDF ZIP.')
+@click.option('--workers', type=int, default=DEFAULT_BUNDLE_WORKERS, show_default=True,
+              help='Renderer processes; 1 renders one artifact after another.')
+def month_bundle_command(year, month, output, workers):
+    """Write a month's multi-sheet workbook and ZIP of PDFs, and show the time per artifact."""
+    bundle = build_bundle(lambda: month_bundle_documents(year, month), workers)
+    os.makedirs(output, exist_ok=True)
+    name = f'month_end{month_suffix(year, month)}'
+    for filename, content in ((f'{name}.xlsx', bundle['workbook']), (f'{name}_pdfs.zip', zip_bytes(bundle['pdfs']))):
+        with open(os.path.join(output, filename), 'wb') as fh:
+            fh.write(content)
+        click.echo(f'Wrote {os.path.join(output, filename)} ({len(content)} bytes)')
+    for artifact, seconds in bundle['timings'].items():
+        click.echo(f'  {artifact:<40} {seconds:8.3f}s')
+    click.echo(f'{bundle["workers"]} workers: {bundle["total_seconds"]:.3f}s total, '
+               f'{bundle["render_seconds"]:.3f}s of rendering')
+
+@bp.cli.command('reopen-month')
+@click.argument('year', type=int)
+@click.argument('month', type=int)
+def reopen_month_command(year, month):
+    """Unlock a closed month for changes; close it again to store fresh reports."""
+    try:
+        reopen_month(year, month)
+    except MonthClosed as e:
+        raise click.ClickException(str(e))
+    db.session.commit()
+    click.echo(f'{month_label(year, month)} reopened')
+
+@bp.cli.command('list-closed-months')
+def list_closed_months_command():
+    """Show closed and reopened months with their snapshot version."""
+    for row in list_closes():
+        state = 'closed' if row.closed else 'reopened'
+        click.echo(f'{row.year}-{row.month:02d}  {state:<8}  version {row.version}  closed {row.closed_at:%Y-%m-%d %H:%M}')
+
+@bp.cli.command('set-coverage-minimum')
+@click.argument('shift_code')
+@click.argument('minimum', type=int)
+@click.option('--department', default='', help='Only this department (default: every department).')
+def set_coverage_minimum_command(shift_code, minimum, department):
+    """Set the fewest people who must turn up for a shift; 0 removes the minimum."""
+    if reference_cache.shift_type_by_code(shift_code) is None:
+        raise click.ClickException(f'Unknown shift code {shift_code}')
+    row = CoverageMinimum.query.filter_by(department=department, shift_code=shift_code).first()
+    if minimum <= 0:
+        if row is not None:
+            db.session.delete(row)
+    elif row is None:
+        db.session.add(CoverageMinimum(department=department, shift_code=shift_code, minimum=minimum))
+    else:
+        row.minimum = minimum
+    bump_version(COVERAGE_VERSION_KEY)
+    db.session.commit()
+    scope = department or 'every department'
+    click.echo(f'Minimum for {shift_code} in {scope}: {minimum}' if minimum > 0
+               else f'Minimum for {shift_code} in {scope} removed')
+
+@bp.cli.command('list-coverage-minimums')
+def list_coverage_minimums_command():
+    """Show the minimum headcount per department and shift."""
+    for row in CoverageMinimum.query.order_by(CoverageMinimum.department, CoverageMinimum.shift_code):
+        click.echo(f'{row.department or "(all departments)":<30} {row.shift_code:<6} {row.minimum}')
+
+@bp.cli.command('list-rules')
+def list_rules_command():
+    """Show the discrepancy rules and shift definitions."""
+    for shift in reference_cache.shift_types():
+        hours = f'{shift.start_time:%H:%M}-{shift.end_time:%H:%M}' if shift.start_time and shift.end_time else '-'
+        click.echo(f'shift {shift.code:<6} {hours:<12} grace {shift.grace_minutes or 0} min')
+    for rule in db.session.execute(db.select(DiscrepancyRule).order_by(DiscrepancyRule.id)).scalars():
+        threshold = 'default' if rule.threshold_minutes is None else f'{rule.threshold_minutes} min'
+        click.echo(f'rule  {rule.kind:<18} {"on " if rule.enabled else "off"}  {threshold:<8} "{rule.issue}"')
+
+def calendar_changed(cells):
+    """
+    After a holiday or leave change: rebuild the month calendars and
+    re-check the affected (employee_id, date) cells, so absences on them
+    are cleared or flagged. Does not commit.
+    """
+    bump_version(CALENDAR_VERSION_KEY)
+    return evaluate_cells(cells)
+
+def ensure_open(days):
+    """check_open() for the CLI commands: holidays and leave in closed months cannot change."""
+    try:
+        check_open(days)
+    except MonthClosed as e:
+        raise click.ClickException(str(e))
+
+def location_cells(location, day):
+    """(employee_id, date) cells for everyone a holiday at ``location`` ('' = all) applies to."""
+    return [(emp.id, day) for emp in reference_cache.employees() if location in ('', emp.location or '')]
+
+@bp.cli.command('add-holiday')
+@click.argument('day', type=click.DateTime(['%Y-%m-%d']))
+@click.argument('name')
+@click.option('--location', default='', help='Only this location (default: every location).')
+def add_holiday_command(day, name, location):
+    """Add or rename a public holiday."""
+    day = day.date()
+    ensure_open([day])
+    holiday = Holiday.query.filter_by(date=day, location=location).first()
+    if holiday is None:
+        db.session.add(Holiday(date=day, location=location, name=name))
+    else:
+        holiday.name = name
+    db.session.flush()
+    calendar_changed(location_cells(location, day))
+    db.session.commit()
+    click.echo(f'{day} {name} ({location or "every location"}); regenerate the rota to roster it as Off')
+
+@bp.cli.command('import-holidays')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+def import_holidays_command(path):
+    """Add holidays from a CSV file with Date (YYYY-MM-DD), Name and optional Location columns."""
+    with open(path, newline='', encoding='utf-8-sig') as fh:
+        rows = list(csv.DictReader(fh))
+    try:
+        holidays = {(datetime.strptime(row['Date'].strip(), '%Y-%m-%d').date(), (row.get('Location') or '').strip()):
+                    (row.get('Name') or '').strip() for row in rows}
+    except (KeyError, ValueError) as e:
+        raise click.ClickException(f'Could not read {path}: {e}')
+    ensure_open(day for day, location in holidays)
+    existing = {(row.date, row.location): row for row in
+                Holiday.query.filter(Holiday.date.in_({day for day, location in holidays}))}
+    cells = []
+    for (day, location), name in holidays.items():
+        if (day, location) in existing:
+            existing[(day, location)].name = name
+        else:
+            db.session.add(Holiday(date=day, location=location, name=name))
+        cells.extend(location_cells(location, day))
+    db.session.flush()
+    calendar_changed(cells)
+    db.session.commit()
+    click.echo(f'{len(holidays)} holidays imported')
+
+@bp.cli.command('remove-holiday')
+@click.argument('day', type=click.DateTime(['%Y-%m-%d']))
+@click.option('--location', default='', help='The location the holiday was added for.')
+def remove_holiday_command(day, location):
+    """Remove a public holiday."""
+    day = day.date()
+    ensure_open([day])
+    if not Holiday.query.filter_by(date=day, location=location).delete():
+        raise click.ClickException(f'No holiday on {day} for {location or "every location"}')
+    calendar_changed(location_cells(location, day))
+    db.session.commit()
+    click.echo(f'Holiday on {day} removed')
+
+@bp.cli.command('list-holidays')
+@click.option('--year', type=int, default=lambda: date.today().year, help='Calendar year (default: this year).')
+def list_holidays_command(year):
+    """Show the holidays of a year."""
+    for row in Holiday.query.filter(Holiday.date.between(date(year, 1, 1), date(year, 12, 31))).order_by(Holiday.date, Holiday.location):
+        click.echo(f'{row.date}  {row.location or "(all locations)":<20} {row.name or ""}')
+
+@bp.cli.command('add-leave')
+@click.argument('emp_id')
+@click.argument('start', type=click.DateTime(['%Y-%m-%d']))
+@click.argument('end', type=click.DateTime(['%Y-%m-%d']))
+@click.option('--reason', help='Shown in list-leave.')
+def add_leave_command(emp_id, start, end, reason):
+    """Record approved leave for an employee from START to END (inclusive)."""
+    emp = reference_cache.employee_by_emp_id(emp_id)
+    if emp is None:
+        raise click.ClickException(f'Unknown employee {emp_id}')
+    start, end = start.date(), end.date()
+    if end < start:
+        raise click.ClickException('END is before START')
+    days = [start + timedelta(days=d) for d in range((end - start).days + 1)]
+    ensure_open(days)
+    leave = EmployeeLeave(employee_id=emp.id, start_date=start, end_date=end, reason=reason)
+    db.session.add(leave)
+    db.session.flush()
+    calendar_changed((emp.id, day) for day in days)
+    db.session.commit()
+    click.echo(f'Leave #{leave.id} for {emp.emp_id} {emp.name}: {start} to {end}')
+
+@bp.cli.command('cancel-leave')
+@click.argument('leave_id', type=int)
+def cancel_leave_command(leave_id):
+    """Remove approved leave by the number shown in list-leave."""
+    leave = db.session.get(EmployeeLeave, leave_id)
+    if leave is None:
+        raise click.ClickException(f'No leave #{leave_id}')
+    cells = [(leave.employee_id, leave.start_date + timedelta(days=d))
+             for d in range((leave.end_date - leave.start_date).days + 1)]
+    ensure_open(day for emp_id, day in cells)
+    db.session.delete(leave)
+    db.session.flush()
+    calendar_changed(cells)
+    db.session.commit()
+    click.echo(f'Leave #{leave_id} cancelled')
+
+@bp.cli.command('list-leave')
+@click.option('--emp-id', help='Only this employee.')
+@click.option('--since', type=click.DateTime(['%Y-%m-%d']), help='Leave ending on or after this date (default: today).')
+def list_leave_command(emp_id, since):
+    """Show approved leave that has not ended yet."""
+    query = EmployeeLeave.query.filter(EmployeeLeave.end_date >= (since.date() if since else date.today()))
+    if emp_id:
+        emp = reference_cache.employee_by_emp_id(emp_id)
+        if emp is None:
+            raise click.ClickException(f'Unknown employee {emp_id}')
+        query = query.filter_by(employee_id=emp.id)
+    for leave in query.order_by(EmployeeLeave.start_date, EmployeeLeave.id):
+        emp = reference_cache.employee(leave.employee_id)
+        click.echo(f'#{leave.id:<5} {emp.emp_id if emp else leave.employee_id:<12} {leave.start_date} to {leave.end_date}  {leave.reason or ""}')
+
+@bp.cli.command('set-rule')
+@click.argument('kind', type=click.Choice(sorted(RULE_KINDS)))
+@click.option('--threshold', type=int, help='Threshold in minutes (omit to keep, -1 for the default).')
+@click.option('--enable/--disable', default=None)
+@click.option('--issue', help='Text recorded on the discrepancy.')
+def set_rule_command(kind, threshold, enable, issue):
+    """Change or add a discrepancy rule; takes effect on the next evaluation in every worker."""
+    rule = DiscrepancyRule.query.filter_by(kind=kind).first()
+    if rule is None:
+        rule = DiscrepancyRule(kind=kind, issue=issue or kind.replace('_', ' ').capitalize(), enabled=True)
+        db.session.add(rule)
+    if threshold is not None:
+        rule.threshold_minutes = None if threshold < 0 else threshold
+    if enable is not None:
+        rule.enabled = enable
+    if issue:
+        rule.issue = issue
+    bump_version(RULES_VERSION_KEY)
+    db.session.commit()
+
+@bp.cli.command('set-shift')
+@click.argument('code')
+@click.option('--start', type=click.DateTime(['%H:%M']))
+@click.option('--end', type=click.DateTime(['%H:%M']))
+@click.option('--grace', type=int, help='Minutes allowed after the start before a punch counts as late.')
+def set_shift_command(code, start, end, grace):
+    """Change a shift definition (start/end times and grace period)."""
+    shift = ShiftType.query.filter_by(code=code).first()
+    if shift is None:
+        raise click.ClickException(f'Unknown shift code {code}')
+    if start:
+        shift.start_time = start.time()
+    if end:
+        shift.end_time = end.time()
+    if grace is not None:
+        shift.grace_minutes = grace
+    reference_cache.invalidate()
+    db.session.commit()
+    # Overtime depends on the shift's length
+    updated = backfill_hours()
+    db.session.commit()
+    click.echo(f'{updated} attendance records recomputed')
+    echo_closed_skipped()
+
+if __name__ == '__main__':
+    app = create_app()
+    with app.app_context():
+        init_db()
     app.run(debug=True, port=8080) 
\ No newline at end of file
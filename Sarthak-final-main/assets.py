@@ -0,0 +1,147 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+from flask import Response, abort, current_app, request, url_for
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; responses fall back to gzip
+    brotli = None
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Only these response types get compressed on the fly
+DYNAMIC_COMPRESS_TYPES = {'text/html', 'application/json'}
+STATIC_COMPRESS_TYPES = {'text/css', 'text/javascript', 'application/javascript', 'image/svg+xml'}
+MIN_COMPRESS_SIZE = 500
+
+
+def _compress(data, encoding, static=False):
+    if encoding == 'br':
+        return brotli.compress(data, quality=11 if static else 5)
+    return gzip.compress(data, compresslevel=9 if static else 6)
+
+
+def choose_encoding():
+    """Pick the best content encoding the client accepts ('br', 'gzip' or None)."""
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+class Asset:
+    """One static file held in memory; compressed variants are built on first request."""
+
+    def __init__(self, path, mimetype):
+        self.path = path
+        self.mtime = os.path.getmtime(path)
+        with open(path, 'rb') as fh:
+            self.data = fh.read()
+        self.mimetype = mimetype
+        self.digest = hashlib.sha256(self.data).hexdigest()[:12]
+        self._variants = {}
+
+    def variant(self, encoding):
+        """Return the body precompressed with ``encoding``, or None if not worth compressing."""
+        if encoding is None or self.mimetype not in STATIC_COMPRESS_TYPES:
+            return None
+        if encoding not in self._variants:
+            self._variants[encoding] = _compress(self.data, encoding, static=True)
+        return self._variants[encoding]
+
+
+class AssetManifest:
+    """
+    Maps logical static paths (``css/base.css``) to content-hashed names
+    (``css/base.3f2a9c81d0e4.css``) and serves them from memory.
+
+    Hashed names never change content, so they are sent with an immutable
+    Cache-Control. Files under ``vendor/`` live in version-named folders and
+    are also served immutable under their plain names, which keeps relative
+    ``url()`` references inside third-party CSS (e.g. Font Awesome webfonts)
+    working.
+    """
+
+    def __init__(self, static_folder):
+        self.static_folder = static_folder
+        self.assets = {}     # logical path -> Asset
+        self.hashed = {}     # hashed path -> logical path
+        self.build()
+
+    def build(self):
+        assets, hashed = {}, {}
+        for root, dirs, files in os.walk(self.static_folder):
+            for name in files:
+                path = os.path.join(root, name)
+                logical = os.path.relpath(path, self.static_folder).replace(os.sep, '/')
+                mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+                asset = assets[logical] = Asset(path, mimetype)
+                hashed[self._hashed_name(logical, asset.digest)] = logical
+        self.assets, self.hashed = assets, hashed
+
+    @staticmethod
+    def _hashed_name(logical, digest):
+        stem, ext = os.path.splitext(logical)
+        return f'{stem}.{digest}{ext}'
+
+    def url(self, logical):
+        asset = self.assets.get(logical)
+        if asset is None:
+            raise KeyError(f'Unknown static asset: {logical}')
+        # Pick up edited files while developing without restarting the server
+        if current_app.debug and os.path.getmtime(asset.path) != asset.mtime:
+            self.build()
+            asset = self.assets[logical]
+        return url_for('assets', filename=self._hashed_name(logical, asset.digest))
+
+    def lookup(self, filename):
+        logical = self.hashed.get(filename)
+        if logical is None and filename.startswith('vendor/'):
+            logical = filename
+        return self.assets.get(logical)
+
+
+def serve_asset(filename):
+    asset = current_app.extensions['assets'].lookup(filename)
+    if asset is None:
+        abort(404)
+    encoding = choose_encoding()
+    body = asset.variant(encoding)
+    response = Response(body if body is not None else asset.data, mimetype=asset.mimetype)
+    if body is not None:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    response.set_etag(f'{asset.digest}-{encoding}' if body is not None else asset.digest)
+    return response.make_conditional(request)
+
+
+def compress_response(response):
+    """Compress HTML and JSON responses for clients that accept gzip or brotli."""
+    if (response.status_code != 200
+            or response.direct_passthrough
+            or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in DYNAMIC_COMPRESS_TYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    encoding = choose_encoding()
+    if encoding is None or len(data) < MIN_COMPRESS_SIZE:
+        return response
+    response.set_data(_compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_assets(app):
+    """Build the asset manifest and register the asset route, template helper and compression."""
+    manifest = AssetManifest(app.static_folder)
+    app.extensions['assets'] = manifest
+    app.add_url_rule('/assets/<path:filename>', 'assets', serve_asset)
+    app.jinja_env.globals.update(asset_url=manifest.url)
+    app.after_request(compress_response)
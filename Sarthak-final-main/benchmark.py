@@ -0,0 +1,164 @@
+"""
+Benchmarks for the core workflows at several data sizes.
+
+Each scale gets a fresh SQLite database filled by ``synthetic_data.generate``.
+Timings are wall-clock seconds per run; results are written as JSON so runs
+from different releases can be compared.
+
+    python benchmark.py --scales 100,500,2000 --repeat 3 --output benchmark.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from models import db
+from reference_cache import reference_cache
+from synthetic_data import generate, attendance_csv
+from rollups import query_rollup, data_range
+from cache import clear_fragment_caches
+import app as attendance_app
+
+EXPORT_ENDPOINTS = [
+    'export_exceptions_excel', 'export_exceptions_pdf',
+    'export_reports_excel', 'export_reports_pdf',
+    'export_attendance_excel', 'export_attendance_pdf',
+    'export_employees_excel', 'export_employees_pdf',
+    'export_rota_excel', 'export_rota_pdf',
+    'export_hours_excel', 'export_rollup_excel', 'export_coverage_excel',
+    'export_month_bundle',
+]
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def measure(fn, repeat):
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - started)
+    return {
+        'runs': [round(r, 4) for r in runs],
+        'min': round(min(runs), 4),
+        'median': round(statistics.median(runs), 4),
+        'max': round(max(runs), 4),
+    }
+
+
+def run_scale(employees, args, workdir):
+    app = attendance_app.create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.join(workdir, f"bench_{employees}.db")}',
+        'TESTING': True,
+    })
+    # Caches are per process; each scale has its own database and starts cold
+    clear_fragment_caches()
+    client = app.test_client()
+    # The month bundle is admin only
+    with client.session_transaction() as sess:
+        sess['admin'] = True
+        sess['login_time'] = datetime.now().isoformat()
+    today = date.today()
+    next_month = (today.replace(day=28) + timedelta(days=4)).replace(day=1)
+    results = {}
+
+    def record(name, fn):
+        if any(skip in name for skip in args.skip):
+            return
+        results[name] = measure(fn, args.repeat)
+        print(f'  {name:<36} {results[name]["median"]:8.3f}s', file=sys.stderr)
+
+    def in_context(fn, *fn_args):
+        def call():
+            with app.app_context():
+                fn(*fn_args)
+        return call
+
+    def get(endpoint):
+        def call():
+            response = client.get(f'/{endpoint}' if endpoint else '/')
+            assert response.status_code == 200, f'{endpoint} returned {response.status_code}'
+            response.get_data()
+        return call
+
+    with app.app_context():
+        started = time.perf_counter()
+        counts = generate(employees=employees, departments=args.departments, months=args.months,
+                          late_rate=args.late_rate, absent_rate=args.absent_rate, seed=args.seed, reset=True)
+        seeded_in = round(time.perf_counter() - started, 4)
+        upload_employees = reference_cache.employees(active_only=True)
+    print(f'scale {employees}: {counts} seeded in {seeded_in}s', file=sys.stderr)
+
+    record('generate_monthly_rota', in_context(attendance_app.generate_monthly_rota, next_month.year, next_month.month))
+    record('process_attendance_and_exceptions',
+           in_context(attendance_app.process_attendance_and_exceptions, today.year, today.month))
+    record('reports_page', get('reports'))
+    # Rollups over everything seeded (use --months 36 for a multi-year range)
+    with app.app_context():
+        first_day, last_day = data_range()
+    record('rollup_year_by_department', in_context(query_rollup, 'year', first_day, last_day, ('department',)))
+    record('rollup_month_by_department_location',
+           in_context(query_rollup, 'month', first_day, last_day, ('department', 'location')))
+    record('rollup_week_total', in_context(query_rollup, 'week', first_day, last_day, ()))
+    for endpoint in EXPORT_ENDPOINTS:
+        record(endpoint, get(endpoint))
+
+    # Uploads go into next month so they do not change what the routes above report
+    upload = attendance_csv(next_month, upload_employees, seed=args.seed).encode()
+
+    def upload_csv():
+        response = client.post('/attendance_upload', data={'file': (io.BytesIO(upload), 'attendance.csv')})
+        assert response.status_code == 302, f'attendance_upload returned {response.status_code}'
+    record('attendance_upload', upload_csv)
+
+    return {'employees': employees, 'rows': counts, 'seed_seconds': seeded_in, 'timings': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', default='100,500', help='Comma-separated employee counts')
+    parser.add_argument('--months', type=int, default=1)
+    parser.add_argument('--departments', type=int, default=8)
+    parser.add_argument('--late-rate', type=float, default=0.08)
+    parser.add_argument('--absent-rate', type=float, default=0.03)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--skip', action='append', default=[],
+                        help='Skip benchmarks whose name contains this text (repeatable), e.g. --skip _pdf')
+    parser.add_argument('--output', default='-', help='JSON output file, or - for stdout')
+    args = parser.parse_args()
+
+    report = {
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {k: v for k, v in vars(args).items() if k != 'output'},
+        'scales': [],
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        for scale in args.scales.split(','):
+            report['scales'].append(run_scale(int(scale), args, workdir))
+
+    text = json.dumps(report, indent=2)
+    if args.output == '-':
+        print(text)
+    else:
+        with open(args.output, 'w') as fh:
+            fh.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
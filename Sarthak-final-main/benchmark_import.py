@@ -0,0 +1,117 @@
+"""
+Bulk employee import timings on a large file.
+
+Writes a synthetic employee file, then times importing it into an empty
+database, re-importing it unchanged, and importing a sync where a share of
+the rows changed, some are new and the rest of the database is deactivated.
+Each run reads the file from disk and commits, as the CLI command does.
+
+    python benchmark_import.py --rows 50000 --format xlsx
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+from models import db, Employee
+from employee_import import read_rows, import_employees
+from synthetic_data import FIRST_NAMES, LAST_NAMES, LOCATIONS, GRADES
+from benchmark import git_revision
+import app as attendance_app
+
+HEADER = ['Employee ID', 'Name', 'Designation', 'Department', 'Location', 'Grade', 'Status']
+
+
+def employee_rows(count, rng, start=1):
+    for n in range(start, start + count):
+        yield [f'E{n:07d}', f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}', 'Operator',
+               f'Department {rng.randrange(8) + 1:02d}', rng.choice(LOCATIONS), rng.choice(GRADES), 'active']
+
+
+def write_file(path, rows):
+    if path.endswith('.xlsx'):
+        from openpyxl import Workbook
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet('Employees')
+        sheet.append(HEADER)
+        for row in rows:
+            sheet.append(row)
+        workbook.save(path)
+    else:
+        with open(path, 'w', newline='') as fh:
+            writer = csv.writer(fh)
+            writer.writerow(HEADER)
+            writer.writerows(rows)
+
+
+def timed_import(path, **options):
+    started = time.perf_counter()
+    with open(path, 'rb') as stream:
+        report = import_employees(read_rows(stream, path), **options)
+    db.session.commit()
+    seconds = round(time.perf_counter() - started, 4)
+    counts = {key: report[key] for key in ('rows', 'inserted', 'updated', 'unchanged', 'deactivated', 'error_count')}
+    return {'seconds': seconds, **counts}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--format', choices=('csv', 'xlsx'), default='csv')
+    parser.add_argument('--changed', type=float, default=0.1, help='Share of rows changed in the sync file')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='-', help='JSON output file, or - for stdout')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    timings = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        initial = os.path.join(workdir, f'employees.{args.format}')
+        sync = os.path.join(workdir, f'sync.{args.format}')
+        rows = list(employee_rows(args.rows, rng))
+        write_file(initial, rows)
+        # The sync file changes a grade or location on some rows, drops a few and adds new ones
+        changed = int(args.rows * args.changed)
+        synced = [list(row) for row in rows[changed // 2:]]
+        for row in rng.sample(synced, changed):
+            row[rng.choice((4, 5))] = 'Changed'
+        synced.extend(employee_rows(changed // 2, rng, start=args.rows + 1))
+        write_file(sync, synced)
+
+        app = attendance_app.create_app({
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.join(workdir, "import.db")}',
+            'TESTING': True,
+        })
+        with app.app_context():
+            db.drop_all()
+            attendance_app.init_db()
+            timings['insert_all'] = timed_import(initial)
+            timings['unchanged'] = timed_import(initial)
+            timings['sync'] = timed_import(sync, deactivate_missing=True)
+            employees = Employee.query.count()
+        file_sizes = {name: os.path.getsize(path) for name, path in (('initial', initial), ('sync', sync))}
+
+    for name, timing in timings.items():
+        print(f'  {name:<12} {timing["seconds"]:8.3f}s  {timing}', file=sys.stderr)
+    report = {
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'settings': {k: v for k, v in vars(args).items() if k != 'output'},
+        'file_bytes': file_sizes,
+        'employees': employees,
+        'timings': timings,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output == '-':
+        print(text)
+    else:
+        with open(args.output, 'w') as fh:
+            fh.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
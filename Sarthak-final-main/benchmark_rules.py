@@ -0,0 +1,87 @@
+"""
+How discrepancy-rule evaluation cost grows with the number of rules.
+
+Seeds a synthetic database, loads one month into a MonthMatrix and times
+RuleEngine.evaluate over it with 1, 2, 4, ... rules. Rule sets beyond the
+built-in kinds repeat them with different thresholds, as a site with many
+tuned variants would.
+
+    python benchmark_rules.py --employees 2000 --rules 1,2,4,8,16,32,64
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from datetime import date, datetime
+from month_matrix import MonthMatrix
+from reference_cache import reference_cache
+from exception_rules import RuleEngine, RULE_KINDS
+from synthetic_data import generate
+from benchmark import git_revision, measure
+import app as attendance_app
+
+Rule = namedtuple('Rule', 'kind issue threshold_minutes enabled')
+
+
+def rule_set(count):
+    """``count`` enabled rules cycling through every kind with varied thresholds."""
+    kinds = sorted(RULE_KINDS)
+    return [Rule(kinds[n % len(kinds)], f'Rule {n}', 5 * (n // len(kinds)) or None, True) for n in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--employees', type=int, default=1000)
+    parser.add_argument('--rules', default='1,2,4,8,16,32,64', help='Comma-separated rule counts')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', default='-', help='JSON output file, or - for stdout')
+    args = parser.parse_args()
+
+    today = date.today()
+    with tempfile.TemporaryDirectory() as workdir:
+        app = attendance_app.create_app({
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.join(workdir, "rules.db")}',
+            'TESTING': True,
+        })
+        with app.app_context():
+            counts = generate(employees=args.employees, months=1, seed=args.seed, reset=True)
+            started = time.perf_counter()
+            matrix = MonthMatrix.load(today.year, today.month)
+            load_seconds = round(time.perf_counter() - started, 4)
+            shift_types = reference_cache.shift_types()
+    print(f'{counts}; month loaded in {load_seconds}s', file=sys.stderr)
+
+    timings = {}
+    for count in [int(n) for n in args.rules.split(',')]:
+        engine = RuleEngine(shift_types, rule_set(count))
+
+        def evaluate():
+            # A fresh frame each run, so derived columns are not reused across runs
+            for issue, mask in engine.evaluate(engine.month_frame(matrix, today)):
+                mask.nonzero()
+        timings[count] = measure(evaluate, args.repeat)
+        print(f'  {count:>4} rules {timings[count]["median"]:8.4f}s', file=sys.stderr)
+
+    report = {
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'settings': {k: v for k, v in vars(args).items() if k != 'output'},
+        'cells': int(matrix.shift.size),
+        'rows': counts,
+        'month_load_seconds': load_seconds,
+        'timings': timings,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output == '-':
+        print(text)
+    else:
+        with open(args.output, 'w') as fh:
+            fh.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+from collections import OrderedDict
+import secrets
+import threading
+import weakref
+from flask import g
+from models import db, CacheVersion
+
+# Every FragmentCache in the process, for clear_fragment_caches()
+_fragment_caches = weakref.WeakSet()
+
+
+def current_version(name):
+    """
+    Shared version stamp for ``name`` from the CacheVersion table.
+    Read at most once per app context, so every worker sees bumps made by
+    any other worker on its next request.
+    """
+    versions = g.setdefault('cache_versions', {})
+    if name not in versions:
+        versions[name] = db.session.execute(
+            db.select(CacheVersion.version).where(CacheVersion.name == name)
+        ).scalar() or 0
+    return versions[name]
+
+
+def current_versions(names):
+    """current_version() for several names, reading the ones not seen yet in one query."""
+    versions = g.setdefault('cache_versions', {})
+    missing = [name for name in names if name not in versions]
+    if missing:
+        found = dict(db.session.execute(
+            db.select(CacheVersion.name, CacheVersion.version).where(CacheVersion.name.in_(missing))
+        ).all())
+        for name in missing:
+            versions[name] = found.get(name) or 0
+    return [versions[name] for name in names]
+
+
+def bump_version(name):
+    """
+    Increment the version stamp for ``name``. Call it in the same transaction
+    as the data change; it takes effect on commit. A new stamp starts at a
+    random value rather than 1, so after the tables are dropped and recreated
+    a running process cannot mistake the new data for what it cached before.
+    """
+    updated = db.session.execute(
+        db.update(CacheVersion)
+        .where(CacheVersion.name == name)
+        .values(version=CacheVersion.version + 1)
+    ).rowcount
+    if not updated:
+        db.session.add(CacheVersion(name=name, version=secrets.randbelow(2 ** 31) + 1))
+    g.get('cache_versions', {}).pop(name, None)
+
+
+class FragmentCache:
+    """
+    Small thread-safe LRU for rendered fragments and computed results.
+    Keys should include the version stamps the value depends on, so stale
+    entries simply stop being looked up and age out.
+    """
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        _fragment_caches.add(self)
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_create(self, key, create):
+        value = self.get(key)
+        if value is None:
+            value = create()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def clear_fragment_caches():
+    """
+    Empty every FragmentCache in the process. For tests and benchmarks that
+    switch to another database, where the warm entries would skew timings.
+    """
+    for cache in list(_fragment_caches):
+        cache.clear()
@@ -0,0 +1,78 @@
+"""
+Holiday calendars per location and approved leave per employee, as
+per-month day bitsets.
+
+A MonthCalendar holds one int per location with a holiday that month and
+one per employee with leave, bit ``d - 1`` standing for day ``d``.
+Holidays with an empty location apply everywhere. Loading a month is two
+range queries; the result is cached per month and calendar version, so
+the rota generator and the discrepancy rules test a cell with a shift and
+a mask, and a whole month matrix with a few array operations.
+"""
+from collections import defaultdict
+import numpy as np
+from models import db, Holiday, EmployeeLeave
+from month_matrix import month_bounds
+from cache import FragmentCache, current_version
+
+CALENDAR_VERSION_KEY = 'calendar'
+
+month_calendars = FragmentCache(max_entries=36)
+
+
+class MonthCalendar:
+    def __init__(self, year, month, holidays, leave):
+        self.year = year
+        self.month = month
+        self.first_day, self.last_day = month_bounds(year, month)
+        self.holidays = holidays  # {location: bits}; '' = every location
+        self.leave = leave        # {employee_id: bits}
+
+    def holiday_bits(self, location):
+        return self.holidays.get('', 0) | self.holidays.get(location or '', 0)
+
+    def excused_bits(self, emp):
+        """Days the employee is not expected at work: holidays at their location and their leave."""
+        return self.holiday_bits(emp.location) | self.leave.get(emp.id, 0)
+
+    def is_holiday(self, location, day):
+        return bool(self.holiday_bits(location) >> (day.day - 1) & 1)
+
+    def on_leave(self, employee_id, day):
+        return bool(self.leave.get(employee_id, 0) >> (day.day - 1) & 1)
+
+    def excused(self, emp, day):
+        return bool(self.excused_bits(emp) >> (day.day - 1) & 1)
+
+    def excused_mask(self, employees):
+        """Boolean employees x days array of holiday or leave cells, e.g. for a MonthMatrix."""
+        bits = np.array([self.excused_bits(emp) for emp in employees], dtype=np.uint64)
+        days = np.arange(self.last_day.day, dtype=np.uint64)
+        return ((bits[:, np.newaxis] >> days) & np.uint64(1)).astype(bool)
+
+
+def _load(year, month):
+    first_day, last_day = month_bounds(year, month)
+    holidays = defaultdict(int)
+    for location, day in db.session.execute(
+            db.select(Holiday.location, Holiday.date)
+            .where(Holiday.date >= first_day, Holiday.date <= last_day)):
+        holidays[location or ''] |= 1 << (day.day - 1)
+    leave = defaultdict(int)
+    for employee_id, start, end in db.session.execute(
+            db.select(EmployeeLeave.employee_id, EmployeeLeave.start_date, EmployeeLeave.end_date)
+            .where(EmployeeLeave.end_date >= first_day, EmployeeLeave.start_date <= last_day)):
+        start, end = max(start, first_day), min(end, last_day)
+        leave[employee_id] |= ((1 << (end.day - start.day + 1)) - 1) << (start.day - 1)
+    return MonthCalendar(year, month, dict(holidays), dict(leave))
+
+
+def month_calendar(year, month):
+    """The MonthCalendar for a month, rebuilt after any holiday or leave change."""
+    key = (year, month, current_version(CALENDAR_VERSION_KEY))
+    return month_calendars.get_or_create(key, lambda: _load(year, month))
+
+
+def calendars_for(days):
+    """{(year, month): MonthCalendar} covering every date in ``days``."""
+    return {month: month_calendar(*month) for month in sorted({(day.year, day.month) for day in days})}
@@ -0,0 +1,146 @@
+"""
+Change feed of attendance, rota and discrepancy rows for downstream sync.
+
+SQLite triggers on attendance, shift_rota and exception_report append a
+ChangeLog row for every inserted, updated or deleted row, so executemany
+inserts and set-based UPDATE/DELETE statements are recorded too. ChangeLog
+ids come from an AUTOINCREMENT sequence, never reused even after pruning,
+and serve as the consumer's cursor: a poll reads the entries after it by
+primary key and then the current state of the changed rows with one IN
+query per table, so it costs the same however long the history is.
+SQLite allows one writer at a time, so an entry can never be committed
+behind a cursor that was already handed out.
+
+Consumers should treat entries as upserts keyed on (table, id): within a
+batch only the latest entry per row is returned, carrying the row as it is
+now (``null`` once deleted).
+"""
+from datetime import datetime, timedelta
+from models import db, Attendance, ShiftRota, ExceptionReport, ChangeLog
+from reference_cache import reference_cache
+
+TABLES = {'attendance': Attendance, 'shift_rota': ShiftRota, 'exception_report': ExceptionReport}
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 10000
+
+
+class CursorExpired(Exception):
+    """The entries after a cursor have been pruned; the consumer must resync from a full export."""
+
+
+def _trigger(table, operation):
+    row = 'old' if operation == 'delete' else 'new'
+    return f"""
+        CREATE TRIGGER change_log_{table}_{operation} AFTER {operation.upper()} ON {table} BEGIN
+            INSERT INTO change_log (table_name, row_id, operation, employee_id, date, changed_at)
+            VALUES ('{table}', {row}.id, '{operation}', {row}.employee_id, {row}.date, datetime('now', 'localtime'));
+        END"""
+
+
+TRIGGERS = {f'change_log_{table}_{operation}': _trigger(table, operation)
+            for table in TABLES for operation in ('insert', 'update', 'delete')}
+
+
+def feed_available():
+    return db.engine.dialect.name == 'sqlite'
+
+
+def ensure_change_triggers():
+    """Create the change_log triggers if any are missing (new database, or a table recreated)."""
+    if not feed_available():
+        return
+    existing = set(db.session.execute(db.text(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'change_log_%'")).scalars())
+    if set(TRIGGERS) <= existing:
+        return
+    for name, sql in TRIGGERS.items():
+        db.session.execute(db.text(f'DROP TRIGGER IF EXISTS {name}'))
+        db.session.execute(db.text(sql))
+
+
+def _employee_fields(employee_id):
+    emp = reference_cache.employee(employee_id) if employee_id is not None else None
+    return {'employee_id': employee_id, 'emp_id': emp.emp_id if emp else None}
+
+
+def _time(value):
+    return value.strftime('%H:%M') if value else None
+
+
+def _row(table, row):
+    """The fields sent for a row's current state."""
+    fields = {'id': row.id, **_employee_fields(row.employee_id), 'date': row.date.isoformat()}
+    if table == 'attendance':
+        fields.update(status=row.status, time_in=_time(row.time_in), time_out=_time(row.time_out),
+                      worked_minutes=row.worked_minutes, overtime_minutes=row.overtime_minutes)
+    elif table == 'shift_rota':
+        shift = reference_cache.shift_type(row.shift_type_id) if row.shift_type_id else None
+        fields['shift_code'] = shift.code if shift else None
+    else:
+        fields.update(issue=row.issue, status=row.status, notes=row.notes)
+    return fields
+
+
+def head_cursor():
+    """Cursor of the newest change, to resume from after a full export; 0 when there is none."""
+    return db.session.execute(db.select(db.func.max(ChangeLog.id))).scalar() or 0
+
+
+def changes_since(cursor, limit=DEFAULT_LIMIT):
+    """
+    (entries, next cursor, more) for up to ``limit`` changes after
+    ``cursor``; 0 starts at the oldest change kept. Raises CursorExpired
+    when entries after a later cursor were pruned.
+    """
+    oldest = db.session.execute(db.select(db.func.min(ChangeLog.id))).scalar()
+    if cursor and oldest is not None and cursor + 1 < oldest:
+        raise CursorExpired(f'Changes before {oldest} have been pruned; resync from a full export.')
+    log = db.session.execute(
+        db.select(ChangeLog).where(ChangeLog.id > cursor).order_by(ChangeLog.id).limit(limit + 1)
+    ).scalars().all()
+    more = len(log) > limit
+    log = log[:limit]
+    if not log:
+        return [], cursor, False
+    next_cursor = log[-1].id
+
+    # Latest entry per row only, in sequence order
+    latest = {(entry.table_name, entry.row_id): entry for entry in log}
+    log = sorted(latest.values(), key=lambda entry: entry.id)
+    current = {}
+    for table, model in TABLES.items():
+        ids = [entry.row_id for entry in log if entry.table_name == table and entry.operation != 'delete']
+        if ids:
+            current.update(((table, row.id), row) for row in
+                           db.session.execute(db.select(model).where(model.id.in_(ids))).scalars())
+
+    entries = []
+    for entry in log:
+        row = current.get((entry.table_name, entry.row_id))
+        entries.append({
+            'seq': entry.id,
+            'table': entry.table_name,
+            'op': entry.operation,
+            'id': entry.row_id,
+            **_employee_fields(entry.employee_id),
+            'date': entry.date.isoformat() if entry.date else None,
+            'changed_at': entry.changed_at.isoformat(),
+            'row': _row(entry.table_name, row) if row is not None else None,
+        })
+    return entries, next_cursor, more
+
+
+def prune_changes(days):
+    """
+    Delete change entries older than ``days``, always keeping the newest
+    one. Ids follow time, so only the deleted entries are scanned. Does not
+    commit. Returns the number deleted.
+    """
+    cutoff = datetime.now() - timedelta(days=days)
+    newest = db.session.execute(db.select(db.func.max(ChangeLog.id))).scalar()
+    if newest is None:
+        return 0
+    first_kept = db.session.execute(
+        db.select(ChangeLog.id).where(ChangeLog.changed_at >= cutoff).order_by(ChangeLog.id).limit(1)
+    ).scalar()
+    return db.session.execute(db.delete(ChangeLog).where(ChangeLog.id < min(first_kept or newest, newest))).rowcount
@@ -0,0 +1,32 @@
+"""
+Shared fixtures: an app on a fresh SQLite database seeded with a small
+synthetic workforce (last month and this one), and a test client logged
+in as admin.
+"""
+import os
+from datetime import datetime
+import pytest
+from cache import clear_fragment_caches
+from synthetic_data import generate
+import app as attendance_app
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = attendance_app.create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.join(tmp_path, "test.db")}',
+        'TESTING': True,
+    })
+    clear_fragment_caches()
+    with app.app_context():
+        generate(employees=5, months=2, reset=True)
+    return app
+
+
+@pytest.fixture
+def admin_client(app):
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['admin'] = True
+        sess['login_time'] = datetime.now().isoformat()
+    return client
@@ -0,0 +1,131 @@
+"""
+Staffing coverage: rostered (planned) versus attended (actual) headcount
+per date, shift and department.
+
+Counts are summed from the day-grain attendance rollups (see rollups.py),
+so a month is one grouped query however many employees there are.
+Minimum headcounts per (department, shift) live in CoverageMinimum; a row
+with an empty department applies to every department. A shift below its
+minimum is flagged even when nobody was rostered on it. Closed months are
+cached per month rollup, minimums and reference data version.
+"""
+from collections import namedtuple
+from datetime import date, timedelta
+from models import db, AttendanceRollup, CoverageMinimum
+from month_matrix import month_bounds
+from reference_cache import reference_cache
+from cache import FragmentCache, current_versions
+from rollups import NOT_WORKING, month_version_key
+
+COVERAGE_VERSION_KEY = 'coverage'
+
+# Longest range coverage() answers; every month in it is versioned and built
+MAX_MONTHS = 24
+
+CoverageCell = namedtuple('CoverageCell', 'date shift_code department planned actual minimum short')
+
+_closed_months = FragmentCache(max_entries=48)
+
+
+def minimums():
+    """{(department, shift_code): minimum headcount}; department '' is the default for all."""
+    return {(row.department, row.shift_code): row.minimum
+            for row in db.session.execute(db.select(CoverageMinimum.department, CoverageMinimum.shift_code,
+                                                    CoverageMinimum.minimum))}
+
+
+def _build_months(months, limits):
+    """{(year, month): tuple of CoverageCells} for several months from one grouped query."""
+    first_day = month_bounds(*months[0])[0]
+    last_day = month_bounds(*months[-1])[1]
+    counts = {month: {} for month in months}
+    for day, shift_code, department, planned, actual in db.session.execute(
+            db.select(AttendanceRollup.period_start, AttendanceRollup.shift_code, AttendanceRollup.department,
+                      db.func.sum(AttendanceRollup.rostered), db.func.sum(AttendanceRollup.attended))
+            .where(AttendanceRollup.grain == 'day',
+                   AttendanceRollup.period_start >= first_day,
+                   AttendanceRollup.period_start <= last_day,
+                   AttendanceRollup.shift_code.not_in(NOT_WORKING))
+            .group_by(AttendanceRollup.period_start, AttendanceRollup.shift_code, AttendanceRollup.department)):
+        month_counts = counts.get((day.year, day.month))
+        if month_counts is not None:
+            month_counts[(day, shift_code, department)] = (planned, actual)
+
+    # Shifts with a minimum must show up even on days nobody was rostered on them
+    departments = {emp.department or '' for emp in reference_cache.employees()}
+    required = {(department, shift_code) for department, shift_code in limits if department}
+    required |= {(department, shift_code) for default, shift_code in limits if not default
+                 for department in departments}
+    result = {}
+    for (year, month), month_counts in counts.items():
+        month_start, month_end = month_bounds(year, month)
+        for d in range(month_end.day):
+            day = month_start + timedelta(days=d)
+            for department, shift_code in required:
+                month_counts.setdefault((day, shift_code, department), (0, 0))
+        cells = []
+        for (day, shift_code, department), (planned, actual) in sorted(month_counts.items()):
+            minimum = limits.get((department, shift_code), limits.get(('', shift_code)))
+            cells.append(CoverageCell(day, shift_code, department, planned, actual, minimum,
+                                      minimum is not None and actual < minimum))
+        result[(year, month)] = tuple(cells)
+    return result
+
+
+def months_spanned(first_day, last_day):
+    """Calendar months touched by first_day..last_day."""
+    return (last_day.year - first_day.year) * 12 + last_day.month - first_day.month + 1
+
+
+def coverage(first_day, last_day, department=None):
+    """
+    CoverageCells from first_day to last_day, optionally for one
+    department, ordered by date, shift and department. Months not cached
+    are read together in one query. Raises ValueError for a range of more
+    than MAX_MONTHS months.
+    """
+    if months_spanned(first_day, last_day) > MAX_MONTHS:
+        raise ValueError(f'Coverage covers at most {MAX_MONTHS} months at a time.')
+    months = []
+    year, month = first_day.year, first_day.month
+    while (year, month) <= (last_day.year, last_day.month):
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    *month_versions, minimums_version = current_versions(
+        [month_version_key(year, month) for year, month in months] + [COVERAGE_VERSION_KEY])
+
+    today = date.today()
+    found, missing = {}, {}
+    for (year, month), version in zip(months, month_versions):
+        # Only closed months are cached; the current one changes all day
+        key = None
+        if month_bounds(year, month)[1] < today:
+            key = (year, month, version, minimums_version, reference_cache.version())
+            found[(year, month)] = _closed_months.get(key)
+        if found.get((year, month)) is None:
+            missing[(year, month)] = key
+    if missing:
+        built = _build_months(sorted(missing), minimums())
+        for month, key in missing.items():
+            found[month] = built[month]
+            if key is not None:
+                _closed_months.set(key, built[month])
+
+    cells = []
+    for month in months:
+        cells.extend(cell for cell in found[month] if first_day <= cell.date <= last_day
+                     and (department is None or cell.department == department))
+    return cells
+
+
+def coverage_grid(cells, days):
+    """
+    Heatmap rows for a set of cells: [(department, shift_code, [cell or
+    None for each of ``days``])] ordered by department and shift.
+    """
+    column = {day: i for i, day in enumerate(days)}
+    rows = {}
+    for cell in cells:
+        row = rows.setdefault((cell.department, cell.shift_code), [None] * len(days))
+        row[column[cell.date]] = cell
+    return [(department, shift_code, row) for (department, shift_code), row in sorted(rows.items())]
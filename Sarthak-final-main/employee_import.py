@@ -0,0 +1,157 @@
+"""
+Bulk employee import and upsert from a CSV or XLSX file keyed on emp_id.
+
+The file is streamed row by row (csv module, or openpyxl in read-only
+mode) and diffed against one SELECT of every existing employee. New
+emp_ids are inserted and changed employees updated by primary key with
+batched executemanys in one transaction, so a 50k-row file is a handful of
+statements. Blank cells, and the 'N/A' the employee export writes for
+them, leave the stored value unchanged; columns missing from the file are
+not touched. Employees absent from the file can be marked inactive, for a
+full nightly sync from HR.
+
+Nothing is written when any row has an error, so a file is applied whole
+or not at all.
+"""
+import csv
+import io
+import re
+from models import db, Employee
+from reference_cache import reference_cache
+
+FIELDS = ('emp_id', 'name', 'designation', 'location', 'department', 'grade', 'status')
+# Accepted column headings, lower-cased with spaces, dashes and underscores removed
+HEADERS = {
+    'empid': 'emp_id', 'employeeid': 'emp_id', 'name': 'name', 'employeename': 'name',
+    'designation': 'designation', 'location': 'location', 'department': 'department',
+    'grade': 'grade', 'status': 'status',
+}
+STATUSES = ('active', 'inactive')
+EMPTY_VALUES = ('', 'n/a')
+# Changes and errors listed one by one in the report; the counts cover all of them
+REPORT_SAMPLE = 200
+
+
+def _field(heading):
+    return HEADERS.get(re.sub(r'[\s_\-]', '', str(heading or '').lower()))
+
+
+def _cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)  # numeric EmpIDs read back from Excel
+    return str(value).strip()
+
+
+def read_rows(stream, filename):
+    """
+    Yield (line number, {field: value}) for each non-blank row of an
+    uploaded .csv or .xlsx file. Empty cells are left out of the dict.
+    Raises ValueError when there is no EmpID column.
+    """
+    if filename.lower().endswith('.xlsx'):
+        from openpyxl import load_workbook
+        rows = load_workbook(stream, read_only=True, data_only=True).active.iter_rows(values_only=True)
+    else:
+        rows = csv.reader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    fields = [_field(heading) for heading in next(rows, None) or ()]
+    if 'emp_id' not in fields:
+        raise ValueError('The file has no EmpID column.')
+    for line, values in enumerate(rows, start=2):
+        record = {}
+        for field, value in zip(fields, values):
+            value = _cell(value)
+            if field and value.lower() not in EMPTY_VALUES:
+                record[field] = value
+        if any(_cell(value) for value in values):
+            yield line, record
+
+
+def _update(current, changed):
+    """
+    Parameters updating one employee by primary key. Every field but name is
+    set, so the updates batch into at most two executemanys; name only when
+    it changed, since a rename re-queues the employee's discrepancies for
+    search indexing.
+    """
+    return {'id': current.id, **{field: getattr(current, field) for field in FIELDS if field != 'name'}, **changed}
+
+
+def import_employees(rows, deactivate_missing=False, dry_run=False):
+    """
+    Upsert employees from (line, record) rows as yielded by read_rows().
+    Writes nothing when any row has an error or ``dry_run`` is set, and
+    does not commit. Returns a report dict with counts, ``errors`` as
+    (line, message) and a sample of ``changes`` as (line, emp_id, change).
+    """
+    columns = [Employee.id] + [getattr(Employee, field) for field in FIELDS]
+    existing = {row.emp_id: row for row in db.session.execute(db.select(*columns))}
+    report = {'rows': 0, 'inserted': 0, 'updated': 0, 'unchanged': 0, 'activated': 0, 'deactivated': 0,
+              'errors': [], 'error_count': 0, 'changes': [], 'applied': False}
+
+    def error(line, message):
+        report['error_count'] += 1
+        if len(report['errors']) < REPORT_SAMPLE:
+            report['errors'].append((line, message))
+
+    def change(line, emp_id, text):
+        if len(report['changes']) < REPORT_SAMPLE:
+            report['changes'].append((line, emp_id, text))
+
+    seen, inserts, updates = {}, [], []
+    for line, record in rows:
+        report['rows'] += 1
+        emp_id = record.get('emp_id')
+        if not emp_id:
+            error(line, 'EmpID is missing.')
+            continue
+        if emp_id in seen:
+            error(line, f'{emp_id} already appears on line {seen[emp_id]}.')
+            continue
+        seen[emp_id] = line
+        if 'status' in record:
+            record['status'] = record['status'].lower()
+            if record['status'] not in STATUSES:
+                error(line, f'{emp_id}: status must be active or inactive, not "{record["status"]}".')
+                continue
+
+        current = existing.get(emp_id)
+        if current is None:
+            if not record.get('name'):
+                error(line, f'{emp_id}: Name is required for a new employee.')
+                continue
+            inserts.append({**dict.fromkeys(FIELDS), 'status': 'active', **record})
+            report['inserted'] += 1
+            change(line, emp_id, f'added ({record["name"]})')
+            continue
+        changed = {field: value for field, value in record.items() if getattr(current, field) != value}
+        if not changed:
+            report['unchanged'] += 1
+            continue
+        updates.append(_update(current, changed))
+        report['updated'] += 1
+        if 'status' in changed:
+            report['activated' if changed['status'] == 'active' else 'deactivated'] += 1
+        change(line, emp_id, ', '.join(f'{field}: {getattr(current, field) or "-"} -> {value}'
+                                       for field, value in changed.items()))
+
+    if deactivate_missing:
+        for emp_id, current in existing.items():
+            if emp_id not in seen and current.status != 'inactive':
+                updates.append(_update(current, {'status': 'inactive'}))
+                report['updated'] += 1
+                report['deactivated'] += 1
+                change(None, emp_id, 'status: not in file -> inactive')
+
+    if report['error_count'] or dry_run or not (inserts or updates):
+        return report
+    if inserts:
+        db.session.execute(db.insert(Employee), inserts)
+    for renamed in (True, False):
+        batch = [row for row in updates if ('name' in row) == renamed]
+        if batch:
+            db.session.execute(db.update(Employee), batch)
+    reference_cache.invalidate()
+    report['applied'] = True
+    return report
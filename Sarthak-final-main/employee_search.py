@@ -0,0 +1,109 @@
+"""
+In-memory typeahead index over employee names and emp_ids.
+
+Built from reference_cache's employee snapshot and rebuilt whenever its
+version stamp changes (the admin employee routes bump it), so lookups
+never touch the database. Lower-cased emp_ids and full names are kept in
+one sorted list and the name suffixes starting at each later word
+("gupta 695" for "Aarav Gupta 695") in another, so a prefix lookup is a
+bisect plus a scan of at most ``limit`` hits. Substring matches fill the
+remaining slots with str.find over all names joined into one string.
+"""
+from bisect import bisect_left, bisect_right
+import threading
+from reference_cache import reference_cache
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+
+class EmployeeIndex:
+    def __init__(self, employees):
+        self.employees = employees
+        starts, words = [], []
+        for position, emp in enumerate(employees):
+            name = (emp.name or '').lower()
+            starts.append((emp.emp_id.lower(), position))
+            starts.append((name, position))
+            parts = name.split()
+            for i in range(1, len(parts)):
+                words.append((' '.join(parts[i:]), position))
+        starts.sort()
+        words.sort()
+        self._starts = starts
+        self._words = words
+        # "name emp_id" lines joined by newlines, and where each line starts
+        lines = [f'{(emp.name or "").lower()} {emp.emp_id.lower()}' for emp in employees]
+        self._offsets = []
+        offset = 0
+        for line in lines:
+            self._offsets.append(offset)
+            offset += len(line) + 1
+        self._text = '\n'.join(lines)
+
+    @staticmethod
+    def _prefixed(entries, text):
+        """Positions whose key starts with ``text``, in key order."""
+        i = bisect_left(entries, (text,))
+        while i < len(entries) and entries[i][0].startswith(text):
+            yield entries[i][1]
+            i += 1
+
+    def _containing(self, text):
+        """Positions whose name or emp_id contains ``text``, in id order."""
+        found = self._text.find(text)
+        while found != -1:
+            position = bisect_right(self._offsets, found) - 1
+            yield position
+            if position + 1 >= len(self._offsets):
+                return
+            found = self._text.find(text, self._offsets[position + 1])
+
+    def search(self, text, limit=DEFAULT_LIMIT, active_only=False):
+        """
+        Up to ``limit`` employees matching ``text``: emp_id or name
+        prefixes first (alphabetically), then later name words, then
+        substrings anywhere.
+        """
+        text = ' '.join((text or '').lower().split())
+        if not text:
+            return []
+        found, seen = [], set()
+
+        def take(positions):
+            for position in positions:
+                if position in seen:
+                    continue
+                emp = self.employees[position]
+                if active_only and emp.status != 'active':
+                    continue
+                seen.add(position)
+                found.append(emp)
+                if len(found) >= limit:
+                    return True
+            return False
+
+        if take(self._prefixed(self._starts, text)) or take(self._prefixed(self._words, text)):
+            return found
+        take(self._containing(text))
+        return found
+
+
+_lock = threading.Lock()
+_index = None
+_index_version = None
+
+
+def employee_index():
+    """The index for the current reference data, rebuilt after any employee change."""
+    global _index, _index_version
+    version = reference_cache.version()
+    if _index is None or version != _index_version:
+        employees = reference_cache.employees()
+        with _lock:
+            _index, _index_version = EmployeeIndex(employees), version
+    return _index
+
+
+def search_employees(text, limit=DEFAULT_LIMIT, active_only=False):
+    return employee_index().search(text, max(1, min(limit, MAX_LIMIT)), active_only)
@@ -0,0 +1,320 @@
+"""
+Discrepancy rules.
+
+Shift definitions (start, end, grace) live on ShiftType and the rules
+themselves in the DiscrepancyRule table. RuleEngine compiles both into
+NumPy predicates over per-cell arrays (shift, attendance status, punch
+minutes). The same compiled engine runs over a whole month (a MonthMatrix)
+or over a handful of employee-days after an attendance write, and every
+rule shares the one set of derived arrays, so adding a rule adds a couple
+of array operations rather than another pass over the data.
+"""
+from datetime import date, datetime, timedelta
+from functools import cached_property
+import numpy as np
+from models import db, Employee, ShiftType, ShiftRota, Attendance, ExceptionReport, DiscrepancyRule, Holiday, EmployeeLeave
+from month_matrix import STATUS_CODES, STATUS_OTHER, NO_VALUE, minutes_after_midnight
+from reference_cache import reference_cache
+from cache import FragmentCache, current_version, bump_version
+from calendars import calendars_for
+from month_close import exclude_closed
+
+RULES_VERSION_KEY = 'rules'
+NOT_ROSTERED = ('Off', 'Leave')
+DAY_MINUTES = 24 * 60
+# The sweep flags a shift with no punch once it started this long ago
+ABSENT_AFTER = timedelta(hours=2)
+
+# Default rules: (kind, issue, threshold minutes)
+DEFAULT_RULES = [
+    ('absent', 'Absent without info (Leave not marked)', None),
+    ('late', 'Late Arrival', None),
+    ('mismatch', 'Shift mismatch', None),
+    ('early_leave', 'Early Leave', None),
+    ('missing_punch_out', 'Missing punch-out', None),
+    ('short_shift', 'Short shift', 60),
+    ('overtime', 'Overtime', 60),
+]
+
+# Up to this many cells are looked up by (date, employee_id) pairs; larger
+# batches (e.g. an upload) read their date range and filter in Python
+CELL_LOOKUP_LIMIT = 500
+
+
+def _offset(minutes, reference):
+    """Signed minutes from ``reference`` to ``minutes``, wrapped into [-12h, 12h) for overnight shifts."""
+    return (minutes - reference + DAY_MINUTES // 2) % DAY_MINUTES - DAY_MINUTES // 2
+
+
+class CellFrame:
+    """
+    The per-cell columns rules read, plus derived columns computed at most
+    once however many rules use them. Arrays may have any shape (a month
+    grid or a flat list of cells) as long as they all match.
+    """
+
+    def __init__(self, engine, slot, status, minutes_in, minutes_out, past, excused=None):
+        self.engine = engine
+        self.slot = slot
+        self.status = status
+        self.minutes_in = minutes_in.astype(np.int32)
+        self.minutes_out = minutes_out.astype(np.int32)
+        self.past = past
+        # Holiday or approved leave (see calendars.py)
+        self.excused = np.zeros(status.shape, dtype=bool) if excused is None else excused
+
+    @cached_property
+    def rostered(self):
+        return self.engine.rostered[self.slot]
+
+    @cached_property
+    def defined(self):
+        return self.engine.defined[self.slot]
+
+    @cached_property
+    def attended(self):
+        return self.status != NO_VALUE
+
+    @cached_property
+    def punched_in(self):
+        return self.rostered & (self.status == STATUS_CODES.index('P')) & (self.minutes_in != NO_VALUE)
+
+    @cached_property
+    def punched_out(self):
+        return self.punched_in & (self.minutes_out != NO_VALUE)
+
+    @cached_property
+    def grace(self):
+        return self.engine.grace[self.slot]
+
+    @cached_property
+    def late_by(self):
+        return _offset(self.minutes_in, self.engine.start[self.slot])
+
+    @cached_property
+    def left_after_end(self):
+        return _offset(self.minutes_out, self.engine.end[self.slot])
+
+    @cached_property
+    def worked(self):
+        return (self.minutes_out - self.minutes_in) % DAY_MINUTES
+
+    @cached_property
+    def scheduled(self):
+        return self.engine.length[self.slot]
+
+
+# kind -> function(frame, threshold) returning a boolean array; threshold is None for the default
+RULE_KINDS = {
+    'absent': lambda f, t: f.rostered & ~f.attended & ~f.excused & f.past,
+    'mismatch': lambda f, t: f.punched_in & ~f.defined,
+    'late': lambda f, t: f.punched_in & f.defined & (f.late_by > (f.grace if t is None else t)),
+    'early_leave': lambda f, t: f.punched_out & f.defined & (f.left_after_end < -(f.grace if t is None else t)),
+    'overtime': lambda f, t: f.punched_out & f.defined & (f.left_after_end > (60 if t is None else t)),
+    'missing_punch_out': lambda f, t: f.punched_in & (f.minutes_out == NO_VALUE) & f.past,
+    'short_shift': lambda f, t: f.punched_out & f.defined & (f.worked < f.scheduled - (60 if t is None else t)),
+}
+
+
+class RuleEngine:
+    """
+    Rules and shift definitions compiled into lookup arrays and predicates.
+
+    Shifts are addressed by slot: one per shift code plus a trailing
+    sentinel slot for "not rostered", so NO_VALUE (-1) indexes it directly.
+    """
+
+    def __init__(self, shift_types, rules):
+        self.codes = [shift.code for shift in shift_types]
+        self.slot_index = {code: i for i, code in enumerate(self.codes)}
+        size = len(self.codes) + 1
+        self.rostered = np.zeros(size, dtype=bool)
+        self.defined = np.zeros(size, dtype=bool)
+        self.start = np.zeros(size, dtype=np.int32)
+        self.end = np.zeros(size, dtype=np.int32)
+        self.length = np.zeros(size, dtype=np.int32)
+        self.grace = np.zeros(size, dtype=np.int32)
+        for i, shift in enumerate(shift_types):
+            self.rostered[i] = shift.code not in NOT_ROSTERED
+            if shift.start_time is not None and shift.end_time is not None:
+                self.defined[i] = True
+                self.start[i] = minutes_after_midnight(shift.start_time)
+                self.end[i] = minutes_after_midnight(shift.end_time)
+                self.length[i] = (self.end[i] - self.start[i]) % DAY_MINUTES or DAY_MINUTES
+                self.grace[i] = shift.grace_minutes or 0
+        self.rules = [rule for rule in rules if rule.enabled and rule.kind in RULE_KINDS]
+        self.predicates = [(rule.issue, RULE_KINDS[rule.kind], rule.threshold_minutes) for rule in self.rules]
+        # Every issue text the engine owns, so re-evaluation can clear ones that no longer apply
+        self.issues = {rule.issue for rule in rules}
+
+    def issue_for(self, kind):
+        """Issue text of the enabled rule of this kind, or None."""
+        return next((rule.issue for rule in self.rules if rule.kind == kind), None)
+
+    def evaluate(self, frame):
+        """[(issue, boolean mask)] for every enabled rule, in rule order."""
+        return [(issue, predicate(frame, threshold)) for issue, predicate, threshold in self.predicates]
+
+    def slots_for_codes(self, codes):
+        """Slot array for a sequence of shift codes (None = not rostered)."""
+        sentinel = len(self.codes)
+        return np.array([self.slot_index.get(code, sentinel) if code is not None else sentinel
+                         for code in codes], dtype=np.int32)
+
+    def month_frame(self, matrix, today=None, excused=None):
+        """
+        CellFrame over a MonthMatrix; days before ``today`` count as
+        finished. ``excused`` is the month's holiday and leave mask, if any.
+        """
+        today = today or date.today()
+        # matrix.shift indexes matrix.shift_codes; translate those to engine slots
+        lookup = np.append(self.slots_for_codes(matrix.shift_codes), len(self.codes))
+        past = np.array([day < today for day in matrix.days])[np.newaxis, :]
+        return CellFrame(self, lookup[matrix.shift], matrix.status, matrix.minutes_in, matrix.minutes_out,
+                         np.broadcast_to(past, matrix.shift.shape), excused)
+
+
+_compiled = FragmentCache(max_entries=4)
+
+
+def compiled_rules():
+    """The RuleEngine for the current shift definitions and rules, compiled once per version."""
+    key = (reference_cache.version(), current_version(RULES_VERSION_KEY))
+
+    def compile_engine():
+        # Plain rows rather than ORM objects: the engine outlives the session
+        rules = db.session.execute(db.select(*DiscrepancyRule.__table__.columns).order_by(DiscrepancyRule.id)).all()
+        return RuleEngine(reference_cache.shift_types(), rules)
+    return _compiled.get_or_create(key, compile_engine)
+
+
+def ensure_default_rules():
+    """Add any default rule kinds missing from the DiscrepancyRule table. Does not commit."""
+    present = set(db.session.execute(db.select(DiscrepancyRule.kind)).scalars())
+    missing = [{'kind': kind, 'issue': issue, 'threshold_minutes': threshold, 'enabled': True}
+               for kind, issue, threshold in DEFAULT_RULES if kind not in present]
+    if missing:
+        db.session.execute(db.insert(DiscrepancyRule), missing)
+        bump_version(RULES_VERSION_KEY)
+
+
+def rows_for_cells(columns, model, cells):
+    """Rows of ``model`` whose (employee_id, date) is one of ``cells``, oldest first."""
+    query = db.select(model.employee_id, model.date, *columns).order_by(model.id)
+    if len(cells) <= CELL_LOOKUP_LIMIT:
+        query = query.where(db.tuple_(model.date, model.employee_id).in_([(day, emp) for emp, day in cells]))
+    else:
+        query = query.where(model.date >= min(day for emp, day in cells),
+                            model.date <= max(day for emp, day in cells))
+    wanted = set(cells)
+    for row in db.session.execute(query):
+        if (row[0], row[1]) in wanted:
+            yield row
+
+
+def evaluate_cells(cells, today=None):
+    """
+    Re-run the rules for just these (employee_id, date) pairs and upsert
+    their ExceptionReport rows: a matching row is kept as is (status and
+    notes survive), a row for an issue that no longer applies is removed
+    and a new issue is added as pending. Runs in the caller's transaction
+    and does not commit. Returns the number of exceptions added.
+    """
+    cells = sorted(set(cells))
+    if not cells:
+        return 0
+    today = today or date.today()
+    engine = compiled_rules()
+    shifts = {}
+    for employee_id, day, shift_type_id in rows_for_cells((ShiftRota.shift_type_id,), ShiftRota, cells):
+        shift = reference_cache.shift_type(shift_type_id)
+        shifts[(employee_id, day)] = shift.code if shift else None
+    punches = {}
+    for employee_id, day, status, time_in, time_out in rows_for_cells(
+            (Attendance.status, Attendance.time_in, Attendance.time_out), Attendance, cells):
+        punches[(employee_id, day)] = (status, time_in, time_out)  # the latest record for the day wins
+    existing = {}
+    for employee_id, day, report_id, issue in rows_for_cells(
+            (ExceptionReport.id, ExceptionReport.issue), ExceptionReport, cells):
+        if issue in engine.issues:
+            existing.setdefault((employee_id, day), []).append((report_id, issue))
+
+    status_index = {code: i for i, code in enumerate(STATUS_CODES)}
+    status, minutes_in, minutes_out = [], [], []
+    for cell in cells:
+        code, time_in, time_out = punches.get(cell, (None, None, None))
+        status.append(NO_VALUE if cell not in punches else status_index.get(code, STATUS_OTHER))
+        minutes_in.append(minutes_after_midnight(time_in))
+        minutes_out.append(minutes_after_midnight(time_out))
+    calendars = calendars_for(day for emp, day in cells)
+    excused = []
+    for employee_id, day in cells:
+        emp = reference_cache.employee(employee_id)
+        excused.append(emp is not None and calendars[(day.year, day.month)].excused(emp, day))
+    frame = CellFrame(engine, engine.slots_for_codes([shifts.get(cell) for cell in cells]),
+                      np.array(status), np.array(minutes_in), np.array(minutes_out),
+                      np.array([day < today for emp, day in cells]), np.array(excused, dtype=bool))
+    wanted = [set() for _ in cells]
+    for issue, mask in engine.evaluate(frame):
+        for i in np.flatnonzero(mask):
+            wanted[i].add(issue)
+
+    stale, added = [], []
+    for cell, issues in zip(cells, wanted):
+        current = existing.get(cell, [])
+        stale.extend(report_id for report_id, issue in current if issue not in issues)
+        for issue in sorted(issues - {issue for report_id, issue in current}):
+            added.append({'employee_id': cell[0], 'date': cell[1], 'issue': issue, 'status': 'pending'})
+    if stale:
+        db.session.execute(db.delete(ExceptionReport).where(ExceptionReport.id.in_(stale)))
+    if added:
+        db.session.execute(db.insert(ExceptionReport), added)
+    return len(added)
+
+
+def sweep_absences(now=None, lookback_days=7):
+    """
+    Flag rostered shifts in the last ``lookback_days`` that started at least
+    ABSENT_AFTER ago and have no punch, exception, holiday or leave, outside
+    closed months. One INSERT ... SELECT driven by the rota date index; safe
+    to run as often as you like. Does not commit. Returns the number of absences flagged.
+    """
+    issue = compiled_rules().issue_for('absent')
+    if issue is None:
+        return 0
+    now = now or datetime.now()
+    today = now.date()
+    cutoff = now - ABSENT_AFTER
+    # Today's (or, just after midnight, yesterday's) shifts only count once started long enough ago
+    started = [shift.code for shift in reference_cache.shift_types()
+               if shift.start_time is not None and datetime.combine(cutoff.date(), shift.start_time) <= cutoff]
+    has_punch = db.select(Attendance.id).where(
+        Attendance.employee_id == ShiftRota.employee_id, Attendance.date == ShiftRota.date)
+    has_report = db.select(ExceptionReport.id).where(
+        ExceptionReport.employee_id == ShiftRota.employee_id, ExceptionReport.date == ShiftRota.date)
+    is_holiday = db.select(Holiday.id).where(
+        Holiday.date == ShiftRota.date, Holiday.location.in_(['', db.func.coalesce(Employee.location, '')]))
+    on_leave = db.select(EmployeeLeave.id).where(
+        EmployeeLeave.employee_id == ShiftRota.employee_id,
+        EmployeeLeave.start_date <= ShiftRota.date, EmployeeLeave.end_date >= ShiftRota.date)
+    since = today - timedelta(days=lookback_days)
+    missing = (
+        db.select(ShiftRota.employee_id, ShiftRota.date, db.literal(issue), db.literal('pending'))
+        .join(ShiftType, ShiftRota.shift_type_id == ShiftType.id)
+        .join(Employee, Employee.id == ShiftRota.employee_id)
+        .where(
+            ShiftRota.date >= since,
+            ShiftRota.date <= cutoff.date(),
+            *exclude_closed(ShiftRota.date, since, cutoff.date()),
+            ShiftType.code.not_in(NOT_ROSTERED),
+            db.or_(ShiftRota.date < cutoff.date(), ShiftType.code.in_(started)),
+            ~has_punch.exists(),
+            ~has_report.exists(),
+            ~is_holiday.exists(),
+            ~on_leave.exists(),
+        )
+    )
+    result = db.session.execute(
+        db.insert(ExceptionReport).from_select(['employee_id', 'date', 'issue', 'status'], missing)
+    )
+    return result.rowcount
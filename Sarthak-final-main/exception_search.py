@@ -0,0 +1,182 @@
+"""
+Full-text search over discrepancies with an SQLite FTS5 table.
+
+exception_search has one row per ExceptionReport (same rowid) with its
+issue, notes and employee name, plus a ``tags`` column holding a month
+token and an employee token (``m202510 e42``). Month and employee filters
+become part of the MATCH expression, so a common word like "late" is
+narrowed inside the index instead of joining every match back to
+exception_report.
+
+Triggers on exception_report and employee only queue the ids of changed
+rows in pending_search (FTS5 flushes to disk on every trigger
+statement, which made bulk inserts ten times slower); searches fold the
+queue into the index with one INSERT ... SELECT first. Status changes do
+not touch searchable columns and queue nothing.
+
+On other databases the same filters fall back to LIKE matching.
+"""
+import re
+from models import db, Employee, ExceptionReport, PendingSearch
+
+SEARCH_TABLE = 'exception_search'
+SEARCH_COLUMNS = ('issue', 'notes', 'name')
+# bm25 column weights: issue, notes, name, tags
+RANK_WEIGHTS = (4.0, 1.0, 2.0, 0.0)
+# Longer date ranges are filtered after the match rather than by month tokens
+MAX_TAG_MONTHS = 36
+
+TRIGGERS = {
+    'exception_search_insert': """
+        CREATE TRIGGER exception_search_insert AFTER INSERT ON exception_report BEGIN
+            INSERT INTO pending_search (exception_id) VALUES (new.id);
+        END""",
+    'exception_search_update': """
+        CREATE TRIGGER exception_search_update AFTER UPDATE OF issue, notes, employee_id, date ON exception_report BEGIN
+            INSERT INTO pending_search (exception_id) VALUES (new.id);
+        END""",
+    'exception_search_delete': """
+        CREATE TRIGGER exception_search_delete AFTER DELETE ON exception_report BEGIN
+            INSERT INTO pending_search (exception_id) VALUES (old.id);
+        END""",
+    'exception_search_rename': """
+        CREATE TRIGGER exception_search_rename AFTER UPDATE OF name ON employee BEGIN
+            INSERT INTO pending_search (exception_id) SELECT id FROM exception_report WHERE employee_id = new.id;
+        END""",
+}
+
+# Index row for exception_report rows, in exception_search column order
+_INDEXED = """
+    SELECT exception_report.id, exception_report.issue, exception_report.notes, employee.name,
+           'm' || strftime('%Y%m', exception_report.date) || ' e' || exception_report.employee_id
+    FROM exception_report LEFT JOIN employee ON employee.id = exception_report.employee_id"""
+_INSERT = f'INSERT INTO {SEARCH_TABLE} (rowid, issue, notes, name, tags)'
+
+search_table = db.table(SEARCH_TABLE, db.column('rowid'), *[db.column(name) for name in SEARCH_COLUMNS])
+
+
+def search_available():
+    return db.engine.dialect.name == 'sqlite'
+
+
+def ensure_search_index():
+    """
+    Create the FTS table and its triggers if missing. When any trigger was
+    missing (new database, or exception_report dropped and recreated) the
+    index is rebuilt, since rows may have been written without it.
+    """
+    if not search_available():
+        return
+    db.session.execute(db.text(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+        f"issue, notes, name, tags, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"))
+    existing = set(db.session.execute(db.text(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'exception_search_%'")).scalars())
+    if set(TRIGGERS) <= existing:
+        return
+    for name, sql in TRIGGERS.items():
+        db.session.execute(db.text(f'DROP TRIGGER IF EXISTS {name}'))
+        db.session.execute(db.text(sql))
+    rebuild_search_index()
+
+
+def rebuild_search_index():
+    """Repopulate exception_search from exception_report in one INSERT ... SELECT. Does not commit."""
+    db.session.execute(db.delete(PendingSearch))
+    db.session.execute(db.text(f'DELETE FROM {SEARCH_TABLE}'))
+    db.session.execute(db.text(f'{_INSERT} {_INDEXED}'))
+
+
+def refresh_search_index():
+    """
+    Reindex every queued discrepancy. Cheap (one SELECT) when nothing is
+    queued. Does not commit. Returns the number of queue entries folded.
+    """
+    if not search_available():
+        return 0
+    last = db.session.execute(db.select(db.func.max(PendingSearch.id))).scalar()
+    if last is None:
+        return 0
+    queued = f'SELECT exception_id FROM pending_search WHERE id <= {int(last)}'
+    db.session.execute(db.text(f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({queued})'))
+    db.session.execute(db.text(f'{_INSERT} {_INDEXED} WHERE exception_report.id IN ({queued})'))
+    return db.session.execute(db.delete(PendingSearch).where(PendingSearch.id <= last)).rowcount
+
+
+def search_terms(text):
+    """Lower-cased words of a search box entry; punctuation and FTS operators are dropped."""
+    return re.findall(r'\w+', (text or '').lower())
+
+
+def _months(first_day, last_day):
+    months = []
+    year, month = first_day.year, first_day.month
+    while (year, month) <= (last_day.year, last_day.month):
+        months.append(f'm{year}{month:02d}')
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def match_expression(text=None, issue=None, first_day=None, last_day=None, employee_id=None):
+    """
+    FTS5 query for a search box entry and issue filter (every word must
+    prefix-match issue, notes or employee name), narrowed by month and
+    employee tokens. None when there is nothing to search for.
+    """
+    terms = search_terms(text)
+    issue_terms = search_terms(issue)
+    if not terms and not issue_terms:
+        return None
+    parts = []
+    if terms:
+        parts.append('{issue notes name} : (' + ' '.join(f'"{term}"*' for term in terms) + ')')
+    if issue_terms:
+        parts.append('issue : (' + ' '.join(f'"{term}"*' for term in issue_terms) + ')')
+    if first_day is not None and last_day is not None:
+        months = _months(first_day, last_day)
+        if len(months) <= MAX_TAG_MONTHS:
+            parts.append('tags : (' + ' OR '.join(months) + ')')
+    if employee_id is not None:
+        parts.append(f'tags : e{int(employee_id)}')
+    return ' AND '.join(parts)
+
+
+def _matches(expression):
+    return db.literal_column(SEARCH_TABLE).op('MATCH')(expression)
+
+
+def search_condition(text=None, issue=None, first_day=None, last_day=None, employee_id=None):
+    """
+    WHERE condition on ExceptionReport for ``text`` and ``issue`` that also
+    works in UPDATE statements (no join), or None when neither is given.
+    """
+    if not search_available():
+        conditions = [db.or_(ExceptionReport.issue.ilike(f'%{term}%'), ExceptionReport.notes.ilike(f'%{term}%'),
+                             ExceptionReport.employee_id.in_(db.select(Employee.id).where(Employee.name.ilike(f'%{term}%'))))
+                      for term in search_terms(text)]
+        if issue:
+            conditions.append(ExceptionReport.issue.contains(issue))
+        return db.and_(*conditions) if conditions else None
+    expression = match_expression(text, issue, first_day, last_day, employee_id)
+    if expression is None:
+        return None
+    return ExceptionReport.id.in_(db.select(search_table.c.rowid).where(_matches(expression)))
+
+
+def apply_search(query, text=None, issue=None, first_day=None, last_day=None, employee_id=None):
+    """
+    Restrict a query over ExceptionReport to rows matching ``text`` and
+    ``issue``. When ``text`` has words the query is ordered best match
+    first; callers add their usual ordering after it.
+    """
+    if not search_available():
+        condition = search_condition(text, issue)
+        return query if condition is None else query.filter(condition)
+
+    expression = match_expression(text, issue, first_day, last_day, employee_id)
+    if expression is None:
+        return query
+    query = query.join(search_table, search_table.c.rowid == ExceptionReport.id).filter(_matches(expression))
+    if search_terms(text):
+        query = query.order_by(db.func.bm25(db.literal_column(SEARCH_TABLE), *RANK_WEIGHTS))
+    return query
@@ -0,0 +1,43 @@
+import io
+from flask import send_file
+
+# pandas, openpyxl and xhtml2pdf take most of the app's import time and are
+# only needed by the export routes, so they are imported on first use.
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+PDF_MIMETYPE = 'application/pdf'
+
+
+def excel_bytes(sheets):
+    """Render ``{sheet name: list of row dicts}`` into an .xlsx workbook."""
+    import pandas as pd
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        for sheet_name, rows in sheets.items():
+            pd.DataFrame(rows).to_excel(writer, index=False, sheet_name=sheet_name)
+    return output.getvalue()
+
+
+def pdf_bytes(html):
+    """Render an HTML document into a PDF."""
+    from xhtml2pdf import pisa
+    result = io.BytesIO()
+    pisa.CreatePDF(io.StringIO(html), dest=result)
+    return result.getvalue()
+
+
+def send_excel(rows, sheet_name, download_name):
+    return send_workbook({sheet_name: rows}, download_name)
+
+
+def send_workbook(sheets, download_name):
+    return send_file(io.BytesIO(excel_bytes(sheets)), download_name=download_name, as_attachment=True)
+
+
+def send_pdf(html, download_name):
+    return send_file(io.BytesIO(pdf_bytes(html)), download_name=download_name, as_attachment=True)
+
+
+def send_export(download_name, mimetype, content):
+    """Send an export built or stored as (file name, mimetype, bytes)."""
+    return send_file(io.BytesIO(content), mimetype=mimetype, download_name=download_name, as_attachment=True)
@@ -0,0 +1,19 @@
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 2))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))  # PDF exports can take a while
+
+# Import and build the app once in the master; workers are forked with it already loaded
+preload_app = True
+
+
+def post_fork(server, worker):
+    # Connections opened in the master must not be shared between forked workers;
+    # close=False drops them from this worker's pool without closing the master's
+    from wsgi import app
+    from models import db
+    with app.app_context():
+        db.engine.dispose(close=False)
@@ -0,0 +1,182 @@
+import bisect
+import logging
+import threading
+import time
+from functools import wraps
+from flask import Response, g, has_app_context, has_request_context, current_app, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SLOW_QUERY_SECONDS = 0.25
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+class Histogram:
+    """
+    Cumulative Prometheus-style histogram keyed by a tuple of label values.
+    Metrics are kept per process; with several workers each one reports
+    its own series.
+    """
+
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series = {}    # label values -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, label_values, value):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bisect.bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted(self._series.items())
+            series = [(labels, list(values)) for labels, values in series]
+        for label_values, values in series:
+            labels = ','.join(f'{k}="{_escape(v)}"' for k, v in zip(self.labels, label_values))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values[:-1]):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{labels}}} {values[-1]:.6f}')
+            lines.append(f'{self.name}_count{{{labels}}} {cumulative}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+request_duration = Histogram('http_request_duration_seconds', 'Wall time per request.',
+                             ('endpoint', 'method', 'status'), REQUEST_BUCKETS)
+request_queries = Histogram('http_request_sql_queries', 'SQL statements executed per request.',
+                            ('endpoint',), QUERY_COUNT_BUCKETS)
+request_sql_time = Histogram('http_request_sql_duration_seconds', 'Time spent in SQL per request.',
+                             ('endpoint',), REQUEST_BUCKETS)
+slow_queries = {'count': 0}
+_slow_queries_lock = threading.Lock()
+
+
+class QueryStats:
+    """SQL statement count and time for the current app context."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+def query_stats():
+    """Stats for the current app context, started on first use."""
+    if 'query_stats' not in g:
+        g.query_stats = QueryStats()
+    return g.query_stats
+
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+
+def query_budget(max_queries):
+    """
+    Declare the most SQL statements a view or function may run, whatever
+    the size of the data. Exceeding it raises QueryBudgetExceeded when the
+    app is in debug or testing mode (or ENFORCE_QUERY_BUDGETS is set) and
+    logs a warning otherwise.
+    """
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            stats = query_stats()
+            before = stats.count
+            result = f(*args, **kwargs)
+            used = stats.count - before
+            if used > max_queries:
+                message = f'{f.__name__} ran {used} SQL statements, budget is {max_queries}'
+                config = current_app.config
+                if config.get('ENFORCE_QUERY_BUDGETS', current_app.debug or config.get('TESTING')):
+                    raise QueryBudgetExceeded(message)
+                logger.warning(message)
+            return result
+        wrapper.query_budget = max_queries
+        return wrapper
+    return decorator
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+    if not has_app_context():
+        return
+    stats = query_stats()
+    stats.count += 1
+    stats.seconds += elapsed
+    if elapsed >= current_app.config.get('SLOW_QUERY_SECONDS', DEFAULT_SLOW_QUERY_SECONDS):
+        with _slow_queries_lock:
+            slow_queries['count'] += 1
+        logger.warning('Slow query (%.3fs) in %s: %s', elapsed,
+                       request.endpoint if has_request_context() else 'cli', ' '.join(statement.split())[:500])
+
+
+def _handle_error(context):
+    # Failed statements never reach after_cursor_execute
+    if context.connection is not None and context.connection.info.get('query_started'):
+        context.connection.info['query_started'].pop()
+
+
+def _start_request():
+    g.request_started = time.perf_counter()
+    g.query_stats = QueryStats()
+
+
+def _finish_request(response):
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    stats = query_stats()
+    endpoint = request.endpoint or 'unmatched'
+    request_duration.observe((endpoint, request.method, str(response.status_code)), elapsed)
+    request_queries.observe((endpoint,), stats.count)
+    request_sql_time.observe((endpoint,), stats.seconds)
+    response.headers['Server-Timing'] = (
+        f'app;dur={elapsed * 1000:.1f}, db;dur={stats.seconds * 1000:.1f};desc="{stats.count} queries"'
+    )
+    return response
+
+
+def metrics():
+    lines = []
+    for histogram in (request_duration, request_queries, request_sql_time):
+        lines.extend(histogram.render())
+    lines += [
+        '# HELP sql_slow_queries_total Statements slower than SLOW_QUERY_SECONDS.',
+        '# TYPE sql_slow_queries_total counter',
+        f'sql_slow_queries_total {slow_queries["count"]}',
+    ]
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+
+def init_instrumentation(app):
+    """Time every request and SQL statement and serve the results at /metrics."""
+    # Listen on the Engine class so engines created later (or per test app) are covered once
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+    app.config.setdefault('SLOW_QUERY_SECONDS', DEFAULT_SLOW_QUERY_SECONDS)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.add_url_rule('/metrics', 'metrics', metrics)
@@ -0,0 +1,237 @@
+"""
+Concurrent load test with mixed read/write traffic.
+
+Seeds a synthetic database, serves the app from a threaded WSGI server in
+this process and drives it from ``--clients`` concurrent clients picking
+operations by weight. Reports throughput, p50/p95/p99 latency per
+operation and SQLite lock-contention errors.
+
+    python loadtest.py --employees 500 --clients 50 --duration 60 \\
+        --mix entry=60,attendance=15,reports=10,upload=5,export=5,process=5
+
+Use --url to drive a server that is already running (e.g. gunicorn on a
+database seeded with `flask seed-synthetic`); lock errors are then only
+visible as 5xx responses.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import date
+from urllib.parse import urlencode, urlsplit
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from werkzeug.serving import make_server
+
+DEFAULT_MIX = 'entry=60,attendance=15,reports=10,upload=5,export=5,process=5'
+EXPORTS = ['export_reports_excel', 'export_exceptions_excel', 'export_employees_excel', 'export_rota_excel']
+UPLOAD_ROWS = 50
+
+
+class Client:
+    """One simulated supervisor with its own HTTP connection."""
+
+    def __init__(self, host, port, employees, rnd):
+        self.host, self.port = host, port
+        self.employee_ids = [emp_id for emp_id, code in employees]
+        self.emp_codes = [code for emp_id, code in employees]
+        self.rnd = rnd
+        self.conn = None
+
+    def request(self, method, path, body=None, headers=None):
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=120)
+            try:
+                self.conn.request(method, path, body=body, headers=headers or {})
+                response = self.conn.getresponse()
+                response.read()
+                if response.getheader('Connection', '').lower() == 'close' or response.version == 10:
+                    self.conn.close()
+                    self.conn = None
+                return response.status
+            except (ConnectionError, http.client.HTTPException):
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+
+    def entry(self):
+        minutes = 9 * 60 + self.rnd.randint(-10, 40)
+        form = urlencode({
+            'employee_id': self.rnd.choice(self.employee_ids),
+            'date': date.today().isoformat(),
+            'status': 'P',
+            'time_in': f'{minutes // 60:02d}:{minutes % 60:02d}',
+            'time_out': f'{minutes // 60 + 9:02d}:{minutes % 60:02d}',
+        })
+        return self.request('POST', '/attendance_entry', form,
+                            {'Content-Type': 'application/x-www-form-urlencoded'})
+
+    def upload(self):
+        lines = ['EmpID,Date,Status,TimeIn,TimeOut']
+        for emp_id in self.rnd.sample(self.emp_codes, min(UPLOAD_ROWS, len(self.emp_codes))):
+            lines.append(f'{emp_id},{date.today().isoformat()},P,09:0{self.rnd.randint(0, 9)},18:00')
+        boundary = uuid.uuid4().hex
+        body = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="attendance.csv"\r\n'
+                f'Content-Type: text/csv\r\n\r\n' + '\n'.join(lines) + f'\r\n--{boundary}--\r\n').encode()
+        return self.request('POST', '/attendance_upload', body,
+                            {'Content-Type': f'multipart/form-data; boundary={boundary}'})
+
+    def attendance(self):
+        return self.request('GET', '/attendance')
+
+    def reports(self):
+        return self.request('GET', '/reports')
+
+    def rota(self):
+        return self.request('GET', '/rota')
+
+    def export(self):
+        return self.request('GET', '/' + self.rnd.choice(EXPORTS))
+
+    def process(self):
+        return self.request('GET', '/process_exceptions')
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, weight = part.split('=')
+        if not hasattr(Client, name.strip()):
+            raise SystemExit(f'Unknown operation in --mix: {name}')
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return round(sorted_values[index] * 1000, 1)
+
+
+def summarize(samples, elapsed):
+    operations = {}
+    for name, results in sorted(samples.items()):
+        latencies = sorted(latency for latency, status in results)
+        operations[name] = {
+            'requests': len(results),
+            'errors': sum(1 for latency, status in results if status is None or status >= 500),
+            'per_second': round(len(results) / elapsed, 2),
+            'p50_ms': percentile(latencies, 50),
+            'p95_ms': percentile(latencies, 95),
+            'p99_ms': percentile(latencies, 99),
+            'max_ms': percentile(latencies, 100),
+        }
+    total = sum(op['requests'] for op in operations.values())
+    return {
+        'duration_s': round(elapsed, 2),
+        'requests': total,
+        'errors': sum(op['errors'] for op in operations.values()),
+        'per_second': round(total / elapsed, 2),
+        'operations': operations,
+    }
+
+
+def count_lock_errors(counter):
+    """Count 'database is locked' errors raised anywhere in this process, handled or not."""
+    def handle_error(context):
+        if 'database is locked' in str(context.original_exception):
+            with counter['lock']:
+                counter['count'] += 1
+    event.listen(Engine, 'handle_error', handle_error)
+
+
+def start_server(args, workdir):
+    from synthetic_data import generate
+    import app as attendance_app
+    database = args.database or os.path.join(workdir, 'loadtest.db')
+    app = attendance_app.create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{database}'})
+    with app.app_context():
+        if not args.database:
+            counts = generate(employees=args.employees, months=1, seed=args.seed, reset=True)
+            print(f'seeded {counts}', file=sys.stderr)
+        today = date.today()
+        attendance_app.process_attendance_and_exceptions(today.year, today.month)
+        employees = [(emp.id, emp.emp_id) for emp in attendance_app.reference_cache.employees(active_only=True)]
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, employees
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--employees', type=int, default=300, help='Synthetic dataset size')
+    parser.add_argument('--database', help='Use this existing SQLite file instead of seeding a temporary one')
+    parser.add_argument('--url', help='Drive an already running server instead of an in-process one')
+    parser.add_argument('--clients', type=int, default=20)
+    parser.add_argument('--duration', type=float, default=30, help='Seconds to run')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'Operation weights (default {DEFAULT_MIX})')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='-', help='JSON output file, or - for stdout')
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+
+    lock_errors = {'count': 0, 'lock': threading.Lock()}
+    with tempfile.TemporaryDirectory() as workdir:
+        server = None
+        if args.url:
+            target = urlsplit(args.url)
+            host, port = target.hostname, target.port or 80
+            # Matches the ids and codes `flask seed-synthetic --reset` creates
+            employees = [(n, f'EMP{n:06d}') for n in range(1, args.employees + 1)]
+        else:
+            count_lock_errors(lock_errors)
+            server, employees = start_server(args, workdir)
+            host, port = server.server_address[:2]
+
+        samples = defaultdict(list)
+        samples_lock = threading.Lock()
+        deadline = time.perf_counter() + args.duration
+        names, weights = list(mix), list(mix.values())
+
+        def worker(n):
+            rnd = random.Random(args.seed + n)
+            client = Client(host, port, employees, rnd)
+            while time.perf_counter() < deadline:
+                name = rnd.choices(names, weights)[0]
+                started = time.perf_counter()
+                try:
+                    status = getattr(client, name)()
+                except OSError:
+                    status = None
+                with samples_lock:
+                    samples[name].append((time.perf_counter() - started, status))
+
+        print(f'{args.clients} clients for {args.duration}s against {host}:{port}', file=sys.stderr)
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(args.clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        if server is not None:
+            server.shutdown()
+
+    report = summarize(samples, elapsed)
+    report['settings'] = {k: v for k, v in vars(args).items() if k != 'output'}
+    report['lock_errors'] = lock_errors['count'] if not args.url else None
+    text = json.dumps(report, indent=2)
+    if args.output == '-':
+        print(text)
+    else:
+        with open(args.output, 'w') as fh:
+            fh.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
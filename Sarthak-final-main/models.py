@@ -16,12 +16,20 @@ class ShiftType(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     code = db.Column(db.String(10), unique=True, nullable=False)  # M, E, N, G, Off, Leave
     description = db.Column(db.String(100))
+    start_time = db.Column(db.Time)  # None for Off / Leave
+    end_time = db.Column(db.Time)    # may be earlier than start_time for overnight shifts
+    grace_minutes = db.Column(db.Integer)
 
 class ShiftRota(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     employee_id = db.Column(db.Integer, db.ForeignKey('employee.id'))
     date = db.Column(db.Date, nullable=False)
     shift_type_id = db.Column(db.Integer, db.ForeignKey('shift_type.id'))
+    __table_args__ = (
+        db.Index('ix_shift_rota_date_employee', 'date', 'employee_id'),
+        # One employee's shifts over a date range, for their calendar feed
+        db.Index('ix_shift_rota_employee_date', 'employee_id', 'date'),
+    )
 
 class Attendance(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -30,6 +38,9 @@ class Attendance(db.Model):
     status = db.Column(db.String(10))  # P, A, L, E, OD
     time_in = db.Column(db.Time)
     time_out = db.Column(db.Time)
+    worked_minutes = db.Column(db.Integer)    # time_out - time_in, across midnight if needed
+    overtime_minutes = db.Column(db.Integer)  # worked beyond the rostered shift's length
+    __table_args__ = (db.Index('ix_attendance_date_employee', 'date', 'employee_id'),)
 
 class ExceptionReport(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -39,4 +50,117 @@ class ExceptionReport(db.Model):
     status = db.Column(db.String(20), default='pending')  # pending, processed, resolved
     notes = db.Column(db.Text)  # For admin comments/notes
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
-    updated_at = db.Column(db.DateTime, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp()) 
\ No newline at end of file
+    updated_at = db.Column(db.DateTime, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
+    __table_args__ = (
+        db.Index('ix_exception_report_date_employee', 'date', 'employee_id'),
+        # Covers the per-status counts of the paginated Discrepancies page
+        db.Index('ix_exception_report_date_status', 'date', 'status', 'employee_id'),
+        # Employee renames re-queue that employee's rows for search (see exception_search.py)
+        db.Index('ix_exception_report_employee', 'employee_id'),
+    )
+
+class CacheVersion(db.Model):
+    name = db.Column(db.String(50), primary_key=True)  # e.g. 'reference'
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class DiscrepancyRule(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(30), nullable=False)  # see exception_rules.RULE_KINDS
+    issue = db.Column(db.String(200), nullable=False, unique=True)  # text written to ExceptionReport.issue
+    threshold_minutes = db.Column(db.Integer)  # None = the rule's default (usually the shift's grace)
+    enabled = db.Column(db.Boolean, nullable=False, default=True)
+
+# Pre-aggregated attendance and hours, maintained by rollups.py
+class AttendanceRollup(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    grain = db.Column(db.String(10), nullable=False)  # day, week (period starts Monday) or month
+    period_start = db.Column(db.Date, nullable=False)
+    department = db.Column(db.String(100), nullable=False, default='')
+    location = db.Column(db.String(100), nullable=False, default='')
+    grade = db.Column(db.String(50), nullable=False, default='')
+    shift_code = db.Column(db.String(10), nullable=False, default='')  # '' = not rostered
+    employee_days = db.Column(db.Integer, nullable=False, default=0)
+    rostered = db.Column(db.Integer, nullable=False, default=0)  # working shifts (not Off / Leave)
+    attended = db.Column(db.Integer, nullable=False, default=0)  # working shifts with P, L, E or OD
+    present = db.Column(db.Integer, nullable=False, default=0)
+    late = db.Column(db.Integer, nullable=False, default=0)
+    early = db.Column(db.Integer, nullable=False, default=0)
+    on_duty = db.Column(db.Integer, nullable=False, default=0)
+    absent = db.Column(db.Integer, nullable=False, default=0)
+    unmarked = db.Column(db.Integer, nullable=False, default=0)  # working shifts with no attendance record
+    off = db.Column(db.Integer, nullable=False, default=0)
+    leave = db.Column(db.Integer, nullable=False, default=0)
+    worked_minutes = db.Column(db.Integer, nullable=False, default=0)
+    overtime_minutes = db.Column(db.Integer, nullable=False, default=0)
+    __table_args__ = (
+        db.Index('ux_attendance_rollup_cell', 'grain', 'period_start', 'department', 'location', 'grade',
+                 'shift_code', unique=True),
+    )
+
+# Dates whose rota or attendance changed since their rollups were last rebuilt
+class PendingRollup(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.Date, nullable=False)
+
+# Discrepancies whose full-text index entry is stale, queued by triggers (see exception_search.py)
+class PendingSearch(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    exception_id = db.Column(db.Integer, nullable=False)
+
+# Public holidays; an empty location applies to every location (see calendars.py)
+class Holiday(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.Date, nullable=False)
+    location = db.Column(db.String(100), nullable=False, default='')
+    name = db.Column(db.String(100))
+    __table_args__ = (db.Index('ux_holiday_date_location', 'date', 'location', unique=True),)
+
+# Approved leave, both dates inclusive
+class EmployeeLeave(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    employee_id = db.Column(db.Integer, db.ForeignKey('employee.id'), nullable=False)
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=False)
+    reason = db.Column(db.String(200))
+    __table_args__ = (db.Index('ix_employee_leave_end_start', 'end_date', 'start_date'),)
+
+# Row-level change sequence for attendance, rota and discrepancies, written by triggers (see change_feed.py)
+class ChangeLog(db.Model):
+    id = db.Column(db.Integer, primary_key=True)  # the feed cursor; AUTOINCREMENT so ids are never reused
+    table_name = db.Column(db.String(30), nullable=False)
+    row_id = db.Column(db.Integer, nullable=False)
+    operation = db.Column(db.String(10), nullable=False)  # insert, update, delete
+    employee_id = db.Column(db.Integer)  # of the row after the change (before it, for deletes)
+    date = db.Column(db.Date)
+    changed_at = db.Column(db.DateTime, nullable=False)
+    __table_args__ = {'sqlite_autoincrement': True}
+
+class CoverageMinimum(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    department = db.Column(db.String(100), nullable=False, default='')  # '' = every department
+    shift_code = db.Column(db.String(10), nullable=False)
+    minimum = db.Column(db.Integer, nullable=False)  # fewest people who must turn up for the shift
+    __table_args__ = (db.Index('ux_coverage_minimum', 'department', 'shift_code', unique=True),)
+
+# A month locked against edits, its reports served from the MonthArtifact rows of ``version`` (see month_close.py)
+class MonthClose(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    year = db.Column(db.Integer, nullable=False)
+    month = db.Column(db.Integer, nullable=False)
+    version = db.Column(db.Integer, nullable=False)  # the latest snapshot; kept when reopened
+    closed = db.Column(db.Boolean, nullable=False, default=True)
+    closed_at = db.Column(db.DateTime)
+    __table_args__ = (db.Index('ux_month_close_year_month', 'year', 'month', unique=True),)
+
+# One stored report or export file of a closed month; every close adds a new version
+class MonthArtifact(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    year = db.Column(db.Integer, nullable=False)
+    month = db.Column(db.Integer, nullable=False)
+    version = db.Column(db.Integer, nullable=False)
+    name = db.Column(db.String(50), nullable=False)
+    filename = db.Column(db.String(100), nullable=False)
+    mimetype = db.Column(db.String(100), nullable=False)
+    content = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+    __table_args__ = (db.Index('ux_month_artifact', 'year', 'month', 'version', 'name', unique=True),)
@@ -0,0 +1,126 @@
+"""
+Closed months: a month locked against edits, with its reports and exports
+computed once and stored.
+
+close_month() runs every month builder (the summary, the discrepancy list
+and the rota matrix as JSON, and each month export file) and stores the
+results as MonthArtifact rows under a new version number. From then on the
+report and export routes serve that month from the stored bytes, one
+indexed read, instead of recomputing it, and attendance, rota, holiday,
+leave and discrepancy changes dated in it are refused. reopen_month()
+unlocks the month; closing it again stores a fresh version, and the older
+versions are kept.
+
+The set of closed months is cached in memory and keyed by a version stamp,
+so checking whether a change touches one costs one version read.
+"""
+from datetime import date, datetime
+from models import db, MonthClose, MonthArtifact
+from month_matrix import month_bounds
+from cache import FragmentCache, current_version, bump_version
+
+CLOSED_MONTHS_VERSION_KEY = 'closed_months'
+
+_closed_months = FragmentCache(max_entries=4)
+
+
+class MonthClosed(Exception):
+    """A change was attempted in a closed month, or a closed month was closed again."""
+
+
+def month_label(year, month):
+    return date(year, month, 1).strftime('%B %Y')
+
+
+def closed_months():
+    """{(year, month): snapshot version} for every closed month."""
+    def load():
+        return {(year, month): version for year, month, version in db.session.execute(
+            db.select(MonthClose.year, MonthClose.month, MonthClose.version).where(MonthClose.closed))}
+    return _closed_months.get_or_create(current_version(CLOSED_MONTHS_VERSION_KEY), load)
+
+
+def is_closed(year, month):
+    return (year, month) in closed_months()
+
+
+def check_open(days):
+    """Raise MonthClosed if any of ``days`` falls in a closed month."""
+    closed = closed_months()
+    for year, month in sorted({(day.year, day.month) for day in days}):
+        if (year, month) in closed:
+            raise MonthClosed(f'{month_label(year, month)} is closed; reopen it to make changes.')
+
+
+def exclude_closed(column, first_day=None, last_day=None):
+    """
+    WHERE conditions keeping the date ``column`` out of every closed month,
+    or only those overlapping first_day..last_day, for set-based updates.
+    """
+    conditions = []
+    for year, month in sorted(closed_months()):
+        start, end = month_bounds(year, month)
+        if (first_day is None or end >= first_day) and (last_day is None or start <= last_day):
+            conditions.append(db.not_(column.between(start, end)))
+    return conditions
+
+
+def close_month(year, month, builders, today=None):
+    """
+    Lock a month that has ended and store its artifacts. ``builders`` maps
+    each artifact name to a function of (year, month) returning (filename,
+    mimetype, content bytes). Does not commit. Returns the new version.
+    """
+    if month_bounds(year, month)[1] >= (today or date.today()):
+        raise ValueError(f'{month_label(year, month)} has not ended yet.')
+    row = db.session.execute(db.select(MonthClose).filter_by(year=year, month=month)).scalar_one_or_none()
+    if row is not None and row.closed:
+        raise MonthClosed(f'{month_label(year, month)} is already closed.')
+    version = (row.version if row else 0) + 1
+    now = datetime.now()
+    artifacts = []
+    for name, build in builders.items():
+        filename, mimetype, content = build(year, month)
+        artifacts.append({'year': year, 'month': month, 'version': version, 'name': name, 'filename': filename,
+                          'mimetype': mimetype, 'content': content, 'created_at': now})
+    if artifacts:
+        db.session.execute(db.insert(MonthArtifact), artifacts)
+    if row is None:
+        db.session.add(MonthClose(year=year, month=month, version=version, closed=True, closed_at=now))
+    else:
+        row.version, row.closed, row.closed_at = version, True, now
+    bump_version(CLOSED_MONTHS_VERSION_KEY)
+    return version
+
+
+def reopen_month(year, month):
+    """Unlock a closed month; its stored artifacts stay until it is closed again. Does not commit."""
+    updated = db.session.execute(
+        db.update(MonthClose).where(MonthClose.year == year, MonthClose.month == month, MonthClose.closed)
+        .values(closed=False)
+    ).rowcount
+    if not updated:
+        raise MonthClosed(f'{month_label(year, month)} is not closed.')
+    bump_version(CLOSED_MONTHS_VERSION_KEY)
+
+
+def month_artifacts(year, month, names):
+    """{name: MonthArtifact} stored for a closed month; {} while the month is open."""
+    version = closed_months().get((year, month))
+    if version is None:
+        return {}
+    return {artifact.name: artifact for artifact in db.session.execute(
+        db.select(MonthArtifact).where(MonthArtifact.year == year, MonthArtifact.month == month,
+                                       MonthArtifact.version == version, MonthArtifact.name.in_(names))
+    ).scalars()}
+
+
+def month_artifact(year, month, name):
+    """The stored MonthArtifact of a closed month, or None while the month is open."""
+    return month_artifacts(year, month, [name]).get(name)
+
+
+def list_closes():
+    """MonthClose rows, latest month first."""
+    return db.session.execute(
+        db.select(MonthClose).order_by(MonthClose.year.desc(), MonthClose.month.desc())).scalars().all()
@@ -0,0 +1,174 @@
+from datetime import date, timedelta
+import numpy as np
+from models import db, ShiftType, ShiftRota, Attendance
+from reference_cache import reference_cache
+
+# Attendance status codes in the order they are stored in MonthMatrix.status
+STATUS_CODES = ['P', 'A', 'L', 'E', 'OD']
+
+NO_VALUE = -1                     # empty cell (no rota / no attendance / no punch)
+STATUS_OTHER = len(STATUS_CODES)  # attendance row exists but has an unknown status
+
+
+def month_bounds(year, month):
+    """Return (first_day, last_day) of the given month."""
+    first_day = date(year, month, 1)
+    if month == 12:
+        next_month = date(year + 1, 1, 1)
+    else:
+        next_month = date(year, month + 1, 1)
+    return first_day, next_month - timedelta(days=1)
+
+
+def minutes_after_midnight(t):
+    return t.hour * 60 + t.minute if t else NO_VALUE
+
+
+class MonthMatrix:
+    """
+    Compact employees x days view of one month's rota and attendance.
+
+    Each cell holds small integer codes instead of ORM objects:
+      shift        index into ``shift_codes`` (NO_VALUE when not rostered)
+      status       index into STATUS_CODES (NO_VALUE when no attendance row)
+      minutes_in   punch-in as minutes after midnight (NO_VALUE when missing)
+      minutes_out  punch-out as minutes after midnight (NO_VALUE when missing)
+
+    Rows follow ``employees`` (see ``employee_index``), columns follow
+    ``days`` (see ``date_index``). A cell keeps one attendance and one rota
+    row; ``status_counts`` and ``shift_counts`` (employees x codes) count
+    every row loaded, duplicates for the same day included.
+    """
+
+    def __init__(self, year, month, employees):
+        self.year = year
+        self.month = month
+        self.first_day, self.last_day = month_bounds(year, month)
+        self.days = [self.first_day + timedelta(days=d) for d in range(self.last_day.day)]
+        self.date_index = {day: i for i, day in enumerate(self.days)}
+        self.employees = employees
+        self.employee_index = {emp.id: i for i, emp in enumerate(employees)}
+        self.shift_codes = []
+        self._shift_code_index = {}
+
+        shape = (len(employees), len(self.days))
+        self.shift = np.full(shape, NO_VALUE, dtype=np.int8)
+        self.status = np.full(shape, NO_VALUE, dtype=np.int8)
+        self.minutes_in = np.full(shape, NO_VALUE, dtype=np.int16)
+        self.minutes_out = np.full(shape, NO_VALUE, dtype=np.int16)
+        self.status_counts = np.zeros((len(employees), STATUS_OTHER + 1), dtype=np.int32)
+        self.shift_counts = np.zeros((len(employees), 0), dtype=np.int32)
+
+    @classmethod
+    def load(cls, year, month, active_only=False, include_attendance=True):
+        """
+        Build the matrix for a month.
+
+        Employees come from the reference cache; rota and attendance cells
+        come back together from a single UNION ALL query. With
+        ``include_attendance=False`` only the rota is read. Rows are read in
+        id order, so when a day has several, the cell holds the latest one,
+        as evaluate_cells() and the rollups do.
+        """
+        matrix = cls(year, month, reference_cache.employees(active_only=active_only))
+
+        # Attendance rows first so the compound select takes its Time column types
+        attendance = db.select(
+            db.literal(1).label('kind'),
+            Attendance.id.label('row_id'),
+            Attendance.employee_id,
+            Attendance.date,
+            Attendance.status.label('code'),
+            Attendance.time_in,
+            Attendance.time_out
+        ).where(
+            Attendance.date >= matrix.first_day,
+            Attendance.date <= matrix.last_day
+        )
+        rota = db.select(
+            db.literal(0).label('kind'),
+            ShiftRota.id.label('row_id'),
+            ShiftRota.employee_id,
+            ShiftRota.date,
+            ShiftType.code,
+            db.null(),
+            db.null()
+        ).join(
+            ShiftType, ShiftRota.shift_type_id == ShiftType.id
+        ).where(
+            ShiftRota.date >= matrix.first_day,
+            ShiftRota.date <= matrix.last_day
+        )
+
+        status_index = {code: i for i, code in enumerate(STATUS_CODES)}
+        employee_index = matrix.employee_index
+        query = db.union_all(attendance, rota) if include_attendance else rota
+        query = query.order_by(db.literal_column('kind'), db.literal_column('row_id'))
+        status_rows, statuses, shift_rows, shifts = [], [], [], []
+        for kind, row_id, employee_id, day, code, time_in, time_out in db.session.execute(query):
+            row = employee_index.get(employee_id)
+            if row is None:
+                continue
+            col = day.day - 1
+            if kind:
+                status = status_index.get(code, STATUS_OTHER)
+                matrix.status[row, col] = status
+                matrix.minutes_in[row, col] = minutes_after_midnight(time_in)
+                matrix.minutes_out[row, col] = minutes_after_midnight(time_out)
+                status_rows.append(row)
+                statuses.append(status)
+            else:
+                shift = matrix._shift_id(code)
+                matrix.shift[row, col] = shift
+                shift_rows.append(row)
+                shifts.append(shift)
+        np.add.at(matrix.status_counts, (status_rows, statuses), 1)
+        matrix.shift_counts = np.zeros((len(matrix.employees), len(matrix.shift_codes)), dtype=np.int32)
+        np.add.at(matrix.shift_counts, (shift_rows, shifts), 1)
+        return matrix
+
+    def _shift_id(self, code):
+        index = self._shift_code_index.get(code)
+        if index is None:
+            index = self._shift_code_index[code] = len(self.shift_codes)
+            self.shift_codes.append(code)
+        return index
+
+    def summary(self):
+        """
+        Per-employee monthly counts keyed like the reports page:
+        attendance statuses plus Off/Leave days from the rota. Every row is
+        counted, so two attendance records for one day count twice, as the
+        reports always have; the grid itself keeps only one of them.
+        """
+        counts = {code: self.status_counts[:, i] for i, code in enumerate(STATUS_CODES)}
+        for code in ('Off', 'Leave'):
+            index = self._shift_code_index.get(code)
+            counts[code] = self.shift_counts[:, index] if index is not None else np.zeros(len(self.employees), dtype=int)
+        columns = {key: values.tolist() for key, values in counts.items()}
+
+        summary_data = []
+        for i, emp in enumerate(self.employees):
+            summary = {'name': emp.name}
+            for key in ('P', 'Off', 'Leave', 'A', 'L', 'E', 'OD'):
+                summary[key] = columns[key][i]
+            summary_data.append(summary)
+        return summary_data
+
+    def cells(self, mask):
+        """Yield (employee row, date) for every True cell of mask, employee-major."""
+        rows, cols = np.nonzero(mask)
+        for row, col in zip(rows.tolist(), cols.tolist()):
+            yield self.employees[row], self.days[col]
+
+    def shift_code_grid(self):
+        """
+        Pivoted rota: (employee, [shift code or None for each day]) for every
+        employee rostered at least once this month, ordered by name.
+        """
+        codes = np.array(self.shift_codes + [None], dtype=object)
+        grid = codes[self.shift]  # NO_VALUE picks the trailing None
+        rostered = np.nonzero((self.shift != NO_VALUE).any(axis=1))[0]
+        rows = [(self.employees[i], grid[i].tolist()) for i in rostered.tolist()]
+        rows.sort(key=lambda row: row[0].name)
+        return rows
@@ -0,0 +1,88 @@
+import cProfile
+import io
+import os
+import pstats
+import re
+from datetime import datetime
+from flask import current_app, request
+
+# Add ?profile=1 or send "X-Profile: 1" (as an admin) to profile one request
+PROFILE_PARAM = 'profile'
+PROFILE_HEADER = 'X-Profile'
+MAX_PROFILES = 50
+REPORT_LINES = 60
+NAME_PATTERN = re.compile(r'^[\w.-]+$')
+
+
+def profile_requested():
+    return request.args.get(PROFILE_PARAM) == '1' or request.headers.get(PROFILE_HEADER) == '1'
+
+
+def profile_dir():
+    path = os.path.join(current_app.instance_path, 'profiles')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def report_text(profiler, title):
+    """Call tree of the profile: top functions by cumulative time, then who they call."""
+    out = io.StringIO()
+    out.write(f'{title}\n\n')
+    stats = pstats.Stats(profiler, stream=out).strip_dirs().sort_stats('cumulative')
+    stats.print_stats(REPORT_LINES)
+    stats.print_callees(REPORT_LINES // 3)
+    return out.getvalue()
+
+
+def save_profile(profiler, label):
+    """
+    Write the profile as ``<name>.prof`` (for pstats/snakeviz) and
+    ``<name>.txt`` (readable report) and return ``name``. Only the newest
+    MAX_PROFILES are kept.
+    """
+    slug = re.sub(r'[^\w.-]+', '_', label).strip('_')[:60]
+    name = f'{datetime.now():%Y%m%d-%H%M%S-%f}-{slug}'
+    folder = profile_dir()
+    profiler.dump_stats(os.path.join(folder, f'{name}.prof'))
+    with open(os.path.join(folder, f'{name}.txt'), 'w') as fh:
+        fh.write(report_text(profiler, label))
+    for old in list_profiles()[MAX_PROFILES:]:
+        for ext in ('.prof', '.txt'):
+            try:
+                os.remove(os.path.join(folder, old['name'] + ext))
+            except FileNotFoundError:
+                pass
+    return name
+
+
+def profile_call(label, fn, *args, **kwargs):
+    """Run ``fn`` under the profiler and save the result; returns (fn's result, profile name)."""
+    profiler = cProfile.Profile()
+    result = profiler.runcall(fn, *args, **kwargs)
+    return result, save_profile(profiler, label)
+
+
+def list_profiles():
+    """Saved profiles, newest first."""
+    folder = profile_dir()
+    profiles = []
+    for filename in os.listdir(folder):
+        if filename.endswith('.txt'):
+            path = os.path.join(folder, filename)
+            with open(path) as fh:
+                title = fh.readline().strip()
+            profiles.append({
+                'name': filename[:-4],
+                'title': title,
+                'created': datetime.fromtimestamp(os.path.getmtime(path)),
+            })
+    profiles.sort(key=lambda p: p['name'], reverse=True)
+    return profiles
+
+
+def profile_path(name, ext):
+    """Path of a saved profile file, or None if ``name`` is not a saved profile."""
+    if not NAME_PATTERN.match(name):
+        return None
+    path = os.path.join(profile_dir(), name + ext)
+    return path if os.path.exists(path) else None
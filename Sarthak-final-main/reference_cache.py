@@ -0,0 +1,94 @@
+from collections import namedtuple
+import threading
+from models import db, Employee, ShiftType
+from cache import current_version, bump_version
+
+REFERENCE_VERSION_KEY = 'reference'
+
+# Read-only snapshots of the cached rows; attribute names match the models
+EmployeeRecord = namedtuple('EmployeeRecord', [c.key for c in Employee.__table__.columns])
+ShiftTypeRecord = namedtuple('ShiftTypeRecord', [c.key for c in ShiftType.__table__.columns])
+
+
+class ReferenceCache:
+    """
+    In-process cache of the small reference tables (Employee, ShiftType).
+
+    Rows are held as immutable snapshots indexed by id, emp_id and shift code.
+    A version stamp in the CacheVersion table is read once per app context;
+    when another worker has bumped it the whole cache is reloaded, so every
+    process sees admin edits on its next request.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._employees = []
+        self._employees_by_id = {}
+        self._employees_by_emp_id = {}
+        self._shift_types = []
+        self._shift_types_by_id = {}
+        self._shift_types_by_code = {}
+
+    def _ensure_loaded(self):
+        version = current_version(REFERENCE_VERSION_KEY)
+        if version == self._version:
+            return
+        with self._lock:
+            if version == self._version:
+                return
+            employees = [EmployeeRecord(*row) for row in db.session.execute(
+                db.select(*Employee.__table__.columns).order_by(Employee.id)
+            )]
+            shift_types = [ShiftTypeRecord(*row) for row in db.session.execute(
+                db.select(*ShiftType.__table__.columns).order_by(ShiftType.id)
+            )]
+            self._employees = employees
+            self._employees_by_id = {emp.id: emp for emp in employees}
+            self._employees_by_emp_id = {emp.emp_id: emp for emp in employees}
+            self._shift_types = shift_types
+            self._shift_types_by_id = {shift.id: shift for shift in shift_types}
+            self._shift_types_by_code = {shift.code: shift for shift in shift_types}
+            self._version = version
+
+    def employees(self, active_only=False):
+        """All employees in id order, optionally only those with status 'active'."""
+        self._ensure_loaded()
+        if active_only:
+            return [emp for emp in self._employees if emp.status == 'active']
+        return list(self._employees)
+
+    def employee(self, id):
+        self._ensure_loaded()
+        return self._employees_by_id.get(id)
+
+    def employee_by_emp_id(self, emp_id):
+        self._ensure_loaded()
+        return self._employees_by_emp_id.get(emp_id)
+
+    def shift_types(self):
+        self._ensure_loaded()
+        return list(self._shift_types)
+
+    def shift_type(self, id):
+        self._ensure_loaded()
+        return self._shift_types_by_id.get(id)
+
+    def shift_type_by_code(self, code):
+        self._ensure_loaded()
+        return self._shift_types_by_code.get(code)
+
+    def version(self):
+        """Current reference data version, for keying caches derived from it."""
+        return current_version(REFERENCE_VERSION_KEY)
+
+    def invalidate(self):
+        """
+        Bump the shared version stamp. Call this in the same transaction as
+        the change to Employee or ShiftType; it takes effect on commit.
+        """
+        bump_version(REFERENCE_VERSION_KEY)
+        self._version = None
+
+
+reference_cache = ReferenceCache()
@@ -0,0 +1,229 @@
+"""
+Attendance and hours rollups by department, location, grade and shift.
+
+AttendanceRollup holds one row per (period, department, location, grade,
+shift code) at three grains: day, week (starting Monday) and month. Day
+rows are aggregated in SQL straight from the rota and attendance; week and
+month rows are summed from the day rows. Year queries read month rows, so
+even multi-year ranges touch at most a few thousand rows.
+
+Writes only record the dates they touched (mark_dates); refresh_rollups()
+rebuilds those dates and the weeks and months containing them, bumping a
+version stamp per rebuilt month for caches built on the rollups. Rows keep
+the department/location/grade an employee had when the date was last
+rebuilt, so moving an employee does not rewrite history.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from models import db, Employee, ShiftType, ShiftRota, Attendance, AttendanceRollup, PendingRollup
+from month_matrix import month_bounds
+from cache import bump_version
+
+GRAINS = ('day', 'week', 'month', 'year')
+DIMENSIONS = ('department', 'location', 'grade', 'shift_code')
+MEASURES = ('employee_days', 'rostered', 'attended', 'present', 'late', 'early', 'on_duty', 'absent',
+            'unmarked', 'off', 'leave', 'worked_minutes', 'overtime_minutes')
+NOT_WORKING = ('', 'Off', 'Leave')
+# Dates per IN (...) list when rebuilding day rows
+DATE_CHUNK = 400
+
+
+def period_start(grain, day):
+    """First day of the week, month or year containing ``day`` (``day`` itself for 'day')."""
+    if grain == 'week':
+        return day - timedelta(days=day.weekday())
+    if grain == 'month':
+        return day.replace(day=1)
+    if grain == 'year':
+        return day.replace(month=1, day=1)
+    return day
+
+
+def month_version_key(year, month):
+    """CacheVersion name bumped whenever a month's rollups are rebuilt."""
+    return f'rollups:{year}-{month:02d}'
+
+
+def mark_dates(dates):
+    """Queue these dates for the next refresh_rollups(). Does not commit."""
+    rows = [{'date': day} for day in sorted(set(dates))]
+    if rows:
+        db.session.execute(db.insert(PendingRollup), rows)
+
+
+def pending_dates():
+    """Number of dates queued for the next refresh_rollups()."""
+    return db.session.execute(db.select(db.func.count(db.distinct(PendingRollup.date)))).scalar()
+
+
+def mark_month(year, month):
+    first_day, last_day = month_bounds(year, month)
+    mark_dates(first_day + timedelta(days=d) for d in range((last_day - first_day).days + 1))
+
+
+def _day_cells(date_filter):
+    """One row per employee-day with its shift code, latest attendance status and hours."""
+    latest = (
+        db.select(db.func.max(Attendance.id))
+        .where(date_filter(Attendance.date))
+        .group_by(Attendance.employee_id, Attendance.date)
+    )
+    attended = (
+        db.select(Attendance.employee_id, Attendance.date, ShiftType.code.label('shift_code'),
+                  Attendance.status, Attendance.worked_minutes, Attendance.overtime_minutes)
+        .outerjoin(ShiftRota, db.and_(ShiftRota.employee_id == Attendance.employee_id,
+                                      ShiftRota.date == Attendance.date))
+        .outerjoin(ShiftType, ShiftType.id == ShiftRota.shift_type_id)
+        .where(Attendance.id.in_(latest))
+    )
+    has_attendance = db.select(Attendance.id).where(
+        Attendance.employee_id == ShiftRota.employee_id, Attendance.date == ShiftRota.date)
+    rostered_only = (
+        db.select(ShiftRota.employee_id, ShiftRota.date, ShiftType.code,
+                  db.null(), db.null(), db.null())
+        .join(ShiftType, ShiftType.id == ShiftRota.shift_type_id)
+        .where(date_filter(ShiftRota.date), ~has_attendance.exists())
+    )
+    return db.union_all(attended, rostered_only).subquery()
+
+
+def _rebuild_days(date_filter):
+    """Replace the day rows selected by ``date_filter`` with fresh aggregates in one INSERT ... SELECT."""
+    cells = _day_cells(date_filter)
+    shift = db.func.coalesce(cells.c.shift_code, '')
+    working = shift.not_in(NOT_WORKING)
+
+    def count(condition):
+        return db.func.sum(db.case((condition, 1), else_=0))
+
+    dimensions = [db.func.coalesce(getattr(Employee, name), '') for name in DIMENSIONS[:-1]] + [shift]
+    aggregate = (
+        db.select(
+            db.literal('day'), cells.c.date, *dimensions,
+            db.func.count(),
+            count(working),
+            count(working & cells.c.status.in_(('P', 'L', 'E', 'OD'))),
+            count(cells.c.status == 'P'),
+            count(cells.c.status == 'L'),
+            count(cells.c.status == 'E'),
+            count(cells.c.status == 'OD'),
+            count(cells.c.status == 'A'),
+            count(working & cells.c.status.is_(None)),
+            count(shift == 'Off'),
+            count(shift == 'Leave'),
+            db.func.coalesce(db.func.sum(cells.c.worked_minutes), 0),
+            db.func.coalesce(db.func.sum(cells.c.overtime_minutes), 0),
+        )
+        .join(Employee, Employee.id == cells.c.employee_id)
+        .group_by(cells.c.date, *dimensions)
+    )
+    db.session.execute(db.delete(AttendanceRollup).where(
+        AttendanceRollup.grain == 'day', date_filter(AttendanceRollup.period_start)))
+    db.session.execute(db.insert(AttendanceRollup).from_select(
+        ['grain', 'period_start', *DIMENSIONS, *MEASURES], aggregate))
+
+
+def _rebuild_periods(first_day, last_day):
+    """Re-sum the week and month rows covering first_day..last_day from the day rows."""
+    spans = {grain: (period_start(grain, first_day), period_start(grain, last_day)) for grain in ('week', 'month')}
+    read_from = min(start for start, end in spans.values())
+    read_to = max(spans['week'][1] + timedelta(days=6), month_bounds(last_day.year, last_day.month)[1])
+    columns = [getattr(AttendanceRollup, name) for name in DIMENSIONS + MEASURES]
+    totals = defaultdict(lambda: [0] * len(MEASURES))
+    for row in db.session.execute(
+            db.select(AttendanceRollup.period_start, *columns)
+            .where(AttendanceRollup.grain == 'day',
+                   AttendanceRollup.period_start >= read_from,
+                   AttendanceRollup.period_start <= read_to)):
+        day, dims, values = row[0], tuple(row[1:len(DIMENSIONS) + 1]), row[len(DIMENSIONS) + 1:]
+        for grain, (start, end) in spans.items():
+            key_start = period_start(grain, day)
+            if start <= key_start <= end:
+                total = totals[(grain, key_start) + dims]
+                for i, value in enumerate(values):
+                    total[i] += value
+    for grain, (start, end) in spans.items():
+        db.session.execute(db.delete(AttendanceRollup).where(
+            AttendanceRollup.grain == grain,
+            AttendanceRollup.period_start >= start,
+            AttendanceRollup.period_start <= end))
+    rows = [dict(zip(('grain', 'period_start') + DIMENSIONS + MEASURES, key + tuple(values)))
+            for key, values in totals.items()]
+    if rows:
+        db.session.execute(db.insert(AttendanceRollup), rows)
+
+
+def refresh_rollups():
+    """
+    Rebuild the rollups for every queued date. Cheap (one SELECT) when
+    nothing is queued. Does not commit. Returns the number of dates rebuilt.
+    """
+    pending = db.session.execute(db.select(PendingRollup.id, PendingRollup.date)).all()
+    if not pending:
+        return 0
+    db.session.execute(db.delete(PendingRollup).where(PendingRollup.id <= max(row.id for row in pending)))
+    dates = sorted({row.date for row in pending})
+    for i in range(0, len(dates), DATE_CHUNK):
+        chunk = dates[i:i + DATE_CHUNK]
+        _rebuild_days(lambda column: column.in_(chunk))
+    # Queued dates are usually a few days of one month; rebuild periods month by month
+    by_month = defaultdict(list)
+    for day in dates:
+        by_month[(day.year, day.month)].append(day)
+    for (year, month), days in by_month.items():
+        _rebuild_periods(days[0], days[-1])
+        bump_version(month_version_key(year, month))
+    return len(dates)
+
+
+def rebuild_rollups(first_day, last_day):
+    """Rebuild every rollup between two dates, a month at a time. Does not commit."""
+    start = first_day
+    while start <= last_day:
+        end = min(last_day, month_bounds(start.year, start.month)[1])
+        _rebuild_days(lambda column: column.between(start, end))
+        _rebuild_periods(start, end)
+        bump_version(month_version_key(start.year, start.month))
+        start = end + timedelta(days=1)
+
+
+def data_range():
+    """(first, last) date with any rota or attendance, or (None, None) when there is none."""
+    dates = db.union_all(db.select(ShiftRota.date), db.select(Attendance.date)).subquery()
+    return tuple(db.session.execute(db.select(db.func.min(dates.c.date), db.func.max(dates.c.date))).one())
+
+
+def query_rollup(grain, first_day, last_day, by=('department',), filters=None):
+    """
+    Summed measures per period and ``by`` dimensions for whole periods
+    overlapping first_day..last_day, optionally restricted by ``filters``
+    ({dimension: value}) for drill-down. Returns dicts ordered by period,
+    each with attendance_pct (attended / rostered working shifts) and
+    worked/overtime hours added.
+    """
+    stored = 'month' if grain == 'year' else grain
+    group = [getattr(AttendanceRollup, name) for name in by]
+    query = (
+        db.select(AttendanceRollup.period_start, *group,
+                  *[db.func.sum(getattr(AttendanceRollup, name)) for name in MEASURES])
+        .where(AttendanceRollup.grain == stored,
+               AttendanceRollup.period_start >= period_start(grain, first_day),
+               AttendanceRollup.period_start <= last_day)
+        .group_by(AttendanceRollup.period_start, *group)
+    )
+    for name, value in (filters or {}).items():
+        query = query.where(getattr(AttendanceRollup, name) == value)
+
+    totals = defaultdict(lambda: [0] * len(MEASURES))
+    for row in db.session.execute(query):
+        total = totals[(period_start(grain, row[0]),) + tuple(row[1:len(by) + 1])]
+        for i, value in enumerate(row[len(by) + 1:]):
+            total[i] += value or 0
+    results = []
+    for key in sorted(totals):
+        result = {'period': key[0], **dict(zip(by, key[1:])), **dict(zip(MEASURES, totals[key]))}
+        result['attendance_pct'] = round(result['attended'] / result['rostered'] * 100, 1) if result['rostered'] else None
+        result['worked_hours'] = round(result['worked_minutes'] / 60, 1)
+        result['overtime_hours'] = round(result['overtime_minutes'] / 60, 1)
+        results.append(result)
+    return results
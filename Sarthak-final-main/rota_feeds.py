@@ -0,0 +1,93 @@
+"""
+Per-employee iCalendar (.ics) rota feeds for phone and desktop calendars.
+
+A feed covers a rolling window from FEED_PAST_DAYS ago to FEED_FUTURE_DAYS
+ahead: one timed event per working shift (start and end from the shift
+type, overnight shifts ending the next morning) and an all-day event per
+Leave day. Off days are left out.
+
+Rendered feeds are cached in memory per employee and keyed by the rota and
+reference data version stamps and the window's first day, so a poll that
+finds nothing changed costs one version read. The ETag is a digest of the
+employee's own shifts in the window, so when the rota is regenerated for
+everyone, clients whose shifts did not change still get 304 Not Modified.
+"""
+from datetime import datetime, timedelta, timezone
+import hashlib
+from models import db, ShiftRota
+from reference_cache import reference_cache
+from cache import FragmentCache
+
+FEED_PAST_DAYS = 7
+FEED_FUTURE_DAYS = 42
+# Around 10 KB per feed
+FEED_CACHE_SIZE = 2048
+
+rendered_feeds = FragmentCache(max_entries=FEED_CACHE_SIZE)
+
+
+def _escape(text):
+    return str(text).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def _fold(line):
+    """Split a content line into 75-character pieces as RFC 5545 requires."""
+    pieces = [line[:75]]
+    line = line[75:]
+    while line:
+        pieces.append(' ' + line[:74])
+        line = line[74:]
+    return '\r\n'.join(pieces)
+
+
+def _events(emp, shifts, stamp):
+    for day, shift in shifts:
+        lines = ['BEGIN:VEVENT', f'UID:rota-{emp.id}-{day:%Y%m%d}@attendance-system', f'DTSTAMP:{stamp}']
+        if shift.start_time is not None and shift.end_time is not None:
+            start = datetime.combine(day, shift.start_time)
+            end = datetime.combine(day, shift.end_time)
+            if end <= start:
+                end += timedelta(days=1)
+            lines += [f'DTSTART:{start:%Y%m%dT%H%M%S}', f'DTEND:{end:%Y%m%dT%H%M%S}',
+                      f'SUMMARY:{_escape(f"{shift.description or shift.code} shift ({shift.code})")}']
+        else:
+            lines += [f'DTSTART;VALUE=DATE:{day:%Y%m%d}', f'DTEND;VALUE=DATE:{day + timedelta(days=1):%Y%m%d}',
+                      f'SUMMARY:{_escape(shift.description or shift.code)}', 'TRANSP:TRANSPARENT']
+        lines.append('END:VEVENT')
+        yield from lines
+
+
+def _render(emp, first_day, last_day):
+    shifts = []
+    for day, shift_type_id in db.session.execute(
+            db.select(ShiftRota.date, ShiftRota.shift_type_id)
+            .where(ShiftRota.employee_id == emp.id, ShiftRota.date >= first_day, ShiftRota.date <= last_day)
+            .order_by(ShiftRota.date, ShiftRota.id)):
+        shift = reference_cache.shift_type(shift_type_id)
+        if shift is not None and shift.code != 'Off':
+            shifts.append((day, shift))
+    shifts = list({day: (day, shift) for day, shift in shifts}.values())  # the latest row per day wins
+
+    digest = hashlib.sha256(repr((emp.id, emp.name, [(day, shift.code, shift.description, shift.start_time,
+                                                      shift.end_time) for day, shift in shifts])).encode())
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    lines = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//Attendance System//Rota//EN',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{_escape(f"Shifts - {emp.name}")}',
+        'REFRESH-INTERVAL;VALUE=DURATION:PT1H',
+        'X-PUBLISHED-TTL:PT1H',
+        *_events(emp, shifts, stamp),
+        'END:VCALENDAR',
+    ]
+    return digest.hexdigest()[:16], '\r\n'.join(_fold(line) for line in lines) + '\r\n'
+
+
+def rota_feed(emp, today, rota_version):
+    """(etag, body) of the employee's feed for the window around ``today``."""
+    first_day = today - timedelta(days=FEED_PAST_DAYS)
+    key = (emp.id, first_day, rota_version, reference_cache.version())
+    return rendered_feeds.get_or_create(key, lambda: _render(emp, first_day, today + timedelta(days=FEED_FUTURE_DAYS)))
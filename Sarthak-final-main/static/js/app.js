@@ -0,0 +1,159 @@
+// Navbar scroll functionality
+let lastScrollTop = 0;
+const navbar = document.querySelector('.navbar');
+
+window.addEventListener('scroll', function() {
+    let scrollTop = window.pageYOffset || document.documentElement.scrollTop;
+    
+    if (scrollTop > lastScrollTop && scrollTop > 100) {
+        // Scrolling down - hide navbar
+        navbar.style.transform = 'translateY(-100%)';
+        navbar.style.transition = 'transform 0.3s ease-in-out';
+    } else {
+        // Scrolling up - show navbar
+        navbar.style.transform = 'translateY(0)';
+        navbar.style.transition = 'transform 0.3s ease-in-out';
+    }
+    
+    lastScrollTop = scrollTop;
+});
+
+// Show/hide the password on the admin login form
+function togglePassword() {
+    const passwordInput = document.getElementById('password');
+    const toggleIcon = document.getElementById('passwordToggleIcon');
+    
+    if (passwordInput.type === 'password') {
+        passwordInput.type = 'text';
+        toggleIcon.className = 'fas fa-eye-slash';
+    } else {
+        passwordInput.type = 'password';
+        toggleIcon.className = 'fas fa-eye';
+    }
+}
+
+// Employee typeahead: a text input with data-employee-search="<hidden input id>" looks
+// employees up in /api/employees/search and puts the chosen one's id in the hidden input
+// (or data-empty-value, default '', while nothing is chosen). data-active-only="1" skips
+// inactive employees.
+document.querySelectorAll('[data-employee-search]').forEach(function(input) {
+    const hidden = document.getElementById(input.dataset.employeeSearch);
+    const emptyValue = input.dataset.emptyValue || '';
+    const results = document.createElement('div');
+    results.className = 'employee-search-results list-group';
+    input.parentNode.appendChild(results);
+    let timer = null;
+    let lookup = 0;
+    let active = -1;
+
+    function close() {
+        results.innerHTML = '';
+        active = -1;
+    }
+
+    function choose(item) {
+        hidden.value = item.dataset.id;
+        input.value = item.textContent;
+        close();
+    }
+
+    function highlight(index) {
+        const items = results.children;
+        if (!items.length) return;
+        active = (index + items.length) % items.length;
+        Array.from(items).forEach(function(item, i) {
+            item.classList.toggle('active', i === active);
+        });
+        items[active].scrollIntoView({block: 'nearest'});
+    }
+
+    input.addEventListener('input', function() {
+        hidden.value = emptyValue;
+        clearTimeout(timer);
+        const text = input.value.trim();
+        if (!text) {
+            close();
+            return;
+        }
+        timer = setTimeout(function() {
+            const current = ++lookup;
+            const params = new URLSearchParams({q: text});
+            if (input.dataset.activeOnly) params.set('active', '1');
+            fetch('/api/employees/search?' + params)
+                .then(function(response) { return response.json(); })
+                .then(function(data) {
+                    if (current !== lookup) return;  // a newer lookup is on its way
+                    close();
+                    data.employees.forEach(function(emp) {
+                        const item = document.createElement('button');
+                        item.type = 'button';
+                        item.className = 'list-group-item list-group-item-action';
+                        item.dataset.id = emp.id;
+                        item.textContent = emp.name + ' (' + emp.emp_id + ')';
+                        item.addEventListener('mousedown', function(event) {
+                            event.preventDefault();
+                            choose(item);
+                        });
+                        results.appendChild(item);
+                    });
+                });
+        }, 120);
+    });
+
+    input.addEventListener('keydown', function(event) {
+        if (event.key === 'ArrowDown' || event.key === 'ArrowUp') {
+            event.preventDefault();
+            highlight(active + (event.key === 'ArrowDown' ? 1 : -1));
+        } else if (event.key === 'Enter' && active >= 0) {
+            event.preventDefault();
+            choose(results.children[active]);
+        } else if (event.key === 'Escape') {
+            close();
+        }
+    });
+
+    input.addEventListener('blur', close);
+});
+
+// Select-all checkboxes: data-select-all="<name>" ticks or clears every checkbox with that
+// name, and elements with data-selected-count="<name>" show how many are ticked
+document.querySelectorAll('[data-select-all]').forEach(function(toggle) {
+    const name = toggle.dataset.selectAll;
+    const boxes = document.querySelectorAll('input[type="checkbox"][name="' + name + '"]');
+    const counters = document.querySelectorAll('[data-selected-count="' + name + '"]');
+
+    function update() {
+        const ticked = Array.from(boxes).filter(function(box) { return box.checked; }).length;
+        counters.forEach(function(counter) { counter.textContent = ticked; });
+        toggle.checked = ticked > 0 && ticked === boxes.length;
+        toggle.indeterminate = ticked > 0 && ticked < boxes.length;
+    }
+
+    toggle.addEventListener('change', function() {
+        boxes.forEach(function(box) { box.checked = toggle.checked; });
+        update();
+    });
+    boxes.forEach(function(box) { box.addEventListener('change', update); });
+});
+
+// Modals marked data-fragment-modal load their content when opened, from the
+// data-fragment-url of the button that opened them
+document.querySelectorAll('[data-fragment-modal]').forEach(function(modal) {
+    const content = modal.querySelector('.modal-content');
+    const placeholder = content.innerHTML;
+
+    modal.addEventListener('show.bs.modal', function(event) {
+        const url = event.relatedTarget && event.relatedTarget.dataset.fragmentUrl;
+        if (!url) return;
+        content.innerHTML = placeholder;
+        fetch(url)
+            .then(function(response) {
+                if (!response.ok) throw new Error(response.statusText);
+                return response.text();
+            })
+            .then(function(html) { content.innerHTML = html; })
+            .catch(function() {
+                content.innerHTML = '<div class="modal-body text-danger">Could not load this discrepancy. Please try again.</div>';
+            });
+    });
+});
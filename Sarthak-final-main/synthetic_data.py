@@ -0,0 +1,143 @@
+"""
+Seeded synthetic data for benchmarks and load tests.
+
+    flask --app app seed-synthetic --employees 2000 --months 3 --reset
+"""
+import random
+from datetime import date, datetime, timedelta
+from models import db, Employee, ShiftType, ShiftRota, Attendance
+from month_matrix import month_bounds
+from cache import bump_version
+from reference_cache import reference_cache
+from work_hours import worked_minutes, scheduled_minutes, overtime_minutes
+from rollups import rebuild_rollups
+from app import init_db, ROTA_VERSION_KEY
+
+FIRST_NAMES = ['Aarav', 'Aditi', 'Amit', 'Ananya', 'Arjun', 'Divya', 'Farhan', 'Gauri', 'Ishaan', 'Kavya',
+               'Manoj', 'Meera', 'Nikhil', 'Pooja', 'Rahul', 'Riya', 'Sanjay', 'Sneha', 'Vikram', 'Zara']
+LAST_NAMES = ['Bagasi', 'Banerjee', 'Desai', 'Gupta', 'Iyer', 'Joshi', 'Kapoor', 'Khan', 'Mehta', 'Nair',
+              'Patel', 'Rao', 'Reddy', 'Shah', 'Sharma', 'Singh', 'Verma', 'Yadav']
+LOCATIONS = ['Plant A', 'Plant B', 'Plant C', 'Head Office']
+GRADES = ['G1', 'G2', 'G3', 'G4', 'M1']
+
+# Rotating three-shift crews work this 8-day cycle; every fourth employee works general shift
+CREW_CYCLE = ['M', 'M', 'E', 'E', 'N', 'N', 'Off', 'Off']
+
+CHUNK_SIZE = 5000
+
+
+def recent_months(count, today=None):
+    """The last ``count`` (year, month) pairs, ending with the current month."""
+    today = today or date.today()
+    year, month = today.year, today.month
+    months = []
+    for _ in range(count):
+        months.append((year, month))
+        year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+    return list(reversed(months))
+
+
+def _bulk_insert(model, rows):
+    for i in range(0, len(rows), CHUNK_SIZE):
+        db.session.execute(db.insert(model), rows[i:i + CHUNK_SIZE])
+
+
+def _punch(day, start, offset_minutes):
+    return (datetime.combine(day, start) + timedelta(minutes=offset_minutes)).time()
+
+
+def generate(employees=500, departments=8, months=1, late_rate=0.08, absent_rate=0.03,
+             leave_rate=0.02, inactive_rate=0.05, punch_jitter=6, seed=42, reset=False):
+    """
+    Populate the database with a reproducible workforce, rota and attendance.
+
+    ``late_rate``, ``absent_rate`` and ``leave_rate`` are per rostered working
+    day; ``punch_jitter`` is the standard deviation in minutes of on-time
+    punches around the shift start/end. Returns row counts per table.
+    """
+    rnd = random.Random(seed)
+    if reset:
+        db.drop_all()
+    init_db()
+    shift_types = {shift.code: shift for shift in ShiftType.query.all()}
+    shift_ids = {code: shift.id for code, shift in shift_types.items()}
+    # Scheduled length in minutes of each shift with a start and end time
+    shift_length = {code: scheduled_minutes(shift) for code, shift in shift_types.items()
+                    if scheduled_minutes(shift) is not None}
+
+    first_id = (db.session.query(db.func.max(Employee.id)).scalar() or 0) + 1
+    employee_rows = []
+    for n in range(employees):
+        employee_rows.append({
+            'id': first_id + n,
+            'emp_id': f'EMP{first_id + n:06d}',
+            'name': f'{rnd.choice(FIRST_NAMES)} {rnd.choice(LAST_NAMES)} {first_id + n}',
+            'designation': rnd.choice(['Operator', 'Technician', 'Supervisor', 'Engineer', 'Clerk']),
+            'location': rnd.choice(LOCATIONS),
+            'department': f'Department {rnd.randrange(departments) + 1:02d}',
+            'grade': rnd.choice(GRADES),
+            'status': 'inactive' if rnd.random() < inactive_rate else 'active'
+        })
+    _bulk_insert(Employee, employee_rows)
+
+    counts = {'employees': len(employee_rows), 'rota': 0, 'attendance': 0}
+    active = [row for row in employee_rows if row['status'] == 'active']
+    for year, month in recent_months(months):
+        first_day, last_day = month_bounds(year, month)
+        rota_rows, attendance_rows = [], []
+        for row in active:
+            crew = row['id'] % 4
+            for d in range((last_day - first_day).days + 1):
+                day = first_day + timedelta(days=d)
+                if crew == 0:
+                    code = 'G' if day.weekday() < 5 else 'Off'
+                else:
+                    code = CREW_CYCLE[(day.toordinal() + crew * 3) % len(CREW_CYCLE)]
+                if code != 'Off' and rnd.random() < leave_rate:
+                    code = 'Leave'
+                rota_rows.append({'employee_id': row['id'], 'date': day, 'shift_type_id': shift_ids[code]})
+
+                if code not in shift_length or rnd.random() < absent_rate:
+                    continue
+                if rnd.random() < late_rate:
+                    arrival = rnd.randint(16, 90)
+                else:
+                    arrival = min(int(rnd.gauss(-5, punch_jitter)), 14)
+                departure = shift_length[code] + int(rnd.gauss(0, punch_jitter))
+                time_in = _punch(day, shift_types[code].start_time, arrival)
+                time_out = _punch(day, shift_types[code].start_time, departure)
+                worked = worked_minutes(time_in, time_out)
+                attendance_rows.append({
+                    'employee_id': row['id'],
+                    'date': day,
+                    'status': 'P',
+                    'time_in': time_in,
+                    'time_out': time_out,
+                    'worked_minutes': worked,
+                    'overtime_minutes': overtime_minutes(worked, shift_length[code])
+                })
+        ShiftRota.query.filter(ShiftRota.date >= first_day, ShiftRota.date <= last_day,
+                               ShiftRota.employee_id >= first_id).delete()
+        _bulk_insert(ShiftRota, rota_rows)
+        _bulk_insert(Attendance, attendance_rows)
+        counts['rota'] += len(rota_rows)
+        counts['attendance'] += len(attendance_rows)
+
+    reference_cache.invalidate()
+    bump_version(ROTA_VERSION_KEY)
+    months_seeded = recent_months(months)
+    if months_seeded:
+        rebuild_rollups(date(*months_seeded[0], 1), month_bounds(*months_seeded[-1])[1])
+    db.session.commit()
+    return counts
+
+
+def attendance_csv(day, employees, seed=42, late_rate=0.08):
+    """CSV text in the attendance upload format for the given employees on one day."""
+    rnd = random.Random(seed)
+    lines = ['EmpID,Date,Status,TimeIn,TimeOut']
+    for emp in employees:
+        start = 9 * 60 + (rnd.randint(16, 90) if rnd.random() < late_rate else rnd.randint(-10, 10))
+        end = start + 9 * 60
+        lines.append(f'{emp.emp_id},{day.isoformat()},P,{start // 60:02d}:{start % 60:02d},{end // 60 % 24:02d}:{end % 60:02d}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,63 @@
+"""
+Absence rule tests: holiday and leave changes only flag days that have
+passed, and clearing the sample data removes holidays and leave too.
+
+    python -m pytest -q test_absence_rules.py
+"""
+import os
+from datetime import date, timedelta
+from models import (db, ExceptionReport, Employee, EmployeeLeave, Holiday, CoverageMinimum, MonthClose, MonthArtifact,
+                    ChangeLog)
+from month_close import closed_months
+from calendars import month_calendar
+from reference_cache import reference_cache
+from synthetic_data import generate
+import app as attendance_app
+
+
+def test_cancelling_future_leave_flags_no_absence(tmp_path):
+    app = attendance_app.create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.join(tmp_path, "absence.db")}',
+        'TESTING': True,
+    })
+    next_month = (date.today().replace(day=28) + timedelta(days=4)).replace(day=1)
+    start, end = next_month + timedelta(days=7), next_month + timedelta(days=13)
+    with app.app_context():
+        generate(employees=5, months=1, reset=True)
+        attendance_app.generate_monthly_rota(next_month.year, next_month.month)
+        emp_id = reference_cache.employees(active_only=True)[0].emp_id
+
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['add-leave', emp_id, start.isoformat(), end.isoformat()])
+    assert result.exit_code == 0, result.output
+    with app.app_context():
+        leave_id = db.session.execute(db.select(db.func.max(EmployeeLeave.id))).scalar()
+    result = runner.invoke(args=['cancel-leave', str(leave_id)])
+    assert result.exit_code == 0, result.output
+
+    with app.app_context():
+        flagged = db.session.execute(
+            db.select(db.func.count(ExceptionReport.id)).where(ExceptionReport.date.between(start, end))
+        ).scalar()
+    assert flagged == 0
+
+
+def test_clearing_sample_data_removes_leave_holidays_and_closed_months(app, admin_client):
+    last_month = date.today().replace(day=1) - timedelta(days=1)
+    with app.app_context():
+        emp = reference_cache.employees(active_only=True)[0]
+    runner = app.test_cli_runner()
+    for args in (['add-leave', emp.emp_id, last_month.replace(day=3).isoformat(), last_month.replace(day=4).isoformat()],
+                 ['add-holiday', last_month.replace(day=5).isoformat(), 'Check Day'],
+                 ['set-coverage-minimum', 'G', '2'],
+                 ['close-month', str(last_month.year), str(last_month.month)]):
+        result = runner.invoke(args=args)
+        assert result.exit_code == 0, result.output
+
+    admin_client.get('/clear-sample-data')
+    with app.app_context():
+        for model in (Employee, EmployeeLeave, Holiday, CoverageMinimum, MonthClose, MonthArtifact, ChangeLog):
+            assert db.session.execute(db.select(db.func.count()).select_from(model)).scalar() == 0, model.__name__
+        assert closed_months() == {}
+        calendar = month_calendar(last_month.year, last_month.month)
+        assert not calendar.excused(emp, last_month.replace(day=5))
@@ -0,0 +1,99 @@
+"""
+Change feed tests: cursor paging, pruning, expiry and the head cursor.
+
+    python -m pytest -q test_change_feed.py
+"""
+import json
+from datetime import date, datetime, timedelta
+from models import db, Attendance, ChangeLog
+from reference_cache import reference_cache
+from change_feed import head_cursor
+
+
+def poll(client, since, limit=100):
+    response = client.get(f'/api/changes?since={since}&limit={limit}')
+    assert response.status_code == 200, response.get_data(as_text=True)
+    *entries, last = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert int(response.headers['X-Next-Cursor']) == last['cursor']
+    return entries, last['cursor'], last['more']
+
+
+def test_paging_reaches_the_head(app):
+    client = app.test_client()
+    with app.app_context():
+        head = head_cursor()
+    cursor, seen, more = 0, [], True
+    while more:
+        entries, next_cursor, more = poll(client, cursor)
+        assert all(cursor < entry['seq'] <= next_cursor for entry in entries)
+        seen.extend(entry['seq'] for entry in entries)
+        cursor = next_cursor
+    assert cursor == head
+    assert seen == sorted(seen)
+    # Caught up: an empty page that keeps the cursor
+    assert poll(client, cursor) == ([], cursor, False)
+
+
+def test_since_zero_after_prune_then_resume(app):
+    client = app.test_client()
+    with app.app_context():
+        head = head_cursor()
+        aged = head // 2
+        db.session.execute(db.update(ChangeLog).where(ChangeLog.id <= aged)
+                           .values(changed_at=datetime.now() - timedelta(days=60)))
+        db.session.commit()
+    result = app.test_cli_runner().invoke(args=['prune-changes', '--days', '30'])
+    assert f'{aged} change entries pruned' in result.output
+
+    # A cursor behind the pruned entries has expired, and learns where to resume
+    response = client.get('/api/changes?since=1')
+    assert response.status_code == 410
+    assert response.get_json()['head'] == head
+    assert client.get('/api/changes/head').get_json() == {'cursor': head}
+
+    # since=0 bootstraps from the oldest entry kept
+    entries, cursor, more = poll(client, 0, limit=head)
+    assert not more and cursor == head
+    assert min(entry['seq'] for entry in entries) > aged
+
+    with app.app_context():
+        emp = reference_cache.employees()[0]
+        db.session.add(Attendance(employee_id=emp.id, date=date.today() + timedelta(days=40), status='P'))
+        db.session.commit()
+    entries, next_cursor, more = poll(client, cursor)
+    assert [(entry['table'], entry['op'], entry['emp_id']) for entry in entries] == [('attendance', 'insert', emp.emp_id)]
+    assert next_cursor == head + 1
+
+
+def test_expiry_boundary(app):
+    with app.app_context():
+        aged = head_cursor() // 2
+        db.session.execute(db.delete(ChangeLog).where(ChangeLog.id <= aged))
+        db.session.commit()
+    client = app.test_client()
+    # The last pruned entry is still a valid cursor: nothing after it is missing
+    entries, _, _ = poll(client, aged, limit=1)
+    assert entries[0]['seq'] == aged + 1
+    assert client.get(f'/api/changes?since={aged - 1}').status_code == 410
+
+
+def test_page_keeps_the_latest_change_per_row(app):
+    client = app.test_client()
+    with app.app_context():
+        cursor = head_cursor()
+        emp = reference_cache.employees()[0]
+        kept = Attendance(employee_id=emp.id, date=date.today() + timedelta(days=40), status='P')
+        dropped = Attendance(employee_id=emp.id, date=date.today() + timedelta(days=41), status='P')
+        db.session.add_all([kept, dropped])
+        db.session.commit()
+        kept.status = 'A'
+        db.session.commit()
+        db.session.delete(dropped)
+        db.session.commit()
+        kept_id, dropped_id = kept.id, dropped.id
+
+    entries, next_cursor, more = poll(client, cursor)
+    assert next_cursor == cursor + 4 and not more
+    assert [(entry['id'], entry['op']) for entry in entries] == [(kept_id, 'update'), (dropped_id, 'delete')]
+    assert entries[0]['row']['status'] == 'A'
+    assert entries[1]['row'] is None
@@ -0,0 +1,96 @@
+"""
+Employee import tests: the upsert, the diff report and all-or-nothing writes.
+
+    python -m pytest -q test_employee_import.py
+"""
+import io
+from models import db, Employee
+from employee_import import read_rows, import_employees
+
+
+def employees(app):
+    with app.app_context():
+        return {emp.emp_id: emp for emp in db.session.execute(db.select(Employee)).scalars()}
+
+
+def run_import(app, text, **options):
+    with app.app_context():
+        report = import_employees(read_rows(io.BytesIO(text.encode()), 'employees.csv'), **options)
+        db.session.commit()
+        return report
+
+
+def test_import_inserts_updates_and_leaves_blank_cells(app):
+    before = employees(app)
+    first, second, third = sorted(before)[:3]
+    report = run_import(app, (
+        'Emp ID,Name,Designation,Location,Status\n'
+        f'{first},{before[first].name},Team Lead,,\n'
+        f'{second},{before[second].name},N/A,{before[second].location},INACTIVE\n'
+        f'{third},{before[third].name},{before[third].designation},{before[third].location},{before[third].status}\n'
+        '\n'
+        'NEW001,New Starter,Analyst,Pune,\n'))
+
+    assert report['applied']
+    assert {key: report[key] for key in ('rows', 'inserted', 'updated', 'unchanged', 'deactivated')} == {
+        'rows': 4, 'inserted': 1, 'updated': 2, 'unchanged': 1, 'deactivated': 1}
+    assert report['changes'] == [
+        (2, first, f'designation: {before[first].designation or "-"} -> Team Lead'),
+        (3, second, 'status: active -> inactive'),
+        (6, 'NEW001', 'added (New Starter)'),
+    ]
+    after = employees(app)
+    assert after[first].designation == 'Team Lead'
+    assert after[first].location == before[first].location
+    assert after[second].designation == before[second].designation
+    assert after[second].status == 'inactive'
+    assert (after['NEW001'].name, after['NEW001'].location, after['NEW001'].status) == ('New Starter', 'Pune', 'active')
+    assert len(after) == len(before) + 1
+
+
+def test_any_row_error_writes_nothing(app):
+    before = employees(app)
+    first = min(before)
+    report = run_import(app, (
+        'EmpID,Name,Designation\n'
+        f'{first},{before[first].name},Team Lead\n'
+        f'{first},{before[first].name},Manager\n'
+        'NEW001,,Analyst\n'
+        'NEW002,Someone,Analyst\n'))
+
+    assert not report['applied']
+    assert report['error_count'] == 2
+    assert [line for line, _ in report['errors']] == [3, 4]
+    after = employees(app)
+    assert set(after) == set(before)
+    assert after[first].designation == before[first].designation
+
+
+def test_deactivate_missing_and_dry_run(app):
+    before = employees(app)
+    kept = min(before)
+    text = f'EmpID,Name\n{kept},{before[kept].name}\n'
+
+    report = run_import(app, text, deactivate_missing=True, dry_run=True)
+    assert not report['applied']
+    assert report['deactivated'] == len(before) - 1
+    assert {emp.status for emp in employees(app).values()} == {'active'}
+
+    report = run_import(app, text, deactivate_missing=True)
+    assert report['applied']
+    assert {emp_id: emp.status for emp_id, emp in employees(app).items()} == {
+        emp_id: 'active' if emp_id == kept else 'inactive' for emp_id in before}
+
+
+def test_cli_reports_errors_and_keeps_the_file_out(app, tmp_path):
+    path = tmp_path / 'employees.csv'
+    path.write_text('EmpID,Name\nNEW001,New Starter\nNEW001,Again\n')
+    result = app.test_cli_runner().invoke(args=['import-employees', str(path)])
+    assert result.exit_code != 0
+    assert 'NEW001 already appears on line 2.' in result.output
+    assert 'NEW001' not in employees(app)
+
+    path.write_text('Name\nNew Starter\n')
+    result = app.test_cli_runner().invoke(args=['import-employees', str(path)])
+    assert result.exit_code != 0
+    assert 'no EmpID column' in result.output
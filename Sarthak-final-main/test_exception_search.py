@@ -0,0 +1,64 @@
+"""
+Discrepancy search tests: FTS5 ranking and the LIKE fallback.
+
+    python -m pytest -q test_exception_search.py
+"""
+from datetime import date
+import pytest
+from models import db, Employee, ExceptionReport
+import exception_search
+
+
+@pytest.fixture
+def reports(app):
+    """Three of this month's discrepancies mentioning "zephyr" in different columns, newest first."""
+    today = date.today()
+    with app.app_context():
+        first, second = db.session.execute(db.select(Employee.id).order_by(Employee.id).limit(2)).scalars()
+        rows = {
+            'notes': ExceptionReport(employee_id=first, date=today.replace(day=3), issue='Late arrival',
+                                     notes='zephyr gate'),
+            'issue': ExceptionReport(employee_id=first, date=today.replace(day=2), issue='Zephyr badge',
+                                     notes='gate'),
+            'other': ExceptionReport(employee_id=second, date=today.replace(day=1), issue='Zephyrs',
+                                     notes='badge gate'),
+        }
+        db.session.add_all(rows.values())
+        db.session.commit()
+        return {key: (row.id, row.employee_id) for key, row in rows.items()}
+
+
+def search(client, **args):
+    response = client.get('/api/exceptions', query_string=args)
+    assert response.status_code == 200
+    return [row['id'] for row in response.get_json()['exceptions']]
+
+
+def test_issue_matches_rank_above_notes_matches(reports, admin_client):
+    # Newest first by date would put the notes match on top
+    ids = search(admin_client, q='zephyr')
+    assert sorted(ids[:2]) == sorted([reports['issue'][0], reports['other'][0]])
+    assert ids[2:] == [reports['notes'][0]]
+
+
+def test_search_narrows_by_prefix_and_employee(reports, admin_client):
+    assert sorted(search(admin_client, q='zeph gat')) == sorted(id for id, _ in reports.values())
+    assert sorted(search(admin_client, q='zephyr badge')) == sorted([reports['issue'][0], reports['other'][0]])
+    employee = reports['other'][1]
+    assert search(admin_client, q='zephyr', employee=employee) == [reports['other'][0]]
+
+
+def test_search_picks_up_edits(app, reports, admin_client):
+    with app.app_context():
+        db.session.get(ExceptionReport, reports['issue'][0]).notes = 'quokka'
+        db.session.commit()
+    assert search(admin_client, q='quokka') == [reports['issue'][0]]
+    assert reports['issue'][0] in search(admin_client, q='zephyr')
+
+
+def test_like_fallback_matches_the_same_rows(reports, admin_client, monkeypatch):
+    monkeypatch.setattr(exception_search, 'search_available', lambda: False)
+    # No ranking: the usual newest-first order
+    assert search(admin_client, q='zephyr') == [reports['notes'][0], reports['issue'][0], reports['other'][0]]
+    assert search(admin_client, q='zephyr badge') == [reports['issue'][0], reports['other'][0]]
+    assert search(admin_client, q='zephyr', employee=reports['other'][1]) == [reports['other'][0]]
@@ -0,0 +1,46 @@
+"""
+Discrepancy list tests: bulk updates.
+
+    python -m pytest -q test_exceptions.py
+"""
+from datetime import date
+import pytest
+from models import db, ExceptionReport
+import app as attendance_app
+
+
+@pytest.fixture
+def flagged(app):
+    """The app with this month's discrepancies flagged."""
+    today = date.today()
+    with app.app_context():
+        attendance_app.process_attendance_and_exceptions(today.year, today.month)
+    return app
+
+
+def statuses(app):
+    with app.app_context():
+        return dict(db.session.execute(db.select(ExceptionReport.id, ExceptionReport.status)).all())
+
+
+@pytest.mark.parametrize('body', [
+    {'action': 'resolve', 'ids': '12'},
+    {'action': 'resolve', 'ids': [1, '2']},
+    {'action': 'resolve', 'ids': [True]},
+    {'action': 'resolve', 'ids': {'1': 1}},
+    [{'action': 'resolve', 'ids': [1]}],
+])
+def test_bulk_update_rejects_ids_that_are_not_a_list_of_integers(flagged, admin_client, body):
+    before = statuses(flagged)
+    response = admin_client.post('/exceptions/bulk_update', json=body)
+    assert response.status_code == 400
+    assert statuses(flagged) == before
+
+
+def test_bulk_update_by_ids(flagged, admin_client):
+    pending = sorted(id for id, status in statuses(flagged).items() if status == 'pending')[:3]
+    assert len(pending) == 3
+    response = admin_client.post('/exceptions/bulk_update', json={'action': 'resolve', 'ids': pending})
+    assert response.get_json() == {'updated': 3, 'status': 'resolved'}
+    after = statuses(flagged)
+    assert [id for id, status in after.items() if status == 'resolved'] == pending
@@ -0,0 +1,35 @@
+"""
+Month-end bundle tests: admin-only download, and one renderer pool per process.
+
+    python -m pytest -q test_month_bundle.py
+"""
+import io
+import zipfile
+from datetime import date
+import month_bundle
+import app as attendance_app
+
+
+def test_bundle_download_needs_an_admin(app, admin_client):
+    today = date.today()
+    url = f'/export_month_bundle?year={today.year}&month={today.month}'
+    assert '/admin/login' in app.test_client().get(url).headers['Location']
+    response = admin_client.get(url)
+    assert response.status_code == 200
+    names = zipfile.ZipFile(io.BytesIO(response.data)).namelist()
+    assert 'timings.json' in names
+    assert sum(name.endswith('.pdf') for name in names) == 4 and sum(name.endswith('.xlsx') for name in names) == 1
+
+
+def test_parallel_bundle_reuses_its_pool(app):
+    today = date.today()
+    with app.app_context():
+        def load():
+            return attendance_app.month_bundle_documents(today.year, today.month)
+        serial = month_bundle.build_bundle(load, workers=1)
+        first = month_bundle.build_bundle(load, workers=2)
+        pool = month_bundle._pools[2]
+        second = month_bundle.build_bundle(load, workers=2)
+    assert month_bundle._pools[2] is pool
+    assert first['workers'] == second['workers'] == 2
+    assert sorted(second['pdfs']) == sorted(serial['pdfs'])
@@ -0,0 +1,111 @@
+"""
+Closed month tests: the edit lock and the stored figures.
+
+    python -m pytest -q test_month_close.py
+"""
+import io
+from datetime import date, timedelta
+import pytest
+from models import db, Attendance, ExceptionReport
+from month_close import month_label, month_artifact, MonthClosed
+import app as attendance_app
+
+
+def last_month():
+    day = date.today().replace(day=1) - timedelta(days=1)
+    return day.year, day.month
+
+
+def hours(app, year, month):
+    """(worked, overtime) minutes summed over a month's attendance."""
+    first_day = date(year, month, 1)
+    last_day = (first_day + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    with app.app_context():
+        return tuple(db.session.execute(
+            db.select(db.func.sum(Attendance.worked_minutes), db.func.sum(Attendance.overtime_minutes))
+            .where(Attendance.date.between(first_day, last_day))).one())
+
+
+def close(client, year, month):
+    response = client.post('/admin/month/close', data={'year': year, 'month': month})
+    assert response.status_code == 302
+
+
+def test_shift_change_leaves_closed_month_hours(app, admin_client):
+    year, month = last_month()
+    today = date.today()
+    close(admin_client, year, month)
+    closed_before, open_before = hours(app, year, month), hours(app, today.year, today.month)
+
+    result = app.test_cli_runner().invoke(args=['set-shift', 'G', '--end', '20:00'])
+    assert result.exit_code == 0, result.output
+    assert f'Closed months left as stored: {month_label(year, month)}' in result.output
+    assert hours(app, year, month) == closed_before
+    assert hours(app, today.year, today.month) != open_before
+
+
+def attendance_count(app):
+    with app.app_context():
+        return db.session.execute(db.select(db.func.count(Attendance.id))).scalar()
+
+
+def test_closed_month_refuses_changes_until_reopened(app, admin_client):
+    year, month = last_month()
+    with app.app_context():
+        attendance_app.process_attendance_and_exceptions(year, month)
+        emp = attendance_app.reference_cache.employees()[0]
+        emp_id, emp_code = emp.id, emp.emp_id
+        exception_id = db.session.execute(db.select(ExceptionReport.id).where(
+            ExceptionReport.date >= date(year, month, 1), ExceptionReport.status == 'pending')).scalars().first()
+    assert exception_id is not None
+    close(admin_client, year, month)
+    closed_day, open_day = date(year, month, 15), date.today()
+    before = attendance_count(app)
+
+    client = app.test_client()
+    client.post('/attendance_entry', data={'employee_id': emp_id, 'date': closed_day.isoformat(), 'status': 'P'})
+    assert attendance_count(app) == before
+    # One row in a closed month keeps the whole file out
+    csv = f'EmpID,Date,Status,TimeIn,TimeOut\n{emp_code},{open_day},P,,\n{emp_code},{closed_day},P,,\n'
+    response = client.post('/attendance_upload', data={'file': (io.BytesIO(csv.encode()), 'attendance.csv')})
+    assert b'Nothing was uploaded' in response.data
+    assert attendance_count(app) == before
+    admin_client.post(f'/exception/{exception_id}/update', data={'action': 'resolve'})
+    with app.app_context():
+        assert db.session.get(ExceptionReport, exception_id).status == 'pending'
+        with pytest.raises(MonthClosed):
+            attendance_app.generate_monthly_rota(year, month)
+
+    response = admin_client.post('/admin/month/reopen', data={'year': year, 'month': month})
+    assert response.status_code == 302
+    client.post('/attendance_entry', data={'employee_id': emp_id, 'date': closed_day.isoformat(), 'status': 'P'})
+    assert attendance_count(app) == before + 1
+
+
+def test_closed_month_exports_come_from_the_snapshot(app, admin_client):
+    year, month = last_month()
+    close(admin_client, year, month)
+    with app.app_context():
+        stored = month_artifact(year, month, 'hours_excel').content
+        db.session.execute(db.update(Attendance).where(Attendance.date.between(date(year, month, 1), date(year, month, 28)))
+                           .values(worked_minutes=0, overtime_minutes=0))
+        db.session.commit()
+    response = admin_client.get(f'/export_hours_excel?year={year}&month={month}')
+    assert response.status_code == 200
+    assert response.data == stored
+
+    admin_client.post('/admin/month/reopen', data={'year': year, 'month': month})
+    with app.app_context():
+        assert month_artifact(year, month, 'hours_excel') is None
+
+
+def test_only_ended_open_months_close(app, admin_client):
+    year, month = last_month()
+    today = date.today()
+    with app.app_context():
+        with pytest.raises(ValueError):
+            attendance_app.close_month(today.year, today.month, attendance_app.MONTH_ARTIFACTS)
+        attendance_app.close_month(year, month, attendance_app.MONTH_ARTIFACTS)
+        db.session.commit()
+        with pytest.raises(MonthClosed):
+            attendance_app.close_month(year, month, attendance_app.MONTH_ARTIFACTS)
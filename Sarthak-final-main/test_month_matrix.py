@@ -0,0 +1,30 @@
+"""
+MonthMatrix tests: duplicate attendance rows for one day.
+
+    python -m pytest -q test_month_matrix.py
+"""
+from datetime import date
+from models import db, Attendance
+from month_matrix import MonthMatrix, STATUS_CODES
+from reference_cache import reference_cache
+
+
+def test_latest_attendance_row_fills_the_cell_and_every_row_counts(app):
+    today = date.today()
+    day = today.replace(day=1)
+    with app.app_context():
+        emp = reference_cache.employees()[0]
+        db.session.execute(db.delete(Attendance).where(Attendance.employee_id == emp.id, Attendance.date == day))
+        # Inserted newest first, so neither insertion nor table order matches id order
+        newest = db.session.execute(db.select(db.func.max(Attendance.id))).scalar() + 100
+        db.session.add(Attendance(id=newest, employee_id=emp.id, date=day, status='L'))
+        db.session.add(Attendance(id=newest - 50, employee_id=emp.id, date=day, status='A'))
+        db.session.commit()
+
+        matrix = MonthMatrix.load(today.year, today.month)
+        row, col = matrix.employee_index[emp.id], matrix.date_index[day]
+        assert STATUS_CODES[matrix.status[row, col]] == 'L'
+        counts = matrix.status_counts[row]
+        assert counts[STATUS_CODES.index('L')] >= 1 and counts[STATUS_CODES.index('A')] >= 1
+        summary = next(s for s in matrix.summary() if s['name'] == emp.name)
+        assert sum(summary[code] for code in STATUS_CODES) == int(counts[:len(STATUS_CODES)].sum())
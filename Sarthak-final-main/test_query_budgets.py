@@ -0,0 +1,171 @@
+"""
+Query-count tests for the main routes and batch jobs.
+
+Seeds a database per scale and runs every check against each. A check fails
+if its SQL statement count differs from the smallest scale (an N+1 loop) or
+exceeds the @query_budget declared on the view.
+
+    python -m pytest -q test_query_budgets.py
+"""
+import io
+import os
+from datetime import date, datetime, timedelta
+import pytest
+from models import db, ExceptionReport
+from reference_cache import reference_cache
+from instrumentation import query_stats
+from synthetic_data import generate, attendance_csv
+from cache import clear_fragment_caches
+import app as attendance_app
+
+# Employees per dataset; every scale is compared with the first
+SCALES = (10, 40)
+
+
+def checks(today, next_month):
+    """(name, method, url or callable, form data) in the order they run; mutating checks go last."""
+    def upload_form():
+        employees = reference_cache.employees(active_only=True)
+        return {'file': (io.BytesIO(attendance_csv(next_month, employees).encode()), 'attendance.csv')}
+
+    def first_exception():
+        return db.session.execute(db.select(db.func.min(ExceptionReport.id))).scalar()
+
+    # generate_monthly_rota puts everyone on the general shift here, so the entry is always late
+    first_weekday = next_month + timedelta(days={5: 2, 6: 1}.get(next_month.weekday(), 0))
+
+    def last_employee():
+        return reference_cache.employees()[-1].id
+
+    # Closed by the admin_month_close check, then served from its snapshot
+    last_month = today.replace(day=1) - timedelta(days=1)
+    closed = f'year={last_month.year}&month={last_month.month}'
+
+    def import_form():
+        first = reference_cache.employees()[0]
+        rows = f'EmpID,Name,Grade,Status\n{first.emp_id},{first.name},G9,inactive\nCHECK002,Import Check,G1,active\n'
+        return {'file': (io.BytesIO(rows.encode()), 'employees.csv')}
+
+    return [
+        ('process_attendance_and_exceptions', 'CALL',
+         lambda: attendance_app.process_attendance_and_exceptions(today.year, today.month), None),
+        ('generate_monthly_rota', 'CALL',
+         lambda: attendance_app.generate_monthly_rota(next_month.year, next_month.month), None),
+        ('index', 'GET', '/', None),
+        ('employee_page', 'GET', '/employee', None),
+        ('attendance_page', 'GET', '/attendance', None),
+        ('reports_page', 'GET', '/reports', None),
+        ('view_rota', 'GET', '/rota', None),
+        ('rota_matrix_api', 'GET', '/api/rota/matrix', None),
+        ('rota_feed', 'GET', lambda: f'/rota/{reference_cache.employees()[0].emp_id}.ics', None),
+        ('view_exceptions', 'GET', '/exceptions', None),
+        ('search_exceptions', 'GET', '/exceptions?q=late&status=pending', None),
+        ('exceptions_api', 'GET', '/api/exceptions?q=late&issue=Late', None),
+        ('changes_api', 'GET', '/api/changes?since=0&limit=100', None),
+        ('changes_head_api', 'GET', '/api/changes/head', None),
+        ('exception_details', 'GET', lambda: f'/exception/{first_exception()}/details', None),
+        ('exception_form', 'GET', lambda: f'/exception/{first_exception()}/form', None),
+        ('view_exceptions_page', 'GET', '/exceptions?page=2', None),
+        ('admin_employees', 'GET', '/admin/employees', None),
+        ('admin_employee_import_form', 'GET', '/admin/employees/import', None),
+        ('admin_employee_edit', 'GET', lambda: f'/admin/employee/edit/{last_employee()}', None),
+        ('attendance_entry', 'GET', '/attendance_entry', None),
+        ('employee_search_api', 'GET', '/api/employees/search?q=a&active=1', None),
+        ('health', 'GET', '/health', None),
+        ('rollup_report', 'GET', '/reports/rollup', None),
+        ('rollup_api', 'GET', '/api/rollup?grain=week&by=department,shift_code', None),
+        ('coverage_page', 'GET', '/coverage', None),
+        ('coverage_api', 'GET', f'/api/coverage?from={date.today().year}-01-01&to={date.today().year}-12-31', None),
+    ] + [
+        (endpoint, 'GET', f'/{endpoint}', None) for endpoint in (
+            'export_exceptions_excel', 'export_exceptions_pdf', 'export_reports_excel', 'export_reports_pdf',
+            'export_attendance_excel', 'export_attendance_pdf', 'export_employees_excel', 'export_employees_pdf',
+            'export_rota_excel', 'export_rota_pdf', 'export_hours_excel', 'export_rollup_excel',
+            'export_coverage_excel', 'export_month_bundle')
+    ] + [
+        ('attendance_upload', 'POST', '/attendance_upload', upload_form),
+        ('attendance_entry_post', 'POST', '/attendance_entry',
+         lambda: {'employee_id': last_employee(), 'date': first_weekday.isoformat(), 'status': 'P',
+                  'time_in': '10:30', 'time_out': '18:00'}),
+        ('update_exception', 'POST', lambda: f'/exception/{first_exception()}/update',
+         lambda: {'action': 'resolve', 'notes': 'checked'}),
+        ('bulk_update_filter', 'POST', '/exceptions/bulk_update',
+         lambda: {'action': 'process', 'scope': 'filter', 'issue': 'Late', 'status': 'pending'}),
+        ('bulk_update_selected', 'POST', '/exceptions/bulk_update',
+         lambda: {'action': 'reopen', 'notes': 'checked', 'ids': [first_exception()]}),
+        ('refresh_rollups_page', 'POST', '/rollups/refresh', lambda: {'page': 'coverage_page'}),
+        ('process_exceptions', 'GET', '/process_exceptions', None),
+        ('generate_rota', 'GET', '/generate_rota', None),
+        ('admin_employee_add', 'POST', '/admin/employee/add',
+         lambda: {'emp_id': 'CHECK001', 'name': 'Query Check', 'status': 'active'}),
+        ('admin_employee_import', 'POST', '/admin/employees/import', import_form),
+        ('admin_employee_delete', 'POST', lambda: f'/admin/employee/delete/{last_employee()}', None),
+        ('admin_month_close', 'POST', '/admin/month/close',
+         lambda: {'year': last_month.year, 'month': last_month.month}),
+        ('reports_page_closed', 'GET', f'/reports?{closed}', None),
+        ('view_rota_closed', 'GET', f'/rota?{closed}', None),
+        ('rota_matrix_api_closed', 'GET', f'/api/rota/matrix?{closed}', None),
+        ('export_reports_excel_closed', 'GET', f'/export_reports_excel?{closed}', None),
+        ('export_attendance_excel_closed', 'GET', f'/export_attendance_excel?{closed}', None),
+        ('admin_month_reopen', 'POST', '/admin/month/reopen',
+         lambda: {'year': last_month.year, 'month': last_month.month}),
+    ]
+
+
+def run(employees, workdir):
+    app = attendance_app.create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.join(workdir, f"queries_{employees}.db")}',
+        'TESTING': True,
+        'ENFORCE_QUERY_BUDGETS': True,
+    })
+    clear_fragment_caches()
+    today = date.today()
+    next_month = (today.replace(day=28) + timedelta(days=4)).replace(day=1)
+    with app.app_context():
+        generate(employees=employees, months=1, reset=True)
+        attendance_app.process_attendance_and_exceptions(today.year, today.month)
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['admin'] = True
+        sess['login_time'] = datetime.now().isoformat()
+
+    counts, errors = {}, {}
+    for name, method, target, data in checks(today, next_month):
+        try:
+            with app.app_context():
+                if method == 'CALL':
+                    target()
+                    counts[name] = query_stats().count
+                    continue
+                url = target() if callable(target) else target
+                form = data() if data else None
+            response = client.open(url, method=method, data=form)
+            if response.status_code >= 400:
+                raise AssertionError(f'HTTP {response.status_code}')
+            timing = response.headers['Server-Timing']
+            counts[name] = int(timing.rsplit('desc="', 1)[1].split(' ')[0])
+        except Exception as e:
+            errors[name] = f'{type(e).__name__}: {e}'
+    return counts, errors
+
+
+@pytest.fixture(scope='module')
+def measure(tmp_path_factory):
+    workdir = tmp_path_factory.mktemp('query_budgets')
+    results = {}
+
+    def measure(employees):
+        if employees not in results:
+            results[employees] = run(employees, str(workdir))
+        return results[employees]
+    return measure
+
+
+@pytest.mark.parametrize('employees', SCALES)
+def test_query_counts(measure, employees):
+    counts, errors = measure(employees)
+    assert not errors
+    baseline, _ = measure(SCALES[0])
+    grown = {name: (baseline.get(name), count) for name, count in counts.items() if baseline.get(name) != count}
+    assert not grown, f'query count grows with data ({SCALES[0]} vs {employees} employees): {grown}'
@@ -0,0 +1,40 @@
+"""
+Rollup tests: reads never rebuild, and only admins refresh on demand.
+
+    python -m pytest -q test_rollups.py
+"""
+from datetime import date, timedelta
+from rollups import pending_dates
+import app as attendance_app
+
+
+def queue_next_month(app):
+    next_month = (date.today().replace(day=28) + timedelta(days=4)).replace(day=1)
+    with app.app_context():
+        attendance_app.generate_monthly_rota(next_month.year, next_month.month)
+        return pending_dates()
+
+
+def queued(app):
+    with app.app_context():
+        return pending_dates()
+
+
+def test_reads_leave_the_queue_alone(app):
+    pending = queue_next_month(app)
+    assert pending
+    client = app.test_client()
+    for url in ('/reports/rollup', '/api/rollup', '/coverage', '/api/coverage', '/export_coverage_excel'):
+        assert client.get(url).status_code == 200
+    assert queued(app) == pending
+
+
+def test_refresh_needs_an_admin(app, admin_client):
+    pending = queue_next_month(app)
+    response = app.test_client().post('/rollups/refresh', data={'page': 'coverage_page'})
+    assert response.status_code == 302 and '/admin/login' in response.headers['Location']
+    assert queued(app) == pending
+
+    response = admin_client.post('/rollups/refresh', data={'page': 'coverage_page', 'month': '1'})
+    assert response.headers['Location'].endswith('/coverage?month=1')
+    assert queued(app) == 0
@@ -0,0 +1,105 @@
+"""
+Worked minutes and overtime stored on Attendance.
+
+Both are computed when attendance is written (and recomputed by
+``flask backfill-hours`` or when a month's rota is regenerated), so exports
+and the hours report read plain integer columns and sum them in SQL.
+Overtime is measured against the scheduled length of the shift rostered
+that day; days without a timed shift (Off, Leave, not rostered) have none.
+"""
+from models import db, Employee, ShiftRota, Attendance
+from month_matrix import minutes_after_midnight
+from reference_cache import reference_cache
+from exception_rules import rows_for_cells, DAY_MINUTES
+from rollups import mark_dates
+from month_close import exclude_closed
+
+
+def worked_minutes(time_in, time_out):
+    """Minutes from time_in to time_out, past midnight if time_out is earlier; None without both."""
+    if time_in is None or time_out is None:
+        return None
+    return (minutes_after_midnight(time_out) - minutes_after_midnight(time_in)) % DAY_MINUTES
+
+
+def scheduled_minutes(shift):
+    """Length of a shift type in minutes, or None if it has no start/end time."""
+    if shift is None or shift.start_time is None or shift.end_time is None:
+        return None
+    return (minutes_after_midnight(shift.end_time) - minutes_after_midnight(shift.start_time)) % DAY_MINUTES or DAY_MINUTES
+
+
+def overtime_minutes(worked, scheduled):
+    if worked is None or scheduled is None:
+        return None
+    return max(0, worked - scheduled)
+
+
+def format_minutes(minutes):
+    """HH:MM for a number of minutes, 'N/A' for None."""
+    if minutes is None:
+        return 'N/A'
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
+
+
+def fill_hours(rows):
+    """
+    Set worked_minutes and overtime_minutes on attendance ``rows`` (dicts
+    with employee_id, date, time_in and time_out) in place. The rostered
+    shifts are looked up in one query.
+    """
+    cells = {(row['employee_id'], row['date']) for row in rows if row['time_in'] and row['time_out']}
+    lengths = {}
+    if cells:
+        for employee_id, day, shift_type_id in rows_for_cells((ShiftRota.shift_type_id,), ShiftRota, cells):
+            lengths[(employee_id, day)] = scheduled_minutes(reference_cache.shift_type(shift_type_id))
+    for row in rows:
+        worked = worked_minutes(row['time_in'], row['time_out'])
+        row['worked_minutes'] = worked
+        row['overtime_minutes'] = overtime_minutes(worked, lengths.get((row['employee_id'], row['date'])))
+    return rows
+
+
+def backfill_hours(first_day=None, last_day=None):
+    """
+    Recompute the stored hours of every attendance record (optionally only
+    between ``first_day`` and ``last_day``) and update the ones that changed,
+    queueing their dates for the rollups. Closed months are left as they
+    were stored. Does not commit. Returns the number of records updated.
+    """
+    query = (
+        db.select(Attendance.id, Attendance.date, Attendance.time_in, Attendance.time_out,
+                  Attendance.worked_minutes, Attendance.overtime_minutes, ShiftRota.shift_type_id)
+        .outerjoin(ShiftRota, db.and_(ShiftRota.employee_id == Attendance.employee_id,
+                                      ShiftRota.date == Attendance.date))
+        .where(*exclude_closed(Attendance.date, first_day, last_day))
+    )
+    if first_day is not None:
+        query = query.where(Attendance.date >= first_day)
+    if last_day is not None:
+        query = query.where(Attendance.date <= last_day)
+    changed, dates = [], set()
+    for att_id, day, time_in, time_out, stored_worked, stored_overtime, shift_type_id in db.session.execute(query):
+        worked = worked_minutes(time_in, time_out)
+        overtime = overtime_minutes(worked, scheduled_minutes(reference_cache.shift_type(shift_type_id)))
+        if (worked, overtime) != (stored_worked, stored_overtime):
+            changed.append({'id': att_id, 'worked_minutes': worked, 'overtime_minutes': overtime})
+            dates.add(day)
+    if changed:
+        db.session.execute(db.update(Attendance), changed)
+        mark_dates(dates)
+    return len(changed)
+
+
+def hours_by_employee(first_day, last_day):
+    """Days worked, worked minutes and overtime minutes per employee, summed in SQL."""
+    return db.session.execute(
+        db.select(Employee.id, Employee.emp_id, Employee.name, Employee.department,
+                  db.func.count(Attendance.worked_minutes).label('days'),
+                  db.func.coalesce(db.func.sum(Attendance.worked_minutes), 0).label('worked_minutes'),
+                  db.func.coalesce(db.func.sum(Attendance.overtime_minutes), 0).label('overtime_minutes'))
+        .join(Attendance, Attendance.employee_id == Employee.id)
+        .where(Attendance.date >= first_day, Attendance.date <= last_day)
+        .group_by(Employee.id)
+        .order_by(Employee.name)
+    ).all()